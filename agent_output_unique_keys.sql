@@ -0,0 +1,148 @@
+-- ============================================================================
+-- UNIQUE KEYS FOR AGENT OUTPUT UPSERTS
+-- Run this in Supabase SQL Editor to make AGENT_OUTPUT_WRITE_MODE=upsert (the
+-- default) take effect. Until an index exists, the backend writes that table
+-- with plain inserts, so results are appended rather than replaced.
+--
+-- Each index matches AGENT_OUTPUT_UPSERT_KEYS in backend/autogen_runtime.py.
+-- Existing duplicates are removed first, keeping the most recent row.
+-- ============================================================================
+
+-- ============================================================================
+-- 1. BUDGETS
+-- ============================================================================
+DELETE FROM budgets a USING budgets b
+WHERE a.user_id = b.user_id
+  AND a.budget_type = b.budget_type
+  AND a.valid_from = b.valid_from
+  AND (a.created_at, a.ctid) < (b.created_at, b.ctid);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_budgets_natural_key ON budgets(user_id, budget_type, valid_from);
+
+-- ============================================================================
+-- 2. INCOME_PATTERNS
+-- ============================================================================
+DELETE FROM income_patterns a USING income_patterns b
+WHERE a.user_id = b.user_id
+  AND a.pattern_type = b.pattern_type
+  AND (a.created_at, a.ctid) < (b.created_at, b.ctid);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_income_patterns_natural_key ON income_patterns(user_id, pattern_type);
+
+-- ============================================================================
+-- 3. INCOME_FORECASTS
+-- ============================================================================
+DELETE FROM income_forecasts a USING income_forecasts b
+WHERE a.user_id = b.user_id
+  AND a.forecast_period_days = b.forecast_period_days
+  AND (a.created_at, a.ctid) < (b.created_at, b.ctid);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_income_forecasts_natural_key ON income_forecasts(user_id, forecast_period_days);
+
+-- ============================================================================
+-- 4. RISK_ASSESSMENTS
+-- ============================================================================
+DELETE FROM risk_assessments a USING risk_assessments b
+WHERE a.user_id = b.user_id
+  AND (a.created_at, a.ctid) < (b.created_at, b.ctid);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_risk_assessments_natural_key ON risk_assessments(user_id);
+
+-- ============================================================================
+-- 5. TAX_RECORDS
+-- ============================================================================
+DELETE FROM tax_records a USING tax_records b
+WHERE a.user_id = b.user_id
+  AND a.financial_year = b.financial_year
+  AND (a.created_at, a.ctid) < (b.created_at, b.ctid);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_tax_records_natural_key ON tax_records(user_id, financial_year);
+
+-- ============================================================================
+-- 6. FINANCIAL_HEALTH
+-- ============================================================================
+DELETE FROM financial_health a USING financial_health b
+WHERE a.user_id = b.user_id
+  AND (a.created_at, a.ctid) < (b.created_at, b.ctid);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_financial_health_natural_key ON financial_health(user_id);
+
+-- ============================================================================
+-- 7. RECOMMENDATIONS
+-- ============================================================================
+DELETE FROM recommendations a USING recommendations b
+WHERE a.user_id = b.user_id
+  AND a.recommendation_type = b.recommendation_type
+  AND a.title = b.title
+  AND (a.created_at, a.ctid) < (b.created_at, b.ctid);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_recommendations_natural_key ON recommendations(user_id, recommendation_type, title);
+
+-- ============================================================================
+-- 8. EXECUTED_ACTIONS
+-- ============================================================================
+DELETE FROM executed_actions a USING executed_actions b
+WHERE a.user_id = b.user_id
+  AND a.action_type = b.action_type
+  AND a.action_description = b.action_description
+  AND (a.created_at, a.ctid) < (b.created_at, b.ctid);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_executed_actions_natural_key ON executed_actions(user_id, action_type, action_description);
+
+-- ============================================================================
+-- 9. SAVINGS_GOALS
+-- ============================================================================
+DELETE FROM savings_goals a USING savings_goals b
+WHERE a.user_id = b.user_id
+  AND a.goal_type = b.goal_type
+  AND a.goal_name = b.goal_name
+  AND (a.created_at, a.ctid) < (b.created_at, b.ctid);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_savings_goals_natural_key ON savings_goals(user_id, goal_type, goal_name);
+
+-- ============================================================================
+-- 10. INVESTMENT_RECOMMENDATIONS
+-- ============================================================================
+DELETE FROM investment_recommendations a USING investment_recommendations b
+WHERE a.user_id = b.user_id
+  AND a.investment_type = b.investment_type
+  AND a.provider = b.provider
+  AND (a.created_at, a.ctid) < (b.created_at, b.ctid);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_investment_recommendations_natural_key ON investment_recommendations(user_id, investment_type, provider);
+
+-- ============================================================================
+-- 11. BILLS
+-- ============================================================================
+DELETE FROM bills a USING bills b
+WHERE a.user_id = b.user_id
+  AND a.bill_name = b.bill_name
+  AND (a.created_at, a.ctid) < (b.created_at, b.ctid);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_bills_natural_key ON bills(user_id, bill_name);
+
+-- ============================================================================
+-- 12. FINANCIAL_GOALS
+-- ============================================================================
+DELETE FROM financial_goals a USING financial_goals b
+WHERE a.user_id = b.user_id
+  AND a.goal_name = b.goal_name
+  AND (a.created_at, a.ctid) < (b.created_at, b.ctid);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_financial_goals_natural_key ON financial_goals(user_id, goal_name);
+
+-- ============================================================================
+-- 13. CONTEXT_EVENTS
+-- ============================================================================
+DELETE FROM context_events a USING context_events b
+WHERE a.user_id = b.user_id
+  AND a.event_name = b.event_name
+  AND a.event_date = b.event_date
+  AND (a.created_at, a.ctid) < (b.created_at, b.ctid);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_context_events_natural_key ON context_events(user_id, event_name, event_date);
+
+-- ============================================================================
+-- SUCCESS MESSAGE
+-- ============================================================================
+SELECT 'Agent output unique keys created successfully!' as status;
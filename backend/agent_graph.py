@@ -0,0 +1,157 @@
+"""
+Agent Dependency Graph
+Declares which agents consume which other agents' output and runs them
+as soon as their inputs are ready
+
+Most agents compute from the user's input tables (served by the per-run
+snapshot) and start immediately. An edge exists only where an agent reads
+another agent's output table: risk summarises transaction_anomalies, the
+action planner reads recommendations and budgets, and the goals planner
+reads income_patterns and recommendations when it proposes goals.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from llm_retry import retry_budget
+from user_snapshot import UserSnapshot
+
+
+# Agent key -> agent keys whose results it reads from the database
+AGENT_DEPENDENCIES: Dict[str, List[str]] = {
+    "pattern": [],
+    "context": [],
+    "volatility": [],
+    "budget": [],
+    "knowledge": [],
+    "tax": [],
+    "recommendation": [],
+    "savings": [],
+    "bills": [],
+    "financial": [],
+    "anomaly": [],
+    "risk": ["anomaly"],
+    "action": ["recommendation", "budget"],
+    "goals": ["pattern", "recommendation"],
+}
+
+
+def resolve_dependencies(agent_keys: List[str], dependencies: Optional[Dict[str, List[str]]] = None) -> Dict[str, List[str]]:
+    """
+    Restrict the dependency graph to the given agents and validate it
+
+    Dependencies on agents that are not part of the run are dropped, so a
+    caller with a subset of agents (e.g. the scheduler) still gets a valid
+    graph.
+
+    Args:
+        agent_keys: Agents taking part in this run
+        dependencies: Full dependency graph (defaults to AGENT_DEPENDENCIES)
+
+    Returns:
+        Dependency graph containing only agent_keys
+
+    Raises:
+        ValueError: If the graph contains a cycle
+    """
+    dependencies = AGENT_DEPENDENCIES if dependencies is None else dependencies
+    present = set(agent_keys)
+    graph = {
+        key: [dep for dep in dependencies.get(key, []) if dep in present]
+        for key in agent_keys
+    }
+
+    # Depth-first walk; revisiting a node that is still on the stack means a cycle
+    visiting, visited = set(), set()
+
+    def visit(key: str) -> None:
+        if key in visited:
+            return
+        if key in visiting:
+            raise ValueError(f"Agent dependency cycle detected at '{key}'")
+        visiting.add(key)
+        for dep in graph[key]:
+            visit(dep)
+        visiting.discard(key)
+        visited.add(key)
+
+    for key in graph:
+        visit(key)
+
+    return graph
+
+
+async def run_agent_graph(
+    agents: Dict[str, Any],
+    user_id: str,
+    dependencies: Optional[Dict[str, List[str]]] = None,
+    on_complete: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+    snapshot: Optional[UserSnapshot] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Run every agent's analyze_user as soon as all of its dependencies finish
+
+    A failed dependency does not block its dependents - they still run
+    against whatever is already in the database, matching the behaviour of
+    the old sequential loop. All model calls in the run share one retry
+    budget (llm_retry.retry_budget).
+
+    Args:
+        agents: Agent key -> agent instance exposing analyze_user(user_id, snapshot=None)
+        user_id: UUID of the user to analyze
+        dependencies: Dependency graph (defaults to AGENT_DEPENDENCIES)
+        on_complete: Optional callback invoked with (agent_key, result)
+        snapshot: Optional UserSnapshot shared by every agent, so the user's
+            input tables are read once per run rather than once per agent
+
+    Returns:
+        Agent key -> result dict
+    """
+    graph = resolve_dependencies(list(agents.keys()), dependencies)
+    results: Dict[str, Dict[str, Any]] = {}
+    tasks: Dict[str, "asyncio.Task[None]"] = {}
+
+    async def run_node(key: str) -> None:
+        deps = graph[key]
+        if deps:
+            await asyncio.gather(*(tasks[dep] for dep in deps))
+
+        try:
+            if snapshot is None:
+                result = await agents[key].analyze_user(user_id)
+            else:
+                result = await agents[key].analyze_user(user_id, snapshot=snapshot)
+        except Exception as e:
+            print(f"X {key} agent failed: {str(e)}")
+            result = {
+                "success": False,
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            }
+
+        results[key] = result
+        if on_complete:
+            on_complete(key, result)
+
+    # Tasks only start running once we yield, so every dependent can look up
+    # its inputs by key. They inherit the run's retry budget from the context.
+    with retry_budget():
+        for key in graph:
+            tasks[key] = asyncio.ensure_future(run_node(key))
+    await asyncio.gather(*tasks.values())
+
+    return results
+
+
+def critical_path_length(agent_keys: List[str], dependencies: Optional[Dict[str, List[str]]] = None) -> int:
+    """Number of agents on the longest dependency chain"""
+    graph = resolve_dependencies(agent_keys, dependencies)
+    depth: Dict[str, int] = {}
+
+    def visit(key: str) -> int:
+        if key not in depth:
+            depth[key] = 1 + max((visit(dep) for dep in graph[key]), default=0)
+        return depth[key]
+
+    return max((visit(key) for key in graph), default=0)
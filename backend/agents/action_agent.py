@@ -9,10 +9,12 @@ import json
 from datetime import datetime
 import os
 import sys
+from typing import Optional
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 from autogen_runtime import run_autogen_mcp_task
+from user_snapshot import UserSnapshot
 
 
 class ActionExecutionAgent:
@@ -161,12 +163,13 @@ action_outcomes table:
 - outcome_notes
 - recorded_at"""
 
-    async def analyze_user(self, user_id: str) -> dict:
+    async def analyze_user(self, user_id: str, snapshot: Optional[UserSnapshot] = None) -> dict:
         """
         Create automated actions for a specific user
 
         Args:
             user_id: UUID of the user to analyze
+            snapshot: Unused - actions are built from other agents' output, read by the LLM
 
         Returns:
             dict with analysis results and success status
@@ -202,7 +205,9 @@ Please execute this and report what actions you scheduled."""
                 system_prompt=self.system_prompt,
                 task=prompt,
                 user_id=user_id,
-                use_azure=True
+                use_azure=True,
+                # The model reads the user's tables through tools, so the task text says nothing about them
+                use_cache=False
             )
 
             print(f"[Action Agent] Analysis complete for user {user_id}")
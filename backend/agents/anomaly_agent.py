@@ -0,0 +1,275 @@
+"""
+Transaction Anomaly Agent
+Scores new transactions against each user's running per-category statistics
+Scoring is done by the anomaly engine; no LLM is involved
+Writes to: transaction_anomalies, transaction_anomaly_state tables
+"""
+
+import asyncio
+import json
+from datetime import datetime
+import os
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from anomaly_engine import AnomalyDetector, detector_from_rows, state_row
+from autogen_runtime import AGENT_OUTPUT_UPSERT_KEYS
+from postgrest_client import get_postgrest_client
+from user_snapshot import UserSnapshot
+
+# Rows per PostgREST page / array insert
+BATCH_PAGE_SIZE = 1000
+
+# User ids per user_id=in.(...) filter
+USER_FILTER_CHUNK = 100
+
+TRANSACTION_COLUMNS = "transaction_id,user_id,amount,transaction_type,category,transaction_date,created_at"
+STATE_TABLE = "transaction_anomaly_state"
+ANOMALY_TABLE = "transaction_anomalies"
+
+# Incremental sweeps read in creation order; full histories in date order
+NEW_ORDER = "created_at,transaction_id"
+HISTORY_ORDER = "transaction_date,created_at,transaction_id"
+
+_state_lock: Optional[asyncio.Lock] = None
+
+
+def state_lock() -> asyncio.Lock:
+    """
+    Process-wide lock around load -> score -> save of the detector states
+
+    A sweep and a single-user refresh both rewrite a user's state rows, so
+    they take turns instead of the last save dropping the other's updates.
+    """
+    global _state_lock
+    if _state_lock is None:
+        _state_lock = asyncio.Lock()
+    return _state_lock
+
+
+class TransactionAnomalyAgent:
+    """Agent that flags unusual transactions as they arrive"""
+
+    def __init__(self, mcp_servers: str = ".mcp.json"):
+        self.mcp_servers = mcp_servers
+        # Newest created_at read by a sweep; later sweeps only scan past it
+        self.sweep_mark: Optional[str] = None
+
+    def _observe(
+        self,
+        detector: AnomalyDetector,
+        rows: List[Dict[str, Any]],
+        watermarks: Dict[str, str],
+        skip_seen: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """Observe rows (by default only those not yet scored for their user), advancing the user's watermark"""
+        fresh = [
+            r for r in rows
+            if not skip_seen or r["user_id"] not in watermarks
+            or (r.get("created_at") or "") > watermarks[r["user_id"]]
+        ]
+        for r in fresh:
+            if r.get("created_at"):
+                watermarks[r["user_id"]] = max(watermarks.get(r["user_id"], ""), r["created_at"])
+        return detector.observe_many(fresh)
+
+    async def _write(self, anomalies: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Upsert anomalies on transaction_id in array inserts"""
+        client = get_postgrest_client()
+        reports = await asyncio.gather(*(
+            client.bulk_insert(ANOMALY_TABLE, anomalies[i:i + BATCH_PAGE_SIZE],
+                               on_conflict=AGENT_OUTPUT_UPSERT_KEYS[ANOMALY_TABLE])
+            for i in range(0, len(anomalies), BATCH_PAGE_SIZE)
+        ))
+        return {"inserted": sum(r["inserted"] for r in reports), "errors": sum(len(r["errors"]) for r in reports)}
+
+    async def _save_states(self, detector: AnomalyDetector, watermarks: Dict[str, str]) -> Dict[str, Any]:
+        """Upsert the states touched since the last save"""
+        now = datetime.now().isoformat()
+        rows = [
+            {**state_row(key, stats), "last_created_at": watermarks.get(key[0]) or None, "updated_at": now}
+            for key, stats in detector.take_dirty()
+        ]
+        client = get_postgrest_client()
+        reports = await asyncio.gather(*(
+            client.bulk_insert(STATE_TABLE, rows[i:i + BATCH_PAGE_SIZE],
+                               on_conflict=AGENT_OUTPUT_UPSERT_KEYS[STATE_TABLE])
+            for i in range(0, len(rows), BATCH_PAGE_SIZE)
+        ))
+        return {"inserted": sum(r["inserted"] for r in reports), "errors": sum(len(r["errors"]) for r in reports)}
+
+    async def _load(self, user_id: Optional[str] = None) -> tuple:
+        """Saved detector states and per-user watermarks (all users, or one)"""
+        rows = await get_postgrest_client().select_all(
+            STATE_TABLE, filters={"user_id": user_id} if user_id else None,
+            order="user_id,transaction_type,category", page_size=BATCH_PAGE_SIZE,
+        )
+        watermarks: Dict[str, str] = {}
+        for row in rows:
+            if row.get("last_created_at"):
+                watermarks[row["user_id"]] = max(watermarks.get(row["user_id"], ""), row["last_created_at"])
+        return detector_from_rows(rows), watermarks
+
+    async def analyze_user(self, user_id: str, snapshot: Optional[UserSnapshot] = None) -> dict:
+        """
+        Score a user's transactions added since their last scoring
+
+        Args:
+            user_id: UUID of the user to analyze
+            snapshot: Unused - scoring reads transactions by creation watermark, not date window
+
+        Returns:
+            dict with the new anomalies and success status
+        """
+        print(f"[Anomaly Agent] Starting analysis for user {user_id}")
+
+        try:
+            async with state_lock():
+                detector, watermarks = await self._load(user_id)
+                filters = {"user_id": user_id}
+                if user_id in watermarks:
+                    filters["created_at"] = f"gt.{watermarks[user_id]}"
+                transactions = await get_postgrest_client().select_all(
+                    "transactions", filters=filters, columns=TRANSACTION_COLUMNS,
+                    order=NEW_ORDER if user_id in watermarks else HISTORY_ORDER, page_size=BATCH_PAGE_SIZE,
+                )
+                anomalies = self._observe(detector, transactions, watermarks)
+                written, saved = await asyncio.gather(self._write(anomalies), self._save_states(detector, watermarks))
+            print(f"[Anomaly Agent] Scored {len(transactions)} transactions, {len(anomalies)} anomalies")
+
+            return {
+                "success": written["errors"] == 0 and saved["errors"] == 0,
+                "user_id": user_id,
+                "agent": "transaction_anomaly",
+                "result": {"scored": len(transactions), "anomalies": anomalies},
+                "timestamp": datetime.now().isoformat()
+            }
+
+        except Exception as e:
+            print(f"[Anomaly Agent] Error analyzing user {user_id}: {str(e)}")
+            return {
+                "success": False,
+                "user_id": user_id,
+                "agent": "transaction_anomaly",
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            }
+
+    async def process_new(self) -> dict:
+        """
+        Score every transaction created since the last sweep, for all users
+
+        Scans from the sweep's own high-water mark, so users without new
+        transactions don't hold the scan back. The first sweep after a
+        restart falls back to the oldest per-user watermark, and first
+        scores the full history of active users that have no state yet
+        (their older transactions are behind that watermark). Per-user
+        watermarks still skip rows already scored by analyze_user.
+
+        Returns:
+            dict with transaction/anomaly counts, write errors and timing
+        """
+        started = datetime.now()
+        async with state_lock():
+            detector, watermarks = await self._load()
+            since = self.sweep_mark or (min(watermarks.values()) if watermarks else None)
+            scans = []
+            if self.sweep_mark is None and watermarks:
+                users = await get_postgrest_client().select_all(
+                    "users", filters={"is_active": "is.true"}, columns="user_id",
+                    order="user_id", page_size=BATCH_PAGE_SIZE,
+                )
+                unseen = [u["user_id"] for u in users if u["user_id"] not in watermarks]
+                scans += [
+                    ({"user_id": f"in.({','.join(unseen[i:i + USER_FILTER_CHUNK])})"}, HISTORY_ORDER)
+                    for i in range(0, len(unseen), USER_FILTER_CHUNK)
+                ]
+            scans.append(({"created_at": f"gt.{since}"} if since else None, NEW_ORDER))
+            return await self._sweep(detector, watermarks, scans, started, skip_seen=True, mark=since)
+
+    async def backfill(self) -> dict:
+        """
+        Rebuild every state from the full transaction history
+
+        Pages are scored as they arrive (the next page is already being read)
+        and each page's anomalies are written while scoring continues; the
+        states are saved once at the end.
+
+        Returns:
+            dict with transaction/anomaly counts, write errors and timing
+        """
+        started = datetime.now()
+        client = get_postgrest_client()
+        async with state_lock():
+            await asyncio.gather(
+                client.delete(ANOMALY_TABLE, {"transaction_id": "not.is.null"}),
+                client.delete(STATE_TABLE, {"n": "gte.0"}),
+            )
+            return await self._sweep(AnomalyDetector(), {}, [(None, HISTORY_ORDER)], started, skip_seen=False)
+
+    async def _sweep(
+        self,
+        detector: AnomalyDetector,
+        watermarks: Dict[str, str],
+        scans: List[Tuple[Optional[Dict[str, Any]], str]],
+        started: datetime,
+        skip_seen: bool,
+        mark: Optional[str] = None,
+    ) -> dict:
+        """
+        Score each (filters, order) scan in turn
+
+        The sweep mark (at least mark, where the incremental scan starts) only
+        advances once every anomaly and state is saved.
+        """
+        client = get_postgrest_client()
+        scored, found, writes = 0, 0, []
+        mark = mark or ""
+        for filters, order in scans:
+            async for page in client.iter_pages("transactions", filters=filters, columns=TRANSACTION_COLUMNS,
+                                                order=order, page_size=BATCH_PAGE_SIZE):
+                anomalies = self._observe(detector, page, watermarks, skip_seen)
+                mark = max([mark] + [r["created_at"] for r in page if r.get("created_at")])
+                scored += len(page)
+                found += len(anomalies)
+                if anomalies:
+                    writes.append(asyncio.ensure_future(self._write(anomalies)))
+
+        reports = list(await asyncio.gather(*writes)) + [await self._save_states(detector, watermarks)]
+        errors = sum(report["errors"] for report in reports)
+        if errors == 0 and mark:
+            self.sweep_mark = mark
+
+        elapsed = (datetime.now() - started).total_seconds()
+        print(f"[Anomaly Agent] Sweep: scored {scored} transactions ({found} anomalies) in {elapsed:.1f}s")
+
+        return {
+            "success": errors == 0,
+            "agent": "transaction_anomaly",
+            "transactions": scored,
+            "anomalies": found,
+            "errors": errors,
+            "elapsed_seconds": elapsed,
+            "timestamp": datetime.now().isoformat()
+        }
+
+
+async def main():
+    """Test the transaction anomaly agent"""
+    agent = TransactionAnomalyAgent()
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--backfill":
+        result = await agent.backfill()
+    else:
+        test_user_id = "153735c8-b1e3-4fc6-aa4e-7deb6454990b"
+        print(f"Testing Transaction Anomaly Agent with user {test_user_id}")
+        result = await agent.analyze_user(test_user_id)
+
+    print("\nResult:")
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
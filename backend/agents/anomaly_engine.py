@@ -0,0 +1,249 @@
+"""
+Transaction Anomaly Engine
+Streaming per-user, per-category anomaly scoring behind the risk assessment
+
+Every (user, transaction type, category) keeps a small running state on
+log amounts: Welford mean/variance, an EWMA mean/variance that follows recent
+behaviour, and a median/MAD sketch (exact over the first few values, then a
+scale-aware stochastic update). A transaction is scored against its state
+before being folded in, so each new row costs O(1) and a backfill is a single
+pass in date order. Each user also has an all-categories state per
+transaction type, used to judge the first transaction in a new category.
+"""
+
+import math
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+# Observations before a state may flag anything
+MIN_HISTORY = 8
+
+# Values kept for an exact median/MAD before switching to the sketch
+WARMUP_VALUES = 9
+
+# EWMA smoothing factor (about the last 20 transactions)
+EWMA_ALPHA = 0.1
+
+# Long-run sketch step as a fraction of the current MAD, and the smallest scale (log units)
+SKETCH_RATE = 0.02
+MIN_SCALE = 0.05
+
+# 0.6745 * (x - median) / MAD is comparable to a z-score for normal data
+MAD_TO_Z = 0.6745
+
+# Robust z needed to flag, the Welford and EWMA z that must both agree (so a
+# shift in recent spending isn't flagged against stale history), and the "high" cut-off
+ROBUST_THRESHOLD = 3.5
+Z_THRESHOLD = 3.0
+HIGH_SEVERITY = 6.0
+
+# Thresholds are widened by (1 + SMALL_SAMPLE / n), since young estimates are noisy
+SMALL_SAMPLE = 8
+
+# Key of the per-user all-categories state within a transaction type
+ALL_CATEGORIES = "*"
+
+ANOMALY_TYPES = {"expense": "large_expense", "income": "large_income"}
+NEW_CATEGORY_TYPES = {"expense": "new_category_expense", "income": "new_income_source"}
+
+STATE_FIELDS = ("n", "mean", "m2", "ewma", "ewm_var", "median", "mad", "warmup")
+
+
+class RunningStats:
+    """Running statistics of one stream of log amounts"""
+
+    __slots__ = STATE_FIELDS
+
+    def __init__(self, n: int = 0, mean: float = 0.0, m2: float = 0.0, ewma: float = 0.0, ewm_var: float = 0.0,
+                 median: float = 0.0, mad: float = 0.0, warmup: Optional[List[float]] = None):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+        self.ewma = ewma
+        self.ewm_var = ewm_var
+        self.median = median
+        self.mad = mad
+        self.warmup = list(warmup or [])
+
+    def update(self, x: float) -> None:
+        """Fold one log amount into the state"""
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+        if self.n == 1:
+            self.ewma = x
+        else:
+            diff = x - self.ewma
+            self.ewma += EWMA_ALPHA * diff
+            self.ewm_var = (1 - EWMA_ALPHA) * (self.ewm_var + EWMA_ALPHA * diff * diff)
+
+        if len(self.warmup) < WARMUP_VALUES and self.n <= WARMUP_VALUES:
+            self.warmup.append(x)
+            values = sorted(self.warmup)
+            self.median = _middle(values)
+            self.mad = _middle(sorted(abs(v - self.median) for v in values))
+            if len(self.warmup) == WARMUP_VALUES:
+                self.warmup = []
+            return
+
+        # Frugal streaming median/MAD: step towards the new value by a fraction of the spread
+        # (larger steps while the state is young, so the small-sample estimate is corrected quickly)
+        step = max(SKETCH_RATE, 1.0 / self.n) * max(self.mad, MIN_SCALE)
+        self.median += step * _sign(x - self.median)
+        self.mad += step * _sign(abs(x - self.median) - self.mad)
+
+    def scores(self, x: float) -> Dict[str, float]:
+        """Robust, Welford and EWMA z-scores of a log amount against the state"""
+        std = math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+        return {
+            "robust_z": MAD_TO_Z * (x - self.median) / max(self.mad, MIN_SCALE),
+            "z": (x - self.mean) / max(std, MIN_SCALE),
+            "ewma_z": (x - self.ewma) / max(math.sqrt(self.ewm_var), MIN_SCALE),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in STATE_FIELDS}
+
+    @classmethod
+    def from_dict(cls, row: Dict[str, Any]) -> "RunningStats":
+        return cls(
+            n=int(row.get("n") or 0),
+            warmup=[float(v) for v in row.get("warmup") or []],
+            **{field: float(row.get(field) or 0.0) for field in ("mean", "m2", "ewma", "ewm_var", "median", "mad")},
+        )
+
+
+def _middle(values: List[float]) -> float:
+    mid = len(values) // 2
+    return values[mid] if len(values) % 2 else (values[mid - 1] + values[mid]) / 2
+
+
+def _sign(value: float) -> float:
+    return 1.0 if value > 0 else -1.0 if value < 0 else 0.0
+
+
+def stream_key(row: Dict[str, Any]) -> Tuple[str, str]:
+    """(transaction type, category) a transaction's state is kept under"""
+    kind = "income" if row.get("transaction_type") == "income" else "expense"
+    category = (row.get("category") or "other").strip().lower() or "other"
+    return kind, category
+
+
+class AnomalyDetector:
+    """
+    Per-user, per-category running state over a transaction stream
+
+    Keys are (user_id, "income"/"expense", category); the category "*" holds
+    the user's all-categories state for that transaction type. States touched
+    since the last take_dirty() are tracked so only they need saving.
+    """
+
+    def __init__(self, states: Optional[Dict[Tuple[str, str, str], RunningStats]] = None):
+        self.states: Dict[Tuple[str, str, str], RunningStats] = states or {}
+        self.dirty: set = set()
+
+    def observe(self, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Score one transaction, then fold it into its states
+
+        Args:
+            row: Transaction with transaction_id, user_id, amount, transaction_type,
+                category and transaction_date
+
+        Returns:
+            Anomaly dict if the transaction is flagged, else None
+        """
+        amount = float(row.get("amount") or 0)
+        if amount <= 0:
+            return None
+        x = math.log1p(amount)
+        kind, category = stream_key(row)
+        key = (row["user_id"], kind, category)
+        overall_key = (row["user_id"], kind, ALL_CATEGORIES)
+        stats = self.states.get(key)
+        overall = self.states.get(overall_key)
+
+        anomaly = None
+        if stats is not None and stats.n >= MIN_HISTORY:
+            scores = stats.scores(x)
+            widen = 1.0 + SMALL_SAMPLE / stats.n
+            if (scores["robust_z"] >= ROBUST_THRESHOLD * widen
+                    and min(scores["z"], scores["ewma_z"]) >= Z_THRESHOLD * widen):
+                anomaly = _anomaly(row, ANOMALY_TYPES[kind], scores, stats, category)
+        elif stats is None and overall is not None and overall.n >= MIN_HISTORY:
+            scores = overall.scores(x)
+            if scores["robust_z"] >= ROBUST_THRESHOLD * (1.0 + SMALL_SAMPLE / overall.n):
+                anomaly = _anomaly(row, NEW_CATEGORY_TYPES[kind], scores, overall, category)
+
+        for k in (key, overall_key):
+            state = self.states.get(k)
+            if state is None:
+                state = self.states[k] = RunningStats()
+            state.update(x)
+            self.dirty.add(k)
+        return anomaly
+
+    def observe_many(self, rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Observe rows in order (callers sort by transaction date); returns the anomalies"""
+        observe = self.observe
+        return [a for a in (observe(row) for row in rows) if a is not None]
+
+    def take_dirty(self) -> List[Tuple[Tuple[str, str, str], RunningStats]]:
+        """States changed since the last call, clearing the dirty set"""
+        dirty = [(key, self.states[key]) for key in self.dirty]
+        self.dirty = set()
+        return dirty
+
+
+def _anomaly(
+    row: Dict[str, Any],
+    anomaly_type: str,
+    scores: Dict[str, float],
+    stats: RunningStats,
+    category: str,
+) -> Dict[str, Any]:
+    score = scores["robust_z"]
+    return {
+        "transaction_id": row.get("transaction_id"),
+        "user_id": row["user_id"],
+        "transaction_date": str(row.get("transaction_date"))[:10],
+        "category": category,
+        "amount": round(float(row["amount"]), 2),
+        "expected_amount": round(math.expm1(stats.median), 2),
+        "anomaly_type": anomaly_type,
+        "anomaly_score": round(score, 2),
+        "severity": "high" if score >= HIGH_SEVERITY else "medium",
+        "details": {**{name: round(value, 2) for name, value in scores.items()}, "history": stats.n},
+    }
+
+
+def state_row(key: Tuple[str, str, str], stats: RunningStats) -> Dict[str, Any]:
+    """transaction_anomaly_state row for a state"""
+    user_id, kind, category = key
+    return {"user_id": user_id, "transaction_type": kind, "category": category, **stats.to_dict()}
+
+
+def detector_from_rows(rows: Iterable[Dict[str, Any]]) -> AnomalyDetector:
+    """Rebuild a detector from transaction_anomaly_state rows"""
+    return AnomalyDetector({
+        (row["user_id"], row["transaction_type"], row["category"]): RunningStats.from_dict(row)
+        for row in rows
+    })
+
+
+def summarise_anomalies(anomalies: List[Dict[str, Any]], limit: int = 5) -> Optional[Dict[str, Any]]:
+    """risk_assessments.transaction_anomalies value: counts plus the strongest anomalies"""
+    if not anomalies:
+        return None
+    strongest = sorted(anomalies, key=lambda a: -float(a.get("anomaly_score") or 0))[:limit]
+    return {
+        "count": len(anomalies),
+        "high_severity": sum(1 for a in anomalies if a.get("severity") == "high"),
+        "anomalies": [
+            {key: a.get(key) for key in ("transaction_id", "transaction_date", "category", "amount",
+                                         "expected_amount", "anomaly_type", "anomaly_score", "severity")}
+            for a in strongest
+        ],
+    }
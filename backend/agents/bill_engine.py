@@ -0,0 +1,313 @@
+"""
+Bill Payment Scheduling Engine
+Greedy cash-constrained payment scheduler behind the Bill Payment Agent
+
+Bills are placed one at a time in priority order (priority band, then late
+fee per rupee, then deadline) onto a day-by-day cash curve: cash on hand plus
+expected income (weekday means from the forecast engine) minus payments
+already placed. A bill is paid on its due date when the cash allows it, else
+on the first later day that keeps every placed payment funded; landing past
+the grace period incurs its late fee. Bills are processed as (users x bills)
+arrays, one bill rank per step, so thousands of users are scheduled together.
+"""
+
+import calendar
+import math
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from forecast_engine import FORECAST_DAYS, HISTORY_DAYS, daily_forecast
+from pattern_engine import daily_income_matrix, to_day_numbers, window_start
+
+
+HORIZON_DAYS = FORECAST_DAYS
+
+# Placement order: lower rank is funded first
+PRIORITY_RANK = {"critical": 0, "high": 1, "medium": 2, "low": 3}
+
+# Days between occurrences, used to roll a recurring bill's due date forward
+FREQUENCY_DAYS = {"daily": 1, "weekly": 7, "monthly": 30, "quarterly": 91, "annual": 365}
+
+# Cash-cover probability below which a pay date is flagged
+LOW_CONFIDENCE = 0.6
+
+_erf = np.frompyfunc(math.erf, 1, 1)
+
+
+def _normal_cdf(z: np.ndarray) -> np.ndarray:
+    return 0.5 * (1.0 + _erf(z / math.sqrt(2.0)).astype(np.float64))
+
+
+def _occurrence_on_or_after(due: date, step: int, target: date) -> date:
+    """First occurrence of a bill recurring every `step` days from `due` that falls on or after target"""
+    if due >= target:
+        return due
+    if step == 30:
+        # Calendar months keep the same day of month (clamped to the month's length)
+        months = (target.year - due.year) * 12 + target.month - due.month
+        for extra in (0, 1):
+            year, month = divmod(due.month - 1 + months + extra, 12)
+            year, month = due.year + year, month + 1
+            candidate = date(year, month, min(due.day, calendar.monthrange(year, month)[1]))
+            if candidate >= target:
+                return candidate
+    return due + timedelta(days=-(-(target - due).days // step) * step)
+
+
+def next_due(due_date: Any, frequency: Optional[str], as_of: date, last_paid_date: Any = None) -> Optional[date]:
+    """
+    Earliest unpaid occurrence of a bill, which may lie before as_of (overdue)
+
+    One-time bills keep their date. A recurring bill whose due date has
+    passed is only rolled forward past the occurrences its last payment
+    covers (a payment covers the occurrence nearest to it); without a
+    payment on record the passed occurrence is still owed.
+    """
+    if not due_date:
+        return None
+    due = datetime.strptime(str(due_date)[:10], "%Y-%m-%d").date()
+    step = FREQUENCY_DAYS.get((frequency or "monthly").lower())
+    if step is None or due >= as_of or not last_paid_date:
+        return due
+    last_paid = datetime.strptime(str(last_paid_date)[:10], "%Y-%m-%d").date()
+    return _occurrence_on_or_after(due, step, last_paid + timedelta(days=step // 2 + 1))
+
+
+def bill_matrix(
+    bills_by_user: Dict[str, List[Dict[str, Any]]],
+    users: List[str],
+    as_of: date,
+    horizon: int = HORIZON_DAYS,
+) -> Dict[str, Any]:
+    """
+    Pad each user's bills due within the horizon into (users x bills) arrays
+
+    Args:
+        bills_by_user: user_id -> bills rows (id, bill_name, amount, due_date,
+            frequency, priority, late_fee, grace_period_days, last_paid_date)
+        users: Users to schedule (row order)
+        as_of: First day of the schedule (day 0)
+        horizon: Days to schedule
+
+    Returns:
+        {"amount", "due", "deadline", "late_fee", "rank", "valid"} arrays and
+        "bills" (users x bills) lists of the source rows
+    """
+    due_bills: List[List[tuple]] = []
+    for user in users:
+        upcoming = []
+        for bill in bills_by_user.get(user, []):
+            due = next_due(bill.get("due_date"), bill.get("frequency"), as_of, bill.get("last_paid_date"))
+            if due is None or (due - as_of).days >= horizon or not float(bill.get("amount") or 0) > 0:
+                continue
+            upcoming.append((bill, (due - as_of).days, due))
+        due_bills.append(upcoming)
+
+    n_users, n_bills = len(users), max((len(b) for b in due_bills), default=0)
+    shape = (n_users, n_bills)
+    arrays = {
+        "amount": np.zeros(shape), "late_fee": np.zeros(shape),
+        "due": np.zeros(shape, dtype=np.int64), "deadline": np.zeros(shape, dtype=np.int64),
+        "rank": np.full(shape, len(PRIORITY_RANK)), "valid": np.zeros(shape, dtype=bool),
+    }
+    refs: List[List[Optional[tuple]]] = [[None] * n_bills for _ in range(n_users)]
+    for i, upcoming in enumerate(due_bills):
+        for k, (bill, offset, due) in enumerate(upcoming):
+            arrays["amount"][i, k] = float(bill["amount"])
+            arrays["late_fee"][i, k] = float(bill.get("late_fee") or 0)
+            # Overdue bills are payable from day 0, but their deadline may already be behind us
+            arrays["due"][i, k] = max(offset, 0)
+            arrays["deadline"][i, k] = offset + int(bill.get("grace_period_days") or 0)
+            arrays["rank"][i, k] = PRIORITY_RANK.get((bill.get("priority") or "medium").lower(), 2)
+            arrays["valid"][i, k] = True
+            refs[i][k] = (bill, due)
+    arrays["bills"] = refs
+    return arrays
+
+
+def schedule_payments(
+    cash: np.ndarray,
+    income_mean: np.ndarray,
+    income_std: np.ndarray,
+    bills: Dict[str, np.ndarray],
+) -> Dict[str, np.ndarray]:
+    """
+    Greedy late-fee-minimising schedule for many users
+
+    Args:
+        cash: Cash on hand per user
+        income_mean: (users x days) expected income per day
+        income_std: (users x days) standard deviation of income per day
+        bills: bill_matrix output
+
+    Returns:
+        (users x bills) "pay_day" (-1 when unfunded within the horizon), "late",
+        "confidence" (probability cash covers the payment on its pay date) and
+        "cash_only" (covered without waiting for new income)
+    """
+    n_users, horizon = income_mean.shape
+    amount, due, deadline, valid = bills["amount"], bills["due"], bills["deadline"], bills["valid"]
+
+    # Placement order per user: priority band, late fee per rupee (desc), deadline
+    fee_rate = np.divide(bills["late_fee"], amount, out=np.zeros_like(amount), where=amount > 0)
+    order = np.lexsort((deadline, -fee_rate, bills["rank"] + ~valid * len(PRIORITY_RANK)), axis=-1) \
+        if amount.size else np.zeros(amount.shape, dtype=np.int64)
+
+    # slack[:, t]: cash left at the end of day t after the payments placed so far
+    slack = cash[:, None] + np.cumsum(income_mean, axis=1)
+    paid = np.zeros((n_users, horizon))
+    pay_day = np.full(amount.shape, -1, dtype=np.int64)
+    rows = np.arange(n_users)
+
+    for k in range(amount.shape[1]):
+        b = order[:, k]
+        a, d = amount[rows, b], np.minimum(due[rows, b], horizon - 1)
+        # Paying on day t must leave every later day non-negative, so check the suffix minimum
+        suffix_min = np.minimum.accumulate(slack[:, ::-1], axis=1)[:, ::-1]
+        feasible = suffix_min >= a[:, None]
+        first = np.where(feasible.any(axis=1), feasible.argmax(axis=1), -1)
+        day = np.where(first >= 0, np.maximum(d, first), -1)
+        day = np.where(valid[rows, b], day, -1)
+
+        funded = day >= 0
+        after = np.arange(horizon)[None, :] >= day[:, None]
+        slack -= np.where(funded[:, None] & after, a[:, None], 0.0)
+        paid[rows[funded], day[funded]] += a[funded]
+        pay_day[rows, b] = day
+
+    cumulative_paid = np.cumsum(paid, axis=1)
+    spread = np.sqrt(np.cumsum(income_std ** 2, axis=1))
+    z = np.divide(slack, spread, out=np.where(slack >= 0, np.inf, -np.inf), where=spread > 0)
+    day_confidence = _normal_cdf(np.clip(z, -10, 10))
+
+    at = np.clip(pay_day, 0, horizon - 1)
+    gather = lambda matrix: np.take_along_axis(matrix, at, axis=1)  # noqa: E731
+    scheduled = pay_day >= 0
+    return {
+        "pay_day": pay_day,
+        "late": valid & (~scheduled | (pay_day > deadline)),
+        "confidence": np.where(scheduled, gather(day_confidence), 0.0),
+        "cash_only": scheduled & (cash[:, None] >= gather(cumulative_paid)),
+    }
+
+
+def bill_analysis(
+    result: Dict[str, np.ndarray],
+    bills: Dict[str, Any],
+    i: int,
+    as_of: date,
+) -> Dict[str, Any]:
+    """Format user i's schedule as a bill_analysis object"""
+    payments, unfunded = [], []
+    expected_fees = 0.0
+    for k, ref in enumerate(bills["bills"][i]):
+        if ref is None:
+            continue
+        bill, due = ref
+        late_fee = float(bills["late_fee"][i, k])
+        day = int(result["pay_day"][i, k])
+        confidence = float(result["confidence"][i, k])
+        late = bool(result["late"][i, k])
+        expected_fees += late_fee if late else late_fee * (1.0 - confidence)
+        if day < 0:
+            unfunded.append({"bill_id": bill.get("id"), "bill_name": bill.get("bill_name"),
+                             "amount": float(bills["amount"][i, k]), "due_date": due.isoformat()})
+            continue
+        payments.append({
+            "bill_id": bill.get("id"),
+            "bill_name": bill.get("bill_name"),
+            "amount": round(float(bills["amount"][i, k]), 2),
+            "due_date": due.isoformat(),
+            "pay_date": (as_of + timedelta(days=day)).isoformat(),
+            "income_source": "Cash on hand" if result["cash_only"][i, k] else "Expected earnings",
+            "confidence": round(confidence, 2),
+            "late": late,
+            "overdue": due < as_of,
+        })
+    payments.sort(key=lambda p: (p["pay_date"], p["bill_name"] or ""))
+
+    schedule: Dict[str, Dict[str, Any]] = {}
+    for p in payments:
+        entry = schedule.setdefault(p["pay_date"], {
+            "pay_date": p["pay_date"], "bills_to_pay": [], "total_amount": 0.0,
+            "income_source": p["income_source"], "confidence": p["confidence"],
+        })
+        entry["bills_to_pay"].append(p["bill_name"])
+        entry["total_amount"] = round(entry["total_amount"] + p["amount"], 2)
+        entry["confidence"] = min(entry["confidence"], p["confidence"])
+        if p["income_source"] != "Cash on hand":
+            entry["income_source"] = "Expected earnings"
+
+    alerts = [
+        {"alert_type": "late_payment", "bill": p["bill_name"],
+         "message": (f"{p['bill_name']} was due on {p['due_date']} and is still unpaid; pay it on {p['pay_date']}"
+                     if p["overdue"] else
+                     f"{p['bill_name']} can only be covered on {p['pay_date']}, after its grace period"),
+         "severity": "high"}
+        for p in payments if p["late"]
+    ] + [
+        {"alert_type": "insufficient_funds", "bill": b["bill_name"],
+         "message": f"Expected income does not cover {b['bill_name']} (Rs {b['amount']:,.0f}) in the next {HORIZON_DAYS} days",
+         "severity": "critical"}
+        for b in unfunded
+    ] + [
+        {"alert_type": "low_confidence", "bill": p["bill_name"],
+         "message": f"Only {p['confidence']:.0%} likely to have Rs {p['amount']:,.0f} for {p['bill_name']} on {p['pay_date']}",
+         "severity": "medium"}
+        for p in payments if not p["late"] and p["confidence"] < LOW_CONFIDENCE
+    ]
+
+    confidences = [p["confidence"] for p in payments] + [0.0] * len(unfunded)
+    return {
+        "total_bills_due": round(float(bills["amount"][i].sum()), 2),
+        "payments": payments,
+        "payment_schedule": list(schedule.values()),
+        "unfunded_bills": unfunded,
+        "alerts": alerts,
+        "late_fee_risk": round(expected_fees, 2),
+        "confidence_score": round(float(np.mean(confidences)), 2) if confidences else 1.0,
+    }
+
+
+def compute_bill_schedules(
+    bills_by_user: Dict[str, List[Dict[str, Any]]],
+    income_rows: List[Dict[str, Any]],
+    cash_by_user: Dict[str, float],
+    users: List[str],
+    as_of: Optional[date] = None,
+    horizon: int = HORIZON_DAYS,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Schedule bill payments for many users at once
+
+    Args:
+        bills_by_user: user_id -> unpaid bills rows
+        income_rows: Income transactions (user_id, amount, transaction_date) for the history window
+        cash_by_user: user_id -> current bank balance
+        users: Users to schedule
+        as_of: First day of the schedule (defaults to today)
+        horizon: Days to schedule
+
+    Returns:
+        user_id -> bill_analysis dict
+    """
+    as_of = as_of or datetime.now().date()
+    position = {user: i for i, user in enumerate(users)}
+    income_rows = [r for r in income_rows if r["user_id"] in position]
+
+    # History ends yesterday so today's partial income doesn't skew the weekday means
+    start_day = window_start(as_of - timedelta(days=1), HISTORY_DAYS)
+    daily, _ = daily_income_matrix(
+        np.array([position[r["user_id"]] for r in income_rows], dtype=np.int64),
+        to_day_numbers(r["transaction_date"] for r in income_rows),
+        np.array([float(r.get("amount") or 0) for r in income_rows], dtype=np.float64),
+        len(users), start_day, HISTORY_DAYS,
+    )
+    mean, std = daily_forecast(daily, horizon)
+
+    bills = bill_matrix(bills_by_user, users, as_of, horizon)
+    cash = np.array([float(cash_by_user.get(user) or 0) for user in users])
+    result = schedule_payments(cash, mean, std, bills)
+    return {user: bill_analysis(result, bills, i, as_of) for i, user in enumerate(users)}
@@ -1,18 +1,34 @@
 """
 Automated Bill Payment Decisions Agent
 Analyzes bills, prioritizes payments, and creates payment schedules
-Writes to: bills, bill_payment_schedule tables
+Schedules come from the bill scheduling engine; the LLM only adds an optional narrative
+Writes to: bill_payment_schedule table
 """
 
 import asyncio
 import json
-from datetime import datetime
+from collections import defaultdict
+from datetime import datetime, timedelta
 import os
 import sys
+from typing import Optional
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from autogen_runtime import run_autogen_mcp_task
+from autogen_runtime import build_agent_rows, run_autogen_mcp_task, write_agent_data
+from bill_engine import compute_bill_schedules
+from forecast_engine import HISTORY_DAYS
+from postgrest_client import get_postgrest_client
+from user_snapshot import UserSnapshot
+
+# Set BILL_PAYMENT_AGENT_LLM_NARRATIVE=true to also ask the LLM to explain the schedule
+LLM_NARRATIVE = os.getenv("BILL_PAYMENT_AGENT_LLM_NARRATIVE", "false").lower() == "true"
+
+# Rows per PostgREST page / array insert in batch mode
+BATCH_PAGE_SIZE = 1000
+
+BILL_COLUMNS = "id,user_id,bill_name,amount,due_date,frequency,priority,late_fee,grace_period_days,last_paid_date"
+UNPAID_BILL_STATUSES = "in.(pending,overdue,scheduled)"
 
 
 class BillPaymentAgent:
@@ -25,178 +41,39 @@ class BillPaymentAgent:
     def _create_system_prompt(self) -> str:
         return """You are an Automated Bill Payment Decisions Agent for gig workers in India.
 
-Your task is to analyze bills, prioritize payments, and create optimal payment schedules based on income patterns.
-
-**CRITICAL: You must output ONLY valid JSON that matches the bill_payments table schema:**
-
-```json
-{
-  "bill_analysis": {
-    "total_monthly_bills": 12500.00,
-    "bills": [
-      {
-        "bill_name": "House Rent",
-        "bill_type": "rent",
-        "amount": 8000.00,
-        "due_date": "2025-01-05",
-        "frequency": "monthly",
-        "priority": "critical",
-        "auto_pay_recommended": false,
-        "payment_method": "bank_transfer",
-        "late_fee": 500.00,
-        "grace_period_days": 5,
-        "status": "pending"
-      },
-      {
-        "bill_name": "Mobile Recharge",
-        "bill_type": "utility",
-        "amount": 299.00,
-        "due_date": "2025-01-10",
-        "frequency": "monthly",
-        "priority": "high",
-        "auto_pay_recommended": true,
-        "payment_method": "upi",
-        "late_fee": 0,
-        "grace_period_days": 0,
-        "status": "pending"
-      },
-      {
-        "bill_name": "Electricity Bill",
-        "bill_type": "utility",
-        "amount": 1200.00,
-        "due_date": "2025-01-15",
-        "frequency": "monthly",
-        "priority": "high",
-        "auto_pay_recommended": true,
-        "payment_method": "upi",
-        "late_fee": 50.00,
-        "grace_period_days": 7,
-        "status": "pending"
-      },
-      {
-        "bill_name": "Bike EMI",
-        "bill_type": "emi",
-        "amount": 3000.00,
-        "due_date": "2025-01-07",
-        "frequency": "monthly",
-        "priority": "critical",
-        "auto_pay_recommended": true,
-        "payment_method": "auto_debit",
-        "late_fee": 200.00,
-        "grace_period_days": 3,
-        "remaining_emis": 18,
-        "status": "pending"
-      }
-    ],
-    "payment_schedule": [
-      {
-        "pay_date": "2025-01-05",
-        "bills_to_pay": ["House Rent"],
-        "total_amount": 8000.00,
-        "income_source": "Expected Swiggy earnings",
-        "confidence": 0.85
-      },
-      {
-        "pay_date": "2025-01-07",
-        "bills_to_pay": ["Bike EMI"],
-        "total_amount": 3000.00,
-        "income_source": "Expected Zomato earnings",
-        "confidence": 0.90
-      },
-      {
-        "pay_date": "2025-01-10",
-        "bills_to_pay": ["Mobile Recharge", "Electricity Bill"],
-        "total_amount": 1499.00,
-        "income_source": "Weekend earnings",
-        "confidence": 0.80
-      }
-    ],
-    "recommendations": [
-      {
-        "type": "auto_pay_setup",
-        "bill": "Bike EMI",
-        "reason": "Critical payment - missing affects credit score",
-        "action": "Set up auto-debit from bank account"
-      },
-      {
-        "type": "payment_timing",
-        "bill": "Electricity Bill",
-        "reason": "Has 7-day grace period",
-        "action": "Can delay if income is low in first week"
-      },
-      {
-        "type": "cost_saving",
-        "bill": "Mobile Recharge",
-        "reason": "Annual plan saves 15%",
-        "action": "Consider switching to annual prepaid plan"
-      }
-    ],
-    "alerts": [
-      {
-        "alert_type": "upcoming_due",
-        "bill": "House Rent",
-        "message": "Rent due in 3 days - ensure Rs 8000 available",
-        "severity": "high"
-      }
-    ],
-    "auto_pay_savings": 750.00,
-    "late_fee_risk": 750.00,
-    "confidence_score": 0.78
-  }
-}
-```
-
-**What you do:**
-1. Read transactions to identify recurring expenses (bills)
-2. Detect bill patterns: rent, EMIs, utilities, subscriptions
-3. Read income_patterns to understand earning schedule
-4. Match bill due dates with expected income days
-5. Prioritize bills by:
-   - Critical: EMIs, rent (affects credit/housing)
-   - High: Utilities (disconnection risk)
-   - Medium: Subscriptions
-   - Low: Optional services
-6. Create payment schedule aligned with income
-7. Recommend auto-pay for predictable bills
-8. Calculate late fee risk and potential savings
-9. Output ONLY the JSON format above - no explanations
-
-**Bill Types:**
-- rent: House/shop rent
-- emi: Loan EMIs (bike, phone, personal)
-- utility: Electricity, water, gas
-- telecom: Mobile, internet, DTH
-- insurance: Health, vehicle, life
-- subscription: OTT, apps, memberships
-- tax: GST, income tax advance
-
-**Priority Levels:**
-- critical: Missing affects credit score or housing
-- high: Service disconnection risk
-- medium: Convenience impact
-- low: Optional, can skip if needed
-
-**Auto-Pay Recommendations:**
-- Recommend for: Fixed amount bills, EMIs
-- Avoid for: Variable bills, uncertain income periods
-- Consider income volatility before recommending
-
-**Database Schema Requirements:**
-- amount/late_fee: Numbers with 2 decimals
-- due_date/pay_date: Date strings YYYY-MM-DD
-- frequency: "monthly", "quarterly", "annual", "one_time"
-- priority: "critical", "high", "medium", "low"
-- status: "pending", "paid", "overdue", "scheduled"
-- confidence: Number between 0-1
-
-**Output ONLY the JSON object. No other text.**"""
-
-    async def analyze_user(self, user_id: str) -> dict:
+You are given a bill payment schedule that has already been calculated from the
+user's unpaid bills, bank balance and expected daily earnings: a pay date and
+cash-cover confidence per bill, bills that will be late or can't be funded,
+and the expected late fees. Do not change the dates or amounts and do not write
+to the database.
+
+Explain the schedule to the gig worker in 3-5 short sentences:
+- Which bills to pay first and when
+- Any bill at risk of a late fee and what it would cost
+- One step that would make the schedule safer (auto-pay, shifting a due date, saving ahead)"""
+
+    async def fetch_bill_inputs(self, user_id: str, snapshot: Optional[UserSnapshot] = None) -> tuple:
+        """Fetch the user's unpaid bills, recent income and bank balances"""
+        client = snapshot or get_postgrest_client()
+        start = (datetime.now() - timedelta(days=HISTORY_DAYS + 1)).date().isoformat()
+        return await asyncio.gather(
+            client.select("bills", filters={"user_id": user_id, "status": UNPAID_BILL_STATUSES}, columns=BILL_COLUMNS),
+            client.select(
+                "transactions",
+                filters={"user_id": user_id, "transaction_type": "income", "transaction_date": f"gte.{start}"},
+                columns="user_id,amount,transaction_date",
+            ),
+            client.select("bank_accounts", filters={"user_id": user_id, "is_active": "is.true"},
+                          columns="user_id,current_balance"),
+        )
+
+    async def analyze_user(self, user_id: str, snapshot: Optional[UserSnapshot] = None) -> dict:
         """
         Analyze bills and create payment schedule for a specific user
 
         Args:
             user_id: UUID of the user to analyze
+            snapshot: Per-run snapshot of the user's input rows (read from the database if None)
 
         Returns:
             dict with analysis results and success status
@@ -204,29 +81,25 @@ Your task is to analyze bills, prioritize payments, and create optimal payment s
         print(f"[Bill Payment Agent] Starting analysis for user {user_id}")
 
         try:
-            prompt = f"""Analyze bills and create payment schedule for user {user_id}.
-
-Steps:
-1. Read transactions to identify recurring expenses (rent, EMIs, utilities)
-2. Detect bill patterns from transaction history
-3. Read income_patterns to understand when user earns money
-4. Create optimal payment schedule matching income to bills
-5. Identify which bills should have auto-pay
-6. Calculate late fee risks
-7. Generate payment recommendations
-8. Output structured JSON
-
-User ID: {user_id}
-
-Please analyze and create a comprehensive bill payment plan."""
-
-            result = await run_autogen_mcp_task(
-                agent_name="bill_payment_agent",
-                system_prompt=self.system_prompt,
-                task=prompt,
-                user_id=user_id,
-                use_azure=True
-            )
+            bills, income, accounts = await self.fetch_bill_inputs(user_id, snapshot)
+            cash = sum(float(account.get("current_balance") or 0) for account in accounts)
+            analysis = compute_bill_schedules({user_id: bills}, income, {user_id: cash}, [user_id])[user_id]
+            print(f"[Bill Payment Agent] Scheduled {len(analysis['payments'])} payments "
+                  f"({len(analysis['unfunded_bills'])} unfunded), late fee risk Rs {analysis['late_fee_risk']:,.0f}")
+
+            # The schedule is rebuilt from scratch, so drop the previous unpaid plan first
+            await get_postgrest_client().delete("bill_payment_schedule", {"user_id": user_id, "status": "scheduled"})
+            written = await write_agent_data(user_id, "bill_payment_agent", {"bill_analysis": analysis}, upsert=False)
+
+            result = {"bill_analysis": analysis, "written": written}
+            if LLM_NARRATIVE:
+                result["narrative"] = await run_autogen_mcp_task(
+                    agent_name="bill_payment_narrative",
+                    system_prompt=self.system_prompt,
+                    task=f"Bill payment schedule for user {user_id}:\n{json.dumps(analysis, indent=2)}",
+                    user_id=user_id,
+                    use_azure=True
+                )
 
             print(f"[Bill Payment Agent] Analysis complete for user {user_id}")
 
@@ -248,6 +121,62 @@ Please analyze and create a comprehensive bill payment plan."""
                 "timestamp": datetime.now().isoformat()
             }
 
+    async def analyze_all_users(self) -> dict:
+        """
+        Reschedule bills for every user with unpaid bills in one vectorised pass
+
+        Returns:
+            dict with user/payment counts, write errors and timing
+        """
+        started = datetime.now()
+        client = get_postgrest_client()
+        start = (started - timedelta(days=HISTORY_DAYS + 1)).date().isoformat()
+
+        bills, income, accounts = await asyncio.gather(
+            client.select_all("bills", filters={"status": UNPAID_BILL_STATUSES}, columns=BILL_COLUMNS,
+                              order="user_id,id", page_size=BATCH_PAGE_SIZE),
+            client.select_all("transactions", filters={"transaction_type": "income", "transaction_date": f"gte.{start}"},
+                              columns="user_id,amount,transaction_date", order="user_id,transaction_id",
+                              page_size=BATCH_PAGE_SIZE),
+            client.select_all("bank_accounts", filters={"is_active": "is.true"}, columns="user_id,current_balance",
+                              order="user_id", page_size=BATCH_PAGE_SIZE),
+        )
+        bills_by_user = defaultdict(list)
+        for bill in bills:
+            bills_by_user[bill["user_id"]].append(bill)
+        cash_by_user = defaultdict(float)
+        for account in accounts:
+            cash_by_user[account["user_id"]] += float(account.get("current_balance") or 0)
+
+        user_ids = list(bills_by_user)
+        schedules = compute_bill_schedules(bills_by_user, income, cash_by_user, user_ids)
+
+        rows = []
+        for user_id, analysis in schedules.items():
+            rows.extend(build_agent_rows(user_id, "bill_payment_agent", {"bill_analysis": analysis})
+                        .get("bill_payment_schedule", []))
+
+        await client.delete("bill_payment_schedule", {"status": "scheduled"})
+        reports = await asyncio.gather(*(
+            client.bulk_insert("bill_payment_schedule", rows[i:i + BATCH_PAGE_SIZE])
+            for i in range(0, len(rows), BATCH_PAGE_SIZE)
+        ))
+        inserted = sum(report["inserted"] for report in reports)
+        errors = sum(len(report["errors"]) for report in reports)
+
+        elapsed = (datetime.now() - started).total_seconds()
+        print(f"[Bill Payment Agent] Batch: scheduled {len(rows)} payments for {len(schedules)} users in {elapsed:.1f}s")
+
+        return {
+            "success": errors == 0,
+            "agent": "bill_payment",
+            "users": len(schedules),
+            "inserted": inserted,
+            "errors": errors,
+            "elapsed_seconds": elapsed,
+            "timestamp": datetime.now().isoformat()
+        }
+
 
 async def main():
     """Test the bill payment agent"""
@@ -0,0 +1,225 @@
+"""
+Budget Engine
+Deterministic feast/famine/monthly budgets behind the Budget Analysis Agent
+
+- Expected income comes from percentiles of weekly income (feast = 75th,
+  famine = 25th, monthly = median scaled to 30 days)
+- Fixed costs are recurring expenses detected in transactions (flagged
+  is_recurring, or same payee roughly monthly at a stable amount) plus EMIs
+  from user_profiles.debt_obligations
+- Variable costs and category limits come from quantiles of weekly spend per
+  category
+"""
+
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from pattern_engine import ROLLING_DAYS, to_day_numbers, window_start
+
+
+HISTORY_DAYS = 91  # 13 complete weeks
+DAYS_PER_MONTH = 30
+
+# Weekly-income percentile per budget type
+INCOME_PERCENTILES = {"feast_week": 75, "famine_week": 25, "monthly": 50}
+
+# Category-spend quantiles: expected spend and the limit shown to the user
+SPEND_QUANTILE = 50
+LIMIT_QUANTILE = {"feast_week": 75, "famine_week": 50, "monthly": 75}
+
+# Share of the surplus (income - fixed - variable) set aside as savings
+SAVINGS_SHARE = {"feast_week": 0.6, "famine_week": 0.0, "monthly": 0.3}
+
+# Categories kept in a famine week; everything else is cut to zero
+ESSENTIAL_CATEGORIES = {
+    "food", "groceries", "fuel", "transport", "utilities", "electricity", "water",
+    "gas", "medical", "health", "medicine", "education", "phone", "mobile", "internet",
+}
+
+# Recurring-expense detection: payment gap (days) that counts as monthly, and max amount variation
+MONTHLY_GAP_DAYS = (25, 35)
+MAX_RECURRING_CV = 0.15
+
+# Monthly occurrences per recurring_frequency value
+FREQUENCY_PER_MONTH = {"daily": 30.0, "weekly": 30.0 / 7, "biweekly": 30.0 / 14, "monthly": 1.0,
+                       "quarterly": 1.0 / 3, "yearly": 1.0 / 12, "annual": 1.0 / 12}
+
+# Full confidence once this many weeks of income history exist
+CONFIDENT_WEEKS = 8
+
+
+def _category(row: Dict[str, Any]) -> str:
+    return (row.get("category") or "other").strip().lower()
+
+
+def detect_fixed_costs(
+    expenses: List[Dict[str, Any]],
+    debt_obligations: Any = None,
+) -> Dict[str, float]:
+    """
+    Monthly fixed costs by category from recurring expenses and profile EMIs
+
+    Args:
+        expenses: Expense transactions (amount, category, merchant_name,
+            description, transaction_date, is_recurring, recurring_frequency)
+        debt_obligations: user_profiles.debt_obligations JSON array
+
+    Returns:
+        category -> monthly amount
+    """
+    groups: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+    for row in expenses:
+        payee = (row.get("merchant_name") or row.get("description") or "").strip().lower()
+        groups[(_category(row), payee)].append(row)
+
+    fixed: Dict[str, float] = defaultdict(float)
+    for (category, _), rows in groups.items():
+        amounts = np.array([float(r.get("amount") or 0) for r in rows])
+        flagged = [r for r in rows if r.get("is_recurring")]
+        if flagged:
+            frequency = (flagged[-1].get("recurring_frequency") or "monthly").lower()
+            fixed[category] += float(np.median(amounts)) * FREQUENCY_PER_MONTH.get(frequency, 1.0)
+            continue
+
+        if len(rows) < 2:
+            continue
+        days = np.sort(to_day_numbers(r["transaction_date"] for r in rows))
+        gap = float(np.median(np.diff(days)))
+        cv = float(amounts.std() / amounts.mean()) if amounts.mean() else 1.0
+        if MONTHLY_GAP_DAYS[0] <= gap <= MONTHLY_GAP_DAYS[1] and cv <= MAX_RECURRING_CV:
+            fixed[category] += float(np.median(amounts))
+
+    # EMIs from the profile, unless the same payments were already detected as "emi"
+    if isinstance(debt_obligations, list) and "emi" not in fixed:
+        for debt in debt_obligations:
+            if not isinstance(debt, dict):
+                continue
+            emi = debt.get("emi") or debt.get("monthly_payment") or debt.get("monthly_emi")
+            if emi:
+                fixed["emi"] += float(emi)
+
+    return {category: round(amount, 2) for category, amount in fixed.items()}
+
+
+def budget_period(budget_type: str, as_of: date) -> tuple:
+    """
+    (valid_from, valid_until) of the budget period containing as_of
+
+    Weekly budgets run Monday to Sunday and the monthly budget covers the
+    calendar month, so every run within a period upserts the same rows.
+    """
+    if budget_type == "monthly":
+        start = as_of.replace(day=1)
+        next_month = (start + timedelta(days=32)).replace(day=1)
+        return start, next_month - timedelta(days=1)
+    start = as_of - timedelta(days=as_of.weekday())
+    return start, start + timedelta(days=ROLLING_DAYS - 1)
+
+
+def weekly_series(
+    day_numbers: np.ndarray,
+    amounts: np.ndarray,
+    start_day: int,
+    n_weeks: int,
+    group_index: Optional[np.ndarray] = None,
+    n_groups: int = 1,
+) -> np.ndarray:
+    """(groups x weeks) totals of amounts falling inside the window"""
+    if group_index is None:
+        group_index = np.zeros(len(day_numbers), dtype=np.int64)
+    week = (day_numbers - start_day) // ROLLING_DAYS
+    inside = (week >= 0) & (week < n_weeks)
+    flat = group_index[inside] * n_weeks + week[inside]
+    return np.bincount(flat, weights=amounts[inside], minlength=n_groups * n_weeks).reshape(n_groups, n_weeks)
+
+
+def compute_budgets(
+    transactions: List[Dict[str, Any]],
+    profile: Optional[Dict[str, Any]] = None,
+    as_of: Optional[date] = None,
+    history_days: int = HISTORY_DAYS,
+) -> List[Dict[str, Any]]:
+    """
+    Build feast_week, famine_week and monthly budgets for one user
+
+    Args:
+        transactions: The user's transactions for the history window
+        profile: user_profiles row (debt_obligations, monthly_expenses_avg)
+        as_of: Day the budgets are built on (defaults to today); they cover
+            the week / month containing it (see budget_period)
+        history_days: Days of history to learn from
+
+    Returns:
+        budgets list in the shape build_agent_rows expects
+    """
+    as_of = as_of or datetime.now().date()
+    profile = profile or {}
+    n_weeks = history_days // ROLLING_DAYS
+    start_day = window_start(as_of - timedelta(days=1), n_weeks * ROLLING_DAYS)
+
+    income = [t for t in transactions if t.get("transaction_type") == "income"]
+    expenses = [t for t in transactions if t.get("transaction_type") == "expense"]
+
+    fixed_monthly = detect_fixed_costs(expenses, profile.get("debt_obligations"))
+
+    # Weekly income percentiles
+    income_days = to_day_numbers(t["transaction_date"] for t in income)
+    income_amounts = np.array([float(t.get("amount") or 0) for t in income])
+    weekly_income = weekly_series(income_days, income_amounts, start_day, n_weeks)[0]
+    active_weeks = int((weekly_income > 0).sum())
+
+    # Weekly spend per variable category (fixed categories are excluded)
+    variable = [t for t in expenses if _category(t) not in fixed_monthly]
+    categories = sorted({_category(t) for t in variable})
+    category_index = {category: i for i, category in enumerate(categories)}
+    weekly_spend = weekly_series(
+        to_day_numbers(t["transaction_date"] for t in variable),
+        np.array([float(t.get("amount") or 0) for t in variable]),
+        start_day, n_weeks,
+        group_index=np.array([category_index[_category(t)] for t in variable], dtype=np.int64),
+        n_groups=len(categories),
+    )
+    spend_quantiles = {
+        q: np.percentile(weekly_spend, q, axis=1) if categories else np.zeros(0)
+        for q in {SPEND_QUANTILE, *LIMIT_QUANTILE.values()}
+    }
+
+    confidence = round(min(active_weeks / CONFIDENT_WEEKS, 1.0) * 0.9 + 0.1 * bool(expenses), 2)
+    budgets = []
+    for budget_type, percentile in INCOME_PERCENTILES.items():
+        monthly = budget_type == "monthly"
+        scale = DAYS_PER_MONTH / ROLLING_DAYS if monthly else 1.0
+        valid_from, valid_until = budget_period(budget_type, as_of)
+
+        income_expected = float(np.percentile(weekly_income, percentile)) * scale
+        fixed = {k: round(v * (1.0 if monthly else ROLLING_DAYS / DAYS_PER_MONTH), 2) for k, v in fixed_monthly.items()}
+
+        keep = [c for c in categories if budget_type != "famine_week" or c in ESSENTIAL_CATEGORIES]
+        variable_costs = {c: round(float(spend_quantiles[SPEND_QUANTILE][category_index[c]]) * scale, 2) for c in keep}
+        limits = {
+            c: round(float(spend_quantiles[LIMIT_QUANTILE[budget_type]][category_index[c]]) * scale, 2)
+            for c in categories
+        }
+        if budget_type == "famine_week":
+            limits = {c: (amount if c in ESSENTIAL_CATEGORIES else 0.0) for c, amount in limits.items()}
+
+        surplus = max(income_expected - sum(fixed.values()) - sum(variable_costs.values()), 0.0)
+        savings = surplus * SAVINGS_SHARE[budget_type]
+        discretionary = 0.0 if budget_type == "famine_week" else surplus - savings
+
+        budgets.append({
+            "budget_type": budget_type,
+            "valid_from": valid_from.isoformat(),
+            "valid_until": valid_until.isoformat(),
+            "total_income_expected": round(income_expected, 2),
+            "fixed_costs": fixed,
+            "variable_costs": variable_costs,
+            "savings_target": round(savings, 2),
+            "discretionary_budget": round(discretionary, 2),
+            "category_limits": limits,
+            "confidence_score": confidence,
+        })
+    return budgets
@@ -0,0 +1,396 @@
+"""
+Seasonal Context Calendar
+Precomputed India season/festival calendar behind the Context Intelligence Agent
+
+Monsoons, heat waves, wedding season and the major festivals are compiled
+once per year into date-indexed tables (region x occupation group x day ->
+income multiplier, region x day -> expense multiplier, region x day -> event
+bitmask). Looking up any array of transaction dates is then plain NumPy
+indexing, so the forecast engine can join the calendar against daily income
+and the context agent no longer asks the LLM to recall the festival dates.
+
+Lunar festival dates are the commonly published national dates; regional
+observance can differ by a day, which the event windows absorb.
+"""
+
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+REGIONS = ["north", "south", "east", "west", "northeast", "central"]
+
+# Lower-case state / union territory -> region
+REGION_STATES = {
+    "north": {
+        "delhi", "haryana", "punjab", "himachal pradesh", "jammu and kashmir", "ladakh",
+        "uttarakhand", "uttar pradesh", "chandigarh", "rajasthan",
+    },
+    "south": {
+        "karnataka", "kerala", "tamil nadu", "andhra pradesh", "telangana", "puducherry",
+        "lakshadweep", "andaman and nicobar islands",
+    },
+    "east": {"west bengal", "odisha", "bihar", "jharkhand"},
+    "west": {"maharashtra", "gujarat", "goa", "dadra and nagar haveli and daman and diu"},
+    "northeast": {
+        "assam", "arunachal pradesh", "manipur", "meghalaya", "mizoram", "nagaland", "sikkim", "tripura",
+    },
+    "central": {"madhya pradesh", "chhattisgarh"},
+}
+
+# Users without a known state get the central calendar (national festivals, main monsoon)
+DEFAULT_REGION = "central"
+
+# Occupation groups react differently to the same season; matched by keyword
+OCCUPATION_GROUPS = ["delivery", "driver", "services", "other"]
+OCCUPATION_KEYWORDS = {
+    "delivery": ("delivery", "courier", "swiggy", "zomato", "zepto", "blinkit", "dunzo"),
+    "driver": ("driver", "cab", "taxi", "auto", "ola", "uber", "rapido", "rickshaw"),
+    "services": (
+        "caterer", "catering", "decorat", "beautician", "salon", "photograph", "event",
+        "tailor", "electrician", "plumber", "carpenter", "painter", "urban company",
+    ),
+}
+
+# Event definitions. "dates" holds window anchors: (month, day) repeats every
+# year, a dict maps year -> ISO date for lunar festivals. A window runs from
+# anchor - days_before to anchor + days_after. Income multipliers are per
+# occupation group ("other" applies to groups not listed); overlapping events
+# compound multiplicatively.
+#
+# Lunar festival dates are listed through 2030. To extend the calendar, add
+# the published national date for each new year to every lunar festival's
+# "dates" dict; build_calendar logs the festivals missing for any year it
+# compiles, since those years otherwise lose their festival uplift.
+EVENTS: List[Dict[str, Any]] = [
+    {
+        "name": "Southwest Monsoon",
+        "type": "weather",
+        "weather": "heavy_rain",
+        "dates": [(6, 1)],
+        "days_before": 0,
+        "days_after": 121,
+        "regions": ["north", "east", "west", "northeast", "central"],
+        "income": {"delivery": 0.88, "driver": 0.92, "services": 0.95, "other": 0.97},
+        "expense": 1.02,
+        "recommendation": "Keep a rain buffer: outdoor work slows on heavy-rain days",
+    },
+    {
+        "name": "Southwest Monsoon",
+        "type": "weather",
+        "weather": "heavy_rain",
+        "dates": [(6, 1)],
+        "days_before": 0,
+        "days_after": 106,
+        "regions": ["south"],
+        "income": {"delivery": 0.92, "driver": 0.95, "services": 0.97, "other": 0.98},
+        "expense": 1.02,
+        "recommendation": "Keep a rain buffer: outdoor work slows on heavy-rain days",
+    },
+    {
+        "name": "Northeast Monsoon",
+        "type": "weather",
+        "weather": "heavy_rain",
+        "dates": [(10, 15)],
+        "days_before": 0,
+        "days_after": 61,
+        "regions": ["south"],
+        "income": {"delivery": 0.88, "driver": 0.92, "services": 0.95, "other": 0.97},
+        "expense": 1.02,
+        "recommendation": "Plan for fewer working hours during the northeast monsoon",
+    },
+    {
+        "name": "Summer Heat",
+        "type": "weather",
+        "weather": "extreme_heat",
+        "dates": [(4, 15)],
+        "days_before": 0,
+        "days_after": 61,
+        "regions": ["north", "central", "west"],
+        "income": {"delivery": 0.90, "driver": 0.95, "services": 0.98, "other": 0.98},
+        "expense": 1.03,
+        "recommendation": "Shift work to mornings and evenings to avoid peak heat",
+    },
+    {
+        "name": "Wedding Season",
+        "type": "season",
+        "dates": [(11, 15)],
+        "days_before": 0,
+        "days_after": 105,
+        "regions": None,
+        "income": {"services": 1.20, "driver": 1.05, "delivery": 1.02, "other": 1.0},
+        "expense": 1.05,
+        "recommendation": "Wedding season demand is high: take bookings early and save the surplus",
+    },
+    {
+        "name": "Christmas and New Year",
+        "type": "festival",
+        "dates": [(12, 25)],
+        "days_before": 5,
+        "days_after": 7,
+        "regions": None,
+        "income": {"delivery": 1.15, "driver": 1.10, "services": 1.05, "other": 1.0},
+        "expense": 1.08,
+        "recommendation": "Year-end demand peaks: plan longer shifts and set aside holiday spending",
+    },
+    {
+        "name": "Pongal / Sankranti",
+        "type": "festival",
+        "dates": [(1, 14)],
+        "days_before": 1,
+        "days_after": 2,
+        "regions": ["south"],
+        "income": {"delivery": 1.05, "driver": 1.05, "services": 1.10, "other": 1.0},
+        "expense": 1.10,
+        "recommendation": "Budget for harvest festival spending before it starts",
+    },
+    {
+        "name": "Diwali",
+        "type": "festival",
+        "dates": {
+            2024: "2024-11-01", 2025: "2025-10-21", 2026: "2026-11-08", 2027: "2027-10-29",
+            2028: "2028-10-17", 2029: "2029-11-05", 2030: "2030-10-26",
+        },
+        "days_before": 14,
+        "days_after": 3,
+        "regions": None,
+        "income": {"delivery": 1.30, "driver": 1.15, "services": 1.20, "other": 1.10},
+        "expense": 1.25,
+        "recommendation": "Diwali brings peak demand and peak spending: save part of the festival income",
+    },
+    {
+        "name": "Holi",
+        "type": "festival",
+        "dates": {
+            2024: "2024-03-25", 2025: "2025-03-14", 2026: "2026-03-04", 2027: "2027-03-22",
+            2028: "2028-03-11", 2029: "2029-03-01", 2030: "2030-03-20",
+        },
+        "days_before": 3,
+        "days_after": 1,
+        "regions": ["north", "east", "west", "central"],
+        "income": {"delivery": 1.10, "driver": 1.05, "services": 1.05, "other": 1.0},
+        "expense": 1.08,
+        "recommendation": "Expect a short demand spike around Holi and a quiet festival day",
+    },
+    {
+        "name": "Eid al-Fitr",
+        "type": "festival",
+        "dates": {
+            2024: "2024-04-11", 2025: "2025-03-31", 2026: "2026-03-20", 2027: "2027-03-10",
+            2028: "2028-02-27", 2029: "2029-02-15", 2030: "2030-02-05",
+        },
+        "days_before": 5,
+        "days_after": 2,
+        "regions": None,
+        "income": {"delivery": 1.10, "driver": 1.05, "services": 1.10, "other": 1.0},
+        "expense": 1.10,
+        "recommendation": "Evening food delivery demand rises in the days before Eid",
+    },
+    {
+        "name": "Dussehra / Durga Puja",
+        "type": "festival",
+        "dates": {
+            2024: "2024-10-12", 2025: "2025-10-02", 2026: "2026-10-20", 2027: "2027-10-09",
+            2028: "2028-09-27", 2029: "2029-10-16", 2030: "2030-10-06",
+        },
+        "days_before": 9,
+        "days_after": 1,
+        "regions": None,
+        "income": {"delivery": 1.15, "driver": 1.10, "services": 1.15, "other": 1.05},
+        "expense": 1.12,
+        "recommendation": "Navratri and Puja demand is strong: plan shifts and festival expenses together",
+    },
+    {
+        "name": "Ganesh Chaturthi",
+        "type": "festival",
+        "dates": {
+            2024: "2024-09-07", 2025: "2025-08-27", 2026: "2026-09-14", 2027: "2027-09-04",
+            2028: "2028-08-23", 2029: "2029-09-11", 2030: "2030-09-01",
+        },
+        "days_before": 2,
+        "days_after": 10,
+        "regions": ["west", "south"],
+        "income": {"delivery": 1.08, "driver": 1.10, "services": 1.10, "other": 1.0},
+        "expense": 1.08,
+        "recommendation": "Ganeshotsav traffic and demand rise: plan routes and festival spending",
+    },
+]
+
+# Days a compiled calendar extends past 31 Dec, so windows crossing the year end land in both years
+YEAR_OVERLAP_DAYS = 120
+
+
+def region_for_state(state: Optional[str]) -> str:
+    """Region of an Indian state name (DEFAULT_REGION when unknown)"""
+    key = (state or "").strip().lower().replace("&", "and")
+    for region, states in REGION_STATES.items():
+        if key in states:
+            return region
+    return DEFAULT_REGION
+
+
+def group_for_occupation(occupation: Optional[str]) -> str:
+    """Occupation group of a free-text occupation"""
+    text = (occupation or "").lower()
+    for group, keywords in OCCUPATION_KEYWORDS.items():
+        if any(keyword in text for keyword in keywords):
+            return group
+    return "other"
+
+
+def _day_number(d: date) -> int:
+    return int(np.datetime64(d, "D").astype(np.int64))
+
+
+def missing_lunar_dates(year: int) -> List[str]:
+    """Names of the lunar festivals with no date listed for a year"""
+    return [event["name"] for event in EVENTS if isinstance(event["dates"], dict) and year not in event["dates"]]
+
+
+def event_windows(event: Dict[str, Any], year: int) -> List[Tuple[date, date, date]]:
+    """
+    (anchor, first day, last day) of an event's windows anchored in a year
+
+    Lunar festivals without a known date for the year have no window (see
+    missing_lunar_dates).
+    """
+    dates = event["dates"]
+    if isinstance(dates, dict):
+        anchors = [date.fromisoformat(dates[year])] if year in dates else []
+    else:
+        anchors = [date(year, month, day) for month, day in dates]
+    return [
+        (anchor, anchor - timedelta(days=event["days_before"]), anchor + timedelta(days=event["days_after"]))
+        for anchor in anchors
+    ]
+
+
+@lru_cache(maxsize=8)
+def build_calendar(year: int) -> Dict[str, Any]:
+    """
+    Compile the calendar for one year
+
+    Covers 1 Jan of the year through YEAR_OVERLAP_DAYS into the next, and
+    includes windows anchored in the previous year that spill into it.
+
+    Returns:
+        dict with start_day (day number of 1 Jan), income (regions x groups x
+        days), expense (regions x days) and events (regions x days bitmask,
+        bit i = EVENTS[i])
+    """
+    missing = missing_lunar_dates(year)
+    if missing:
+        print(f"[Calendar] No {year} dates for {', '.join(missing)}; forecasts for {year} "
+              f"get no uplift from them until EVENTS is extended")
+
+    start = date(year, 1, 1)
+    start_day = _day_number(start)
+    n_days = _day_number(date(year + 1, 1, 1)) - start_day + YEAR_OVERLAP_DAYS
+
+    income = np.ones((len(REGIONS), len(OCCUPATION_GROUPS), n_days))
+    expense = np.ones((len(REGIONS), n_days))
+    events = np.zeros((len(REGIONS), n_days), dtype=np.int64)
+
+    for bit, event in enumerate(EVENTS):
+        region_rows = [REGIONS.index(r) for r in event["regions"]] if event["regions"] else list(range(len(REGIONS)))
+        group_factors = np.array([
+            event["income"].get(group, event["income"].get("other", 1.0)) for group in OCCUPATION_GROUPS
+        ])
+        for anchor_year in (year - 1, year, year + 1):
+            for _, first, last in event_windows(event, anchor_year):
+                lo = max(_day_number(first) - start_day, 0)
+                hi = min(_day_number(last) - start_day + 1, n_days)
+                if lo >= hi:
+                    continue
+                for r in region_rows:
+                    income[r, :, lo:hi] *= group_factors[:, None]
+                    expense[r, lo:hi] *= event["expense"]
+                    events[r, lo:hi] |= 1 << bit
+
+    return {"year": year, "start_day": start_day, "income": income, "expense": expense, "events": events}
+
+
+def _years_of(day_numbers: np.ndarray) -> np.ndarray:
+    return day_numbers.astype("datetime64[D]").astype("datetime64[Y]").astype(np.int64) + 1970
+
+
+def seasonal_multipliers(
+    day_numbers: np.ndarray,
+    regions: Any = DEFAULT_REGION,
+    groups: Any = "other",
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Income and expense multipliers for an array of dates
+
+    Args:
+        day_numbers: Dates as days since epoch (any shape)
+        regions: Region name, or array of region indexes broadcastable to day_numbers
+        groups: Occupation group name, or array of group indexes broadcastable to day_numbers
+
+    Returns:
+        (income multipliers, expense multipliers), each shaped like day_numbers
+    """
+    day_numbers = np.asarray(day_numbers, dtype=np.int64)
+    region_index = np.asarray(REGIONS.index(regions) if isinstance(regions, str) else regions)
+    group_index = np.asarray(OCCUPATION_GROUPS.index(groups) if isinstance(groups, str) else groups)
+    day_numbers, region_index, group_index = np.broadcast_arrays(day_numbers, region_index, group_index)
+
+    income = np.ones(day_numbers.shape)
+    expense = np.ones(day_numbers.shape)
+    years = _years_of(day_numbers)
+    for year in np.unique(years):
+        calendar = build_calendar(int(year))
+        mask = years == year
+        offset = day_numbers[mask] - calendar["start_day"]
+        income[mask] = calendar["income"][region_index[mask], group_index[mask], offset]
+        expense[mask] = calendar["expense"][region_index[mask], offset]
+    return income, expense
+
+
+def upcoming_events(
+    region: str,
+    group: str,
+    as_of: Optional[date] = None,
+    days: int = 30,
+) -> List[Dict[str, Any]]:
+    """
+    Events active in the next `days` days for a region and occupation group
+
+    Args:
+        region: Region name (see region_for_state)
+        group: Occupation group (see group_for_occupation)
+        as_of: First day of the look-ahead (defaults to today)
+        days: Look-ahead length
+
+    Returns:
+        List of context_events-shaped dicts, ordered by event_date
+    """
+    as_of = as_of or date.today()
+    horizon_end = as_of + timedelta(days=days - 1)
+    found = []
+    for event in EVENTS:
+        if event["regions"] and region not in event["regions"]:
+            continue
+        for anchor_year in range(as_of.year - 1, horizon_end.year + 1):
+            for anchor, first, last in event_windows(event, anchor_year):
+                if last < as_of or first > horizon_end:
+                    continue
+                income_factor = event["income"].get(group, event["income"].get("other", 1.0))
+                found.append({
+                    "event_type": event["type"],
+                    "event_name": event["name"],
+                    "event_date": anchor.isoformat(),
+                    "window_start": first.isoformat(),
+                    "window_end": last.isoformat(),
+                    "weather_condition": event.get("weather"),
+                    "weather_impact_factor": income_factor if event["type"] == "weather" else None,
+                    "income_impact_percentage": round((income_factor - 1) * 100, 1),
+                    "occupation_impact": {
+                        g: round((event["income"].get(g, event["income"].get("other", 1.0)) - 1) * 100, 1)
+                        for g in OCCUPATION_GROUPS
+                    },
+                    "recommendations": [event["recommendation"]],
+                })
+    return sorted(found, key=lambda e: (e["event_date"], e["event_name"]))
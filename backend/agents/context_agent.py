@@ -1,7 +1,8 @@
 """
 Context Intelligence Engine Agent
 Enriches data with weather, festivals, and external events
-Writes to: Enriches existing records with contextual data
+Events come from the precomputed seasonal context calendar; the LLM only adds an optional narrative
+Writes to: context_events table
 """
 
 import asyncio
@@ -9,10 +10,20 @@ import json
 from datetime import datetime
 import os
 import sys
+from typing import Optional
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from autogen_runtime import run_autogen_mcp_task
+from autogen_runtime import run_autogen_mcp_task, write_agent_data
+from calendar_engine import group_for_occupation, region_for_state, upcoming_events
+from postgrest_client import get_postgrest_client
+from user_snapshot import UserSnapshot
+
+# Set CONTEXT_AGENT_LLM_NARRATIVE=true to also ask the LLM to explain the upcoming events
+LLM_NARRATIVE = os.getenv("CONTEXT_AGENT_LLM_NARRATIVE", "false").lower() == "true"
+
+# Days ahead to look for seasons and festivals
+LOOKAHEAD_DAYS = 30
 
 
 class ContextIntelligenceAgent:
@@ -25,48 +36,23 @@ class ContextIntelligenceAgent:
     def _create_system_prompt(self) -> str:
         return """You are a Context Intelligence Engine for understanding external factors affecting gig worker income.
 
-Your task is to enrich financial data with contextual information.
-
-**What you do:**
-1. Read user location from user_profiles
-2. Identify relevant contextual factors:
-   - Weather patterns (monsoon, extreme heat affecting outdoor work)
-   - Cultural festivals (Diwali, Eid, Christmas - increased spending/earning)
-   - Seasonal events (wedding season, holiday season)
-   - Economic events (policy changes, fuel price hikes)
-3. Update income_patterns table with context fields
-4. Update income_forecasts with contextual adjustments
-5. Log your actions to agent_logs table
-
-**Contextual Factors for India:**
-- Monsoon season (June-September): Reduced outdoor gig work
-- Festival seasons: Diwali (Oct/Nov), Holi (Mar), Eid (varies)
-- Wedding season (Nov-Feb): Increased catering, decoration work
-- Summer (Apr-Jun): Heat affects delivery work
-- Harvest seasons: Regional variations
-
-**Available MCP Tools:**
-- mcp__supabase-postgres__postgrestRequest: Execute database queries
-- mcp__supabase-postgres__sqlToRest: Convert SQL to REST API calls
-
-**Important:**
-- You may not have access to live weather APIs
-- Use general seasonal knowledge for India
-- Focus on well-known cultural events
-- Be conservative with impact estimates
-
-**Output:**
-Enrich existing records by updating:
-- income_patterns.weather_impact
-- income_patterns.seasonal_factors
-- income_forecasts with contextual adjustments"""
-
-    async def analyze_user(self, user_id: str) -> dict:
+You are given the seasons and festivals affecting the user over the next 30 days,
+taken from a precomputed calendar for their region and occupation, with the
+expected change in income for each event.
+Do not change the numbers and do not write to the database.
+
+Explain the outlook to the gig worker in 3-5 short sentences:
+- Which events matter most for their work
+- Whether to expect more or less income, and when
+- One thing to prepare before the busiest or slowest stretch"""
+
+    async def analyze_user(self, user_id: str, snapshot: Optional[UserSnapshot] = None) -> dict:
         """
         Add contextual intelligence for a specific user
 
         Args:
             user_id: UUID of the user to analyze
+            snapshot: Per-run snapshot of the user's input rows (read from the database if None)
 
         Returns:
             dict with analysis results and success status
@@ -74,27 +60,32 @@ Enrich existing records by updating:
         print(f"[Context Agent] Starting analysis for user {user_id}")
 
         try:
-            prompt = f"""Add contextual intelligence for user {user_id}.
-
-Steps:
-1. Read user_profiles to get location and occupation
-2. Identify relevant contextual factors (weather, festivals, seasons)
-3. Update income_patterns with weather_impact and seasonal_factors
-4. Note any upcoming events that may affect income
-5. Log to agent_logs table
-
-User ID: {user_id}
+            users = await (snapshot or get_postgrest_client()).select(
+                "users", filters={"user_id": user_id}, columns="state,occupation"
+            )
+            user = users[0] if users else {}
+            region = region_for_state(user.get("state"))
+            group = group_for_occupation(user.get("occupation"))
 
-Please execute this analysis and report what context you added."""
+            events = upcoming_events(region, group, days=LOOKAHEAD_DAYS)
+            print(f"[Context Agent] {len(events)} events in the next {LOOKAHEAD_DAYS} days "
+                  f"(region {region}, occupation group {group})")
 
-            result = await run_autogen_mcp_task(
-                agent_name="context_agent",
-                system_prompt=self.system_prompt,
-                task=prompt,
-                user_id=user_id,
-                use_azure=True
+            written = await write_agent_data(
+                user_id, "context_agent", {"context_events": [dict(event) for event in events]}
             )
 
+            result = {"region": region, "occupation_group": group, "context_events": events, "written": written}
+            if LLM_NARRATIVE and events:
+                result["narrative"] = await run_autogen_mcp_task(
+                    agent_name="context_narrative",
+                    system_prompt=self.system_prompt,
+                    task=f"Upcoming events for user {user_id} ({user.get('occupation') or 'gig worker'}, "
+                         f"{user.get('state') or 'India'}):\n{json.dumps(events, indent=2)}",
+                    user_id=user_id,
+                    use_azure=True
+                )
+
             print(f"[Context Agent] Analysis complete for user {user_id}")
 
             return {
@@ -1,17 +1,31 @@
 """
 Financial Health Agent
 Evaluates overall financial health and creates comprehensive financial score
+Scores come from the health engine; the LLM only adds an optional narrative
 Writes to: financial_health table
 """
 import asyncio
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 import sys
+from typing import Optional
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from autogen_runtime import run_autogen_mcp_task
+from autogen_runtime import AGENT_OUTPUT_UPSERT_KEYS, build_agent_rows, run_autogen_mcp_task, write_agent_data
+from health_engine import HISTORY_DAYS, compute_financial_health
+from postgrest_client import get_postgrest_client
+from user_snapshot import UserSnapshot
+
+# Set FINANCIAL_AGENT_LLM_NARRATIVE=true to also ask the LLM to explain the score
+LLM_NARRATIVE = os.getenv("FINANCIAL_AGENT_LLM_NARRATIVE", "false").lower() == "true"
+
+# Rows per PostgREST page / array insert in batch mode
+BATCH_PAGE_SIZE = 1000
+
+TRANSACTION_COLUMNS = "user_id,amount,transaction_type,category,source,transaction_date"
+PROFILE_COLUMNS = "user_id,current_emergency_fund,monthly_expenses_avg,debt_obligations,risk_tolerance"
 
 
 class FinancialHealthAgent:
@@ -24,125 +38,52 @@ class FinancialHealthAgent:
     def _create_system_prompt(self) -> str:
         return """You are a Financial Health Evaluator for gig workers.
 
-Your task is to evaluate overall financial health and create a comprehensive financial score, outputting structured JSON for the financial_health table.
-
-**CRITICAL: You must output ONLY valid JSON that matches the financial_health table schema:**
-
-```json
-{
-  "financial_health": {
-    "overall_score": 72,
-    "health_category": "good",
-    "savings_health": {
-      "score": 85,
-      "emergency_fund_months": 4.2,
-      "savings_rate": 0.18,
-      "retirement_on_track": true
-    },
-    "debt_health": {
-      "score": 60,
-      "debt_to_income": 0.28,
-      "total_debt": 150000.00,
-      "debt_trend": "decreasing"
-    },
-    "income_health": {
-      "score": 75,
-      "income_stability": "moderate",
-      "income_growth": 0.12,
-      "diversification_score": 0.4
-    },
-    "spending_health": {
-      "score": 80,
-      "budget_adherence": 0.85,
-      "discretionary_ratio": 0.22,
-      "essential_ratio": 0.78
-    },
-    "investment_health": {
-      "score": 65,
-      "portfolio_diversity": 0.3,
-      "risk_appetite": "moderate",
-      "investment_return": 0.08
-    },
-    "key_strengths": [
-      "Strong emergency fund",
-      "Good savings rate",
-      "Budget discipline"
-    ],
-    "improvement_areas": [
-      "Increase income diversification",
-      "Reduce high-interest debt",
-      "Start retirement planning"
-    ],
-    "recommendations": [
-      "Build 6-month emergency fund",
-      "Diversify income sources",
-      "Consider debt consolidation"
-    ],
-    "next_review_date": "2026-03-28"
-  }
-}
-```
-
-**What you do:**
-1. Read transactions, budgets, income_patterns, risk_assessments
-2. Calculate 5 health dimensions: savings, debt, income, spending, investment
-3. Determine overall_score (0-100) and health_category
-4. Identify key strengths and improvement areas
-5. Generate actionable recommendations
-6. Set next_review_date (3 months from now)
-7. Output ONLY the JSON format above - no explanations
-
-**Health Category Thresholds:**
-- 0-40: "poor"
-- 41-60: "fair"
-- 61-80: "good"
-- 81-100: "excellent"
-
-**Scoring Guidelines:**
-- Savings: Emergency fund coverage, savings rate, retirement progress
-- Debt: Debt-to-income ratio, high-interest debt, debt trend
-- Income: Stability, growth trend, diversification
-- Spending: Budget adherence, essential vs discretionary ratio
-- Investment: Diversity, returns, risk alignment
-
-**Database Schema Requirements:**
-- overall_score: Number 0-100
-- health_category: "poor", "fair", "good", "excellent"
-- savings_health/debt_health/income_health/spending_health/investment_health: Objects with score and metrics
-- key_strengths/improvement_areas/recommendations: Arrays of strings
-- next_review_date: Date string YYYY-MM-DD
-
-**Output ONLY the JSON object. No other text.**"""
-
-    async def analyze_user(self, user_id: str) -> dict:
-        """Evaluate financial health for a specific user"""
+You are given a financial health score that has already been calculated from the
+user's transactions and profile: five 0-100 sub-scores (savings, debt, income,
+spending, investment), the overall score and category, strengths and improvement areas.
+Do not change the numbers and do not write to the database.
+
+Explain the result to the gig worker in 3-5 short sentences:
+- Their overall score and what it means
+- Their strongest and weakest area
+- The one change that would raise the score the most"""
+
+    async def analyze_user(self, user_id: str, snapshot: Optional[UserSnapshot] = None) -> dict:
+        """
+        Evaluate financial health for a specific user
+
+        Args:
+            user_id: UUID of the user to analyze
+            snapshot: Per-run snapshot of the user's input rows (read from the database if None)
+
+        Returns:
+            dict with analysis results and success status
+        """
         print(f"[Financial Health Agent] Starting analysis for user {user_id}")
 
         try:
-            prompt = f"""Evaluate financial health for user {user_id}.
-
-Steps:
-1. Read transactions for spending patterns
-2. Read budgets for budget adherence
-3. Read income_patterns for income stability
-4. Read risk_assessments for risk factors
-5. Calculate 5 health dimensions
-6. Generate overall financial health score
-7. Provide recommendations
-8. Write to financial_health table
-9. Log to agent_logs table
-
-User ID: {user_id}
-
-Please execute this analysis and report the financial health assessment."""
-
-            result = await run_autogen_mcp_task(
-                agent_name="financial_agent",
-                system_prompt=self.system_prompt,
-                task=prompt,
-                user_id=user_id,
-                use_azure=True
+            client = snapshot or get_postgrest_client()
+            start = (datetime.now() - timedelta(days=HISTORY_DAYS)).date().isoformat()
+            transactions, profiles = await asyncio.gather(
+                client.select("transactions", filters={"user_id": user_id, "transaction_date": f"gte.{start}"},
+                              columns=TRANSACTION_COLUMNS),
+                client.select("user_profiles", filters={"user_id": user_id}, columns=PROFILE_COLUMNS),
             )
+            profiles_by_user = {user_id: profiles[0]} if profiles else {}
+            health = compute_financial_health(transactions, profiles_by_user, [user_id])[user_id]
+            print(f"[Financial Health Agent] Score {health['overall_score']}/100 ({health['health_category']})")
+
+            written = await write_agent_data(user_id, "financial_agent", {"financial_health": dict(health)})
+
+            result = {"financial_health": health, "written": written}
+            if LLM_NARRATIVE:
+                result["narrative"] = await run_autogen_mcp_task(
+                    agent_name="financial_narrative",
+                    system_prompt=self.system_prompt,
+                    task=f"Financial health for user {user_id}:\n{json.dumps(health, indent=2)}",
+                    user_id=user_id,
+                    use_azure=True
+                )
 
             print(f"[Financial Health Agent] Analysis complete for user {user_id}")
 
@@ -164,6 +105,56 @@ Please execute this analysis and report the financial health assessment."""
                 "timestamp": datetime.now().isoformat()
             }
 
+    async def analyze_all_users(self) -> dict:
+        """
+        Score every active user in one vectorised pass
+
+        Returns:
+            dict with user count, write errors and timing
+        """
+        started = datetime.now()
+        client = get_postgrest_client()
+        start = (started - timedelta(days=HISTORY_DAYS)).date().isoformat()
+
+        users, transactions, profiles = await asyncio.gather(
+            client.select_all("users", filters={"is_active": "is.true"}, columns="user_id",
+                              order="user_id", page_size=BATCH_PAGE_SIZE),
+            client.select_all("transactions", filters={"transaction_date": f"gte.{start}"},
+                              columns=TRANSACTION_COLUMNS, order="user_id,transaction_id", page_size=BATCH_PAGE_SIZE),
+            client.select_all("user_profiles", columns=PROFILE_COLUMNS, order="user_id", page_size=BATCH_PAGE_SIZE),
+        )
+        user_ids = [user["user_id"] for user in users]
+        scores = compute_financial_health(
+            transactions, {profile["user_id"]: profile for profile in profiles}, user_ids
+        )
+
+        rows = []
+        for user_id, health in scores.items():
+            rows.extend(build_agent_rows(user_id, "financial_agent", {"financial_health": health})["financial_health"])
+
+        reports = await asyncio.gather(*(
+            client.bulk_insert(
+                "financial_health", rows[i:i + BATCH_PAGE_SIZE],
+                on_conflict=AGENT_OUTPUT_UPSERT_KEYS["financial_health"]
+            )
+            for i in range(0, len(rows), BATCH_PAGE_SIZE)
+        ))
+        inserted = sum(report["inserted"] for report in reports)
+        errors = sum(len(report["errors"]) for report in reports)
+
+        elapsed = (datetime.now() - started).total_seconds()
+        print(f"[Financial Health Agent] Batch: scored {len(scores)} users in {elapsed:.1f}s")
+
+        return {
+            "success": errors == 0,
+            "agent": "financial_health",
+            "users": len(scores),
+            "inserted": inserted,
+            "errors": errors,
+            "elapsed_seconds": elapsed,
+            "timestamp": datetime.now().isoformat()
+        }
+
 
 async def main():
     """Test the financial health agent"""
@@ -0,0 +1,515 @@
+"""
+Goal Projection Engine
+Monte Carlo goal simulator behind the Financial Goals and Savings & Investment Agents
+
+Each month of each simulated path draws the user's surplus (income minus
+expenses, from the spread of their weekly net cash flow) and the return of
+the instrument each goal is saved in (log-normal, from the rates below).
+The surplus funds goals in priority order up to each goal's monthly target,
+and a goal stops taking money once it reaches its target. Completion dates,
+milestones and on-time probabilities are read off the paths. Paths are
+seeded per user, so the same inputs always give the same projection.
+"""
+
+import calendar
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from budget_engine import weekly_series
+from forecast_engine import user_seed
+from pattern_engine import ROLLING_DAYS, to_day_numbers, window_start
+
+
+N_PATHS = 2000
+HISTORY_DAYS = 91  # 13 complete weeks
+MAX_MONTHS = 360
+MIN_MONTHS = 24
+
+# Instrument -> (expected annual return, annual volatility)
+INSTRUMENTS = {
+    "savings_account": (0.030, 0.00),
+    "recurring_deposit": (0.075, 0.00),
+    "ppf": (0.071, 0.00),
+    "fixed_deposit": (0.065, 0.00),
+    "sukanya_samriddhi": (0.082, 0.00),
+    "nps": (0.090, 0.10),
+    "index_sip": (0.110, 0.16),
+    "gold": (0.080, 0.15),
+}
+INSTRUMENT_ALIASES = {
+    "rd": "recurring_deposit", "fd": "fixed_deposit", "sip": "index_sip", "mutual_fund": "index_sip",
+    "index_fund": "index_sip", "elss": "index_sip", "ssy": "sukanya_samriddhi", "savings": "savings_account",
+}
+
+# Default instrument per goal type; long goals (INVEST_AFTER_MONTHS+) that tolerate risk go to index SIPs
+GOAL_INSTRUMENTS = {
+    "emergency_fund": "savings_account",
+    "debt_repayment": "savings_account",
+    "asset_purchase": "recurring_deposit",
+    "healthcare": "recurring_deposit",
+    "lifestyle": "recurring_deposit",
+    "business": "recurring_deposit",
+    "education": "ppf",
+    "retirement": "ppf",
+}
+LONG_TERM_GOALS = {"education", "retirement", "business", "asset_purchase"}
+INVEST_AFTER_MONTHS = 60
+
+MILESTONE_FRACTIONS = (0.25, 0.5, 0.75, 1.0)
+MILESTONE_NAMES = {0.25: "Quarter Way", 0.5: "Halfway There", 0.75: "Three Quarters", 1.0: "Goal Reached"}
+
+# Goal priority words (1 = funded first); anything unparseable ranks last
+PRIORITY_RANKS = {"critical": 1, "urgent": 1, "high": 2, "medium": 3, "low": 4}
+LOWEST_PRIORITY = 5
+
+# On-time probability needed for "on_track", and below which a plan is "unrealistic"
+ON_TRACK_PROBABILITY = 0.8
+UNREALISTIC_PROBABILITY = 0.3
+
+
+def add_months(start: date, months: int) -> date:
+    """Same day of month, months later (clamped to the month's length)"""
+    year, month = divmod(start.month - 1 + months, 12)
+    year, month = start.year + year, month + 1
+    return date(year, month, min(start.day, calendar.monthrange(year, month)[1]))
+
+
+def months_until(start: date, end: date) -> int:
+    """Whole months from start to end (at least 1)"""
+    months = (end.year - start.year) * 12 + end.month - start.month - (end.day < start.day)
+    return max(months, 1)
+
+
+def instrument_for(goal: Dict[str, Any], months: Optional[int], risk_tolerance: Optional[str] = None) -> str:
+    """Instrument a goal is saved in: explicit choice, else by goal type, horizon and risk appetite"""
+    chosen = (goal.get("instrument") or "").strip().lower().replace(" ", "_")
+    chosen = INSTRUMENT_ALIASES.get(chosen, chosen)
+    if chosen in INSTRUMENTS:
+        return chosen
+    goal_type = goal.get("goal_type") or "savings"
+    if (goal_type in LONG_TERM_GOALS and months is not None and months >= INVEST_AFTER_MONTHS
+            and (risk_tolerance or "moderate") != "low"):
+        return "index_sip"
+    return GOAL_INSTRUMENTS.get(goal_type, "recurring_deposit")
+
+
+def priority_rank(value: Any) -> int:
+    """Goal priority as 1-5, from a number or a word like "high" (5 when unknown)"""
+    if isinstance(value, str) and value.strip().lower() in PRIORITY_RANKS:
+        return PRIORITY_RANKS[value.strip().lower()]
+    try:
+        return min(max(int(float(value)), 1), LOWEST_PRIORITY)
+    except (TypeError, ValueError, OverflowError):
+        return LOWEST_PRIORITY
+
+
+def required_contribution(current: float, target: float, months: int, annual_return: float) -> float:
+    """Level monthly contribution that reaches target in months at the expected return"""
+    rate = (1 + annual_return) ** (1 / 12) - 1
+    growth = (1 + rate) ** months
+    shortfall = target - current * growth
+    if shortfall <= 0:
+        return 0.0
+    return shortfall * rate / (growth - 1) if rate > 0 else shortfall / months
+
+
+def surplus_stats(rows: List[Dict[str, Any]], as_of: Optional[date] = None) -> Dict[str, float]:
+    """
+    Monthly surplus mean and standard deviation from one user's transactions
+
+    Weekly net cash flow (income - expenses) over the last 13 weeks is scaled
+    to 30 days; weeks are treated as independent.
+    """
+    as_of = as_of or datetime.now().date()
+    n_weeks = HISTORY_DAYS // ROLLING_DAYS
+    start_day = window_start(as_of - timedelta(days=1), n_weeks * ROLLING_DAYS)
+    signed = np.array([
+        float(r.get("amount") or 0) * (1 if r.get("transaction_type") == "income" else -1) for r in rows
+    ])
+    weekly = weekly_series(to_day_numbers(r["transaction_date"] for r in rows), signed, start_day, n_weeks)[0]
+    weeks_per_month = 30 / ROLLING_DAYS
+    return {
+        "monthly_surplus": float(weekly.mean() * weeks_per_month),
+        "surplus_std": float(weekly.std() * np.sqrt(weeks_per_month)),
+    }
+
+
+def simulate_goals(
+    current: np.ndarray,
+    target: np.ndarray,
+    monthly_target: np.ndarray,
+    annual_return: np.ndarray,
+    annual_volatility: np.ndarray,
+    surplus_mean: np.ndarray,
+    surplus_std: np.ndarray,
+    seeds: List[int],
+    n_months: int,
+    n_paths: int = N_PATHS,
+) -> Dict[str, np.ndarray]:
+    """
+    Simulate (users x goals) goals, funded in column order from each user's surplus
+
+    Args:
+        current / target / monthly_target: (users x goals) amounts; padding
+            goals have target 0 and monthly_target 0
+        annual_return / annual_volatility: (users x goals) instrument parameters
+        surplus_mean / surplus_std: Monthly surplus per user
+        seeds: RNG seed per user
+        n_months: Months to simulate
+        n_paths: Paths per user
+
+    Returns:
+        "reach_month": (fractions x users x goals x paths) first month each
+        milestone fraction is reached (n_months + 1 when never; 0 when already
+        reached) and "balance": (months x users x goals) median balance per month
+    """
+    n_users, n_goals = target.shape
+    rngs = [np.random.default_rng(seed) for seed in seeds]
+    sigma = annual_volatility / np.sqrt(12)
+    mu = np.log1p(annual_return) / 12 - sigma ** 2 / 2
+
+    balance = np.repeat(current[..., None], n_paths, axis=2).astype(np.float64)
+    # Relative tolerance so a plan that lands exactly on target isn't missed by rounding
+    thresholds = np.array(MILESTONE_FRACTIONS)[:, None, None, None] * target[None, ..., None] * (1 - 1e-9)
+    reach = np.where(balance[None] >= thresholds, 0, n_months + 1)
+    median_balance = np.zeros((n_months, n_users, n_goals))
+
+    for month in range(1, n_months + 1):
+        # Per-user draws keep a user's paths independent of who else is in the batch
+        z_surplus = np.stack([rng.standard_normal(n_paths) for rng in rngs])
+        z_return = np.stack([rng.standard_normal((n_goals, n_paths)) for rng in rngs])
+        remaining = np.maximum(surplus_mean[:, None] + surplus_std[:, None] * z_surplus, 0.0)
+
+        balance *= np.exp(mu[..., None] + sigma[..., None] * z_return)
+        for k in range(n_goals):
+            open_goal = balance[:, k] < thresholds[-1, :, k]
+            contribution = np.where(open_goal, np.minimum(monthly_target[:, k, None], remaining), 0.0)
+            balance[:, k] += contribution
+            remaining -= contribution
+
+        reached = balance[None] >= thresholds
+        reach = np.where(reached & (reach > n_months), month, reach)
+        median_balance[month - 1] = np.median(balance, axis=2)
+
+    return {"reach_month": reach, "balance": median_balance}
+
+
+def _percentile_date(months: np.ndarray, q: float, as_of: date, n_months: int) -> Optional[str]:
+    value = int(np.percentile(months, q, method="higher"))
+    return add_months(as_of, value).isoformat() if value <= n_months else None
+
+
+def goal_projection(
+    goal: Dict[str, Any],
+    reach: np.ndarray,
+    balance: np.ndarray,
+    target_month: Optional[int],
+    instrument: str,
+    contribution: float,
+    as_of: date,
+) -> Dict[str, Any]:
+    """
+    Format one goal's simulated paths as goal fields plus a projection block
+
+    The user's own target_date and monthly_target are left alone (they are
+    inputs to the next projection); the simulated contribution and
+    completion dates only go in the projection block.
+
+    Args:
+        goal: Goal row (goal_name, target_amount, current_amount, target_date, ...)
+        reach: (fractions x paths) month each milestone fraction was reached
+        balance: Median balance per month
+        target_month: Months until target_date (None without a target date)
+        instrument: Instrument the goal is saved in
+        contribution: Monthly contribution used in the simulation
+        as_of: Simulation start
+    """
+    n_months = len(balance)
+    target = float(goal.get("target_amount") or 0)
+    current = float(goal.get("current_amount") or 0)
+    completion = reach[-1]
+    horizon = target_month or n_months
+    annual_return = INSTRUMENTS[instrument][0]
+
+    milestones = []
+    next_open = True
+    for f, months in zip(MILESTONE_FRACTIONS, reach):
+        amount = round(target * f, 2)
+        if current >= amount:
+            status = "completed"
+        else:
+            status = "in_progress" if next_open else "not_started"
+            next_open = False
+        by_month = max(int(np.ceil(horizon * f)), 1)
+        milestones.append({
+            "milestone_name": MILESTONE_NAMES[f],
+            "target_amount": amount,
+            "target_date": _percentile_date(months, 50, as_of, n_months),
+            "probability": round(float(np.mean(months <= by_month)), 2),
+            "status": status,
+        })
+
+    on_time = float(np.mean(completion <= target_month)) if target_month else None
+    at_target = float(balance[min(horizon, n_months) - 1]) if n_months else current
+    status = goal.get("status") or "not_started"
+    if status != "paused":
+        status = "completed" if current >= target > 0 else "in_progress" if current > 0 else "not_started"
+
+    return {
+        "progress_percentage": round(min(current / target, 1.0) * 100, 2) if target else 0,
+        "status": status,
+        "milestones": milestones,
+        "projection": {
+            "instrument": instrument,
+            "expected_return": round(annual_return * 100, 2),
+            "monthly_contribution": round(contribution, 2),
+            "completion_date_p10": _percentile_date(completion, 10, as_of, n_months),
+            "completion_date_p50": _percentile_date(completion, 50, as_of, n_months),
+            "completion_date_p90": _percentile_date(completion, 90, as_of, n_months),
+            "probability_on_time": round(on_time, 2) if on_time is not None else None,
+            "probability_within_horizon": round(float(np.mean(completion <= n_months)), 2),
+            "required_monthly_contribution": round(
+                required_contribution(current, target, target_month, annual_return), 2
+            ) if target_month else None,
+            "expected_balance_at_target_date": round(at_target, 2),
+        },
+    }
+
+
+def project_goals(
+    goals: List[Dict[str, Any]],
+    monthly_surplus: float,
+    surplus_std: float,
+    seed: int,
+    risk_tolerance: Optional[str] = None,
+    as_of: Optional[date] = None,
+    n_paths: int = N_PATHS,
+) -> Dict[str, Any]:
+    """
+    Project one user's goals (priority 1 funded first)
+
+    Goals without a monthly_target get the level contribution that meets
+    their target_date at the instrument's expected return; goals with neither
+    take whatever surplus is left, and report that residual (surplus minus
+    the contributions of higher-priority goals) as their monthly_contribution,
+    so monthly_required counts the surplus at most once.
+
+    Returns:
+        {"goals": goal dicts updated with milestones, progress, status and
+        "projection"; "overall_summary": {...}}
+    """
+    as_of = as_of or datetime.now().date()
+    goals = [{**g, "priority": priority_rank(g.get("priority"))} for g in goals]
+    goals = sorted(goals, key=lambda g: g["priority"])
+    target_months = [
+        months_until(as_of, datetime.strptime(str(g["target_date"])[:10], "%Y-%m-%d").date())
+        if g.get("target_date") else None
+        for g in goals
+    ]
+    instruments = [instrument_for(g, m, risk_tolerance) for g, m in zip(goals, target_months)]
+
+    monthly_targets = []
+    for goal, months, instrument in zip(goals, target_months, instruments):
+        planned = goal.get("monthly_target")
+        if planned:
+            monthly_targets.append(float(planned))
+        elif months:
+            monthly_targets.append(required_contribution(
+                float(goal.get("current_amount") or 0), float(goal.get("target_amount") or 0),
+                months, INSTRUMENTS[instrument][0]
+            ))
+        else:
+            monthly_targets.append(float("inf"))
+
+    known = [m for m in target_months if m]
+    n_months = int(min(max(2 * max(known, default=MAX_MONTHS // 2), MIN_MONTHS), MAX_MONTHS))
+    row = lambda values: np.array([values], dtype=np.float64)  # noqa: E731
+    sim = simulate_goals(
+        current=row([float(g.get("current_amount") or 0) for g in goals]),
+        target=row([float(g.get("target_amount") or 0) for g in goals]),
+        monthly_target=row(monthly_targets),
+        annual_return=row([INSTRUMENTS[i][0] for i in instruments]),
+        annual_volatility=row([INSTRUMENTS[i][1] for i in instruments]),
+        surplus_mean=np.array([monthly_surplus]),
+        surplus_std=np.array([surplus_std]),
+        seeds=[seed],
+        n_months=n_months,
+        n_paths=n_paths,
+    )
+
+    projected = []
+    residual = max(monthly_surplus, 0.0)
+    for k, goal in enumerate(goals):
+        planned = monthly_targets[k] if np.isfinite(monthly_targets[k]) else residual
+        if float(goal.get("current_amount") or 0) < float(goal.get("target_amount") or 0):
+            residual = max(residual - planned, 0.0)
+        projected.append({**goal, **goal_projection(
+            goal, sim["reach_month"][:, 0, k], sim["balance"][:, 0, k], target_months[k],
+            instruments[k], planned, as_of
+        )})
+
+    on_time = [g["projection"]["probability_on_time"] for g in projected if g["projection"]["probability_on_time"] is not None]
+    worst = min(on_time, default=1.0)
+    required = sum(g["projection"]["monthly_contribution"] for g in projected if g.get("status") != "completed")
+    return {
+        "goals": projected,
+        "overall_summary": {
+            "total_goals": len(projected),
+            "total_target": round(sum(float(g.get("target_amount") or 0) for g in goals), 2),
+            "total_saved": round(sum(float(g.get("current_amount") or 0) for g in goals), 2),
+            "monthly_required": round(required, 2),
+            "monthly_available": round(max(monthly_surplus, 0.0), 2),
+            "feasibility": (
+                "on_track" if worst >= ON_TRACK_PROBABILITY
+                else "unrealistic" if worst < UNREALISTIC_PROBABILITY
+                else "challenging_but_achievable"
+            ),
+        },
+        "confidence_score": round(float(np.mean(on_time)), 2) if on_time else None,
+    }
+
+
+def project_user_goals(
+    user_id: str,
+    goals: List[Dict[str, Any]],
+    transactions: List[Dict[str, Any]],
+    profile: Optional[Dict[str, Any]] = None,
+    as_of: Optional[date] = None,
+    n_paths: int = N_PATHS,
+) -> Dict[str, Any]:
+    """
+    Project a user's goals from their recent transactions
+
+    Falls back to the profile's income range and average expenses when there
+    is no transaction history.
+    """
+    stats = surplus_stats(transactions, as_of)
+    profile = profile or {}
+    if not transactions and profile:
+        incomes = [float(v) for v in (profile.get("monthly_income_min"), profile.get("monthly_income_max")) if v]
+        income = sum(incomes) / len(incomes) if incomes else 0.0
+        stats = {
+            "monthly_surplus": income - float(profile.get("monthly_expenses_avg") or 0),
+            "surplus_std": abs(incomes[-1] - incomes[0]) / 2 if len(incomes) == 2 else 0.0,
+        }
+    return project_goals(
+        goals, stats["monthly_surplus"], stats["surplus_std"], user_seed(user_id),
+        risk_tolerance=profile.get("risk_tolerance"), as_of=as_of, n_paths=n_paths,
+    )
+
+
+def project_investment(
+    monthly_amount: float,
+    instrument: str,
+    months: int,
+    seed: int,
+    n_paths: int = N_PATHS,
+) -> Dict[str, float]:
+    """
+    Value of a fixed monthly investment after months, as p10/p50/p90
+
+    Returns:
+        {"invested", "value_p10", "value_p50", "value_p90"}
+    """
+    annual_return, volatility = INSTRUMENTS[instrument]
+    sigma = volatility / np.sqrt(12)
+    mu = np.log1p(annual_return) / 12 - sigma ** 2 / 2
+    growth = np.exp(mu + sigma * np.random.default_rng(seed).standard_normal((n_paths, months)))
+
+    # Contribution made in month m grows over months m..end
+    value = (monthly_amount * np.cumprod(growth[:, ::-1], axis=1)).sum(axis=1)
+    p10, p50, p90 = np.percentile(value, (10, 50, 90))
+    return {
+        "invested": round(monthly_amount * months, 2),
+        "value_p10": round(float(p10), 2),
+        "value_p50": round(float(p50), 2),
+        "value_p90": round(float(p90), 2),
+    }
+
+
+# Portfolio per risk tolerance: (investment_type, instrument, provider, share of investable surplus, lock-in months)
+PORTFOLIOS = {
+    "low": [("recurring_deposit", "recurring_deposit", "Post Office RD", 0.6, 12),
+            ("ppf", "ppf", "Public Provident Fund", 0.4, 180)],
+    "moderate": [("recurring_deposit", "recurring_deposit", "Post Office RD", 0.5, 12),
+                 ("sip", "index_sip", "Index Fund SIP", 0.5, 36)],
+    "high": [("sip", "index_sip", "Index Fund SIP", 0.7, 60),
+             ("ppf", "ppf", "Public Provident Fund", 0.3, 180)],
+}
+RISK_LEVELS = {"recurring_deposit": "low", "ppf": "low", "index_sip": "moderate"}
+
+# Share of the surplus that goes to the emergency fund until it is full, and the months to fill it
+EMERGENCY_SHARE = 0.6
+EMERGENCY_FILL_MONTHS = 12
+
+
+def savings_plan(
+    user_id: str,
+    monthly_surplus: float,
+    monthly_expenses: float,
+    emergency_fund: float,
+    emergency_months: int,
+    risk_tolerance: Optional[str] = None,
+    monthly_income: float = 0.0,
+    n_paths: int = N_PATHS,
+) -> Dict[str, Any]:
+    """
+    Emergency-fund plan and projected investments for one user
+
+    The emergency fund is filled first (up to EMERGENCY_SHARE of the surplus);
+    the rest is split across the risk tolerance's portfolio, and each
+    investment is projected over its lock-in period.
+
+    Returns:
+        savings_plan dict in the shape build_agent_rows expects
+    """
+    surplus = max(monthly_surplus, 0.0)
+    target = round(monthly_expenses * emergency_months, 2)
+    gap = max(target - emergency_fund, 0.0)
+    ef_contribution = min(gap / EMERGENCY_FILL_MONTHS, surplus * EMERGENCY_SHARE) if gap else 0.0
+    investable = surplus - ef_contribution
+
+    risk = (risk_tolerance or "moderate").lower()
+    investments = []
+    for investment_type, instrument, provider, share, lock_in in PORTFOLIOS.get(risk, PORTFOLIOS["moderate"]):
+        amount = float(np.floor(investable * share / 100) * 100)
+        if amount <= 0:
+            continue
+        projection = project_investment(amount, instrument, lock_in, user_seed(f"{user_id}:{instrument}"), n_paths)
+        investments.append({
+            "investment_type": investment_type,
+            "provider": provider,
+            "recommended_amount": amount,
+            "frequency": "monthly",
+            "expected_return": round(INSTRUMENTS[instrument][0] * 100, 2),
+            "risk_level": RISK_LEVELS[instrument],
+            "min_lock_in_months": lock_in,
+            "projection": projection,
+            "reasoning": (
+                f"Rs {amount:,.0f}/month for {lock_in} months grows to about Rs {projection['value_p50']:,.0f}"
+                + (f" (Rs {projection['value_p10']:,.0f}-{projection['value_p90']:,.0f})"
+                   if projection["value_p90"] > projection["value_p10"] else "")
+                + f" on Rs {projection['invested']:,.0f} invested"
+            ),
+        })
+
+    months_to_fill = int(np.ceil(gap / ef_contribution)) if ef_contribution else None
+    return {
+        "emergency_fund": {
+            "target_amount": target,
+            "current_amount": round(emergency_fund, 2),
+            "monthly_contribution": round(ef_contribution, 2),
+            "target_months": emergency_months,
+            "priority": "high" if gap else "low",
+            "status": "completed" if not gap else "in_progress" if emergency_fund > 0 else "not_started",
+            "reasoning": (
+                f"{emergency_months} months of expenses (Rs {monthly_expenses:,.0f}/month)"
+                + (f"; full in about {months_to_fill} months at this rate" if months_to_fill else "")
+            ),
+        },
+        "investment_recommendations": investments,
+        "savings_rate": round(surplus / monthly_income, 2) if monthly_income > 0 else 0.0,
+        "investable_surplus": round(investable, 2),
+    }
@@ -1,18 +1,25 @@
 """
 Financial Goal-Based Planning Agent
 Creates personalized financial goals with detailed explanations and tracking
+The LLM proposes new goals; monthly targets, milestones and completion dates come from the goal simulator
 Writes to: financial_goals table
 """
 
 import asyncio
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 import sys
+from typing import Any, Dict, List, Optional
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from autogen_runtime import run_autogen_mcp_task
+from autogen_runtime import parse_agent_json, run_autogen_mcp_task, write_agent_data
+from goal_engine import HISTORY_DAYS, project_user_goals
+from postgrest_client import get_postgrest_client
+from user_snapshot import UserSnapshot
+
+PROFILE_COLUMNS = "user_id,monthly_income_min,monthly_income_max,monthly_expenses_avg,risk_tolerance"
 
 
 class FinancialGoalsAgent:
@@ -219,6 +226,10 @@ Your task is to create personalized financial goals with detailed explanations,
    - Potential obstacles and contingency plans
 7. Output ONLY the JSON format above - no explanations
 
+The monthly contribution, milestones, progress_percentage and status are
+recalculated by a goal simulator from the user's cash flow after you answer; leave
+target_date empty if the goal has no natural deadline.
+
 **Goal Types:**
 - emergency_fund: Safety net (highest priority)
 - debt_repayment: Clear existing debts
@@ -253,20 +264,21 @@ Your task is to create personalized financial goals with detailed explanations,
 
 **Output ONLY the JSON object. No other text.**"""
 
-    async def analyze_user(self, user_id: str) -> dict:
-        """
-        Create personalized financial goals for a specific user
-
-        Args:
-            user_id: UUID of the user to analyze
-
-        Returns:
-            dict with analysis results and success status
-        """
-        print(f"[Goals Agent] Starting analysis for user {user_id}")
-
-        try:
-            prompt = f"""Create personalized financial goals for user {user_id}.
+    async def fetch_goal_inputs(self, user_id: str, snapshot: Optional[UserSnapshot] = None) -> tuple:
+        """Fetch the user's saved goals, recent transactions and financial profile"""
+        client = snapshot or get_postgrest_client()
+        start = (datetime.now() - timedelta(days=HISTORY_DAYS + 1)).date().isoformat()
+        goals, transactions, profiles = await asyncio.gather(
+            client.select("financial_goals", filters={"user_id": user_id, "status": "neq.completed"}),
+            client.select("transactions", filters={"user_id": user_id, "transaction_date": f"gte.{start}"},
+                          columns="amount,transaction_type,transaction_date"),
+            client.select("user_profiles", filters={"user_id": user_id}, columns=PROFILE_COLUMNS),
+        )
+        return goals, transactions, (profiles[0] if profiles else None)
+
+    async def propose_goals(self, user_id: str) -> List[Dict[str, Any]]:
+        """Ask the LLM for a first set of goals (not written; the simulator fills in the numbers)"""
+        prompt = f"""Create personalized financial goals for user {user_id}.
 
 Steps:
 1. Read user_profiles for life stage, income, existing goals
@@ -278,20 +290,70 @@ Steps:
    - Action steps
    - Obstacle and contingency plans
 5. Prioritize goals appropriately
-6. Provide overall feasibility assessment
-7. Output structured JSON with explanations
+6. Output structured JSON with explanations
 
 User ID: {user_id}
 
 Please create a comprehensive goal-based financial plan with clear explanations."""
 
-            result = await run_autogen_mcp_task(
-                agent_name="goals_agent",
-                system_prompt=self.system_prompt,
-                task=prompt,
-                user_id=user_id,
-                use_azure=True
-            )
+        output = await run_autogen_mcp_task(
+            agent_name="goals_planner",
+            system_prompt=self.system_prompt,
+            task=prompt,
+            user_id=user_id,
+            use_azure=True,
+            # The model reads the user's tables through tools, so the task text says nothing about them
+            use_cache=False
+        )
+        plan = parse_agent_json(output).get("goals_plan", {})
+        # The simulator sets the contribution; a saved monthly_target is the user's own plan
+        return [{k: v for k, v in goal.items() if k != "monthly_target"} for goal in plan.get("goals", [])]
+
+    async def project(self, user_id: str, goals: Optional[List[Dict[str, Any]]] = None, write: bool = True) -> dict:
+        """
+        Re-run the goal simulator for a user's goals
+
+        Args:
+            user_id: UUID of the user
+            goals: Goals to project (defaults to the user's saved goals)
+            write: Save the projected goals to financial_goals
+
+        Returns:
+            {"goals_plan": goals with projections, overall_summary and
+            confidence_score; "written": whether the save succeeded}
+        """
+        saved, transactions, profile = await self.fetch_goal_inputs(user_id)
+        plan = project_user_goals(user_id, saved if goals is None else goals, transactions, profile)
+        written = False
+        if write and plan["goals"]:
+            written = await write_agent_data(user_id, "goals_agent", {"goals_plan": plan})
+        return {"goals_plan": plan, "written": written}
+
+    async def analyze_user(self, user_id: str, snapshot: Optional[UserSnapshot] = None) -> dict:
+        """
+        Create personalized financial goals for a specific user
+
+        Saved goals are re-projected; the LLM is only asked for goals when the
+        user has none.
+
+        Args:
+            user_id: UUID of the user to analyze
+            snapshot: Per-run snapshot of the user's input rows (read from the database if None)
+
+        Returns:
+            dict with analysis results and success status
+        """
+        print(f"[Goals Agent] Starting analysis for user {user_id}")
+
+        try:
+            saved, transactions, profile = await self.fetch_goal_inputs(user_id, snapshot)
+            goals = saved or await self.propose_goals(user_id)
+            plan = project_user_goals(user_id, goals, transactions, profile)
+            print(f"[Goals Agent] Projected {len(plan['goals'])} goals "
+                  f"({plan['overall_summary']['feasibility']})")
+
+            written = await write_agent_data(user_id, "goals_agent", {"goals_plan": plan}) if plan["goals"] else True
+            result = {"goals_plan": plan, "written": written}
 
             print(f"[Goals Agent] Analysis complete for user {user_id}")
 
@@ -0,0 +1,293 @@
+"""
+Financial Health Engine
+Deterministic 0-100 financial health score behind the Financial Health Agent
+
+Five sub-scores (savings, debt, income, spending, investment) are computed
+from per-user aggregates held in arrays, so one call scores any number of
+users. Transaction aggregates are shared with the risk engine.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from pattern_engine import to_day_numbers, window_start
+from risk_engine import HISTORY_DAYS, aggregate_transactions, profile_debt_payments, transaction_arrays
+
+
+# Overall score weight per sub-score
+SUB_SCORE_WEIGHTS = {"savings": 0.25, "debt": 0.20, "income": 0.25, "spending": 0.15, "investment": 0.15}
+
+# Upper bound (inclusive) of each health category
+HEALTH_CATEGORIES = [(40, "poor"), (60, "fair"), (80, "good"), (100, "excellent")]
+
+TARGET_EMERGENCY_MONTHS = 6
+TARGET_SAVINGS_RATE = 0.20
+TARGET_INVESTMENT_RATE = 0.10
+MAX_HEALTHY_DTI = 0.50
+MAX_HEALTHY_DISCRETIONARY = 0.30
+
+# Relative change in monthly EMI payments that counts as a debt trend
+DEBT_TREND_TOLERANCE = 0.05
+
+# Expense categories that are essential spending
+ESSENTIAL_CATEGORIES = {
+    "food", "groceries", "fuel", "transport", "utilities", "electricity", "water", "gas", "rent",
+    "emi", "loan", "medical", "health", "medicine", "education", "phone", "mobile", "internet",
+}
+
+# Investment categories and their expected annual return
+INVESTMENT_RETURNS = {
+    "ppf": 0.071, "rd": 0.075, "recurring deposit": 0.075, "fd": 0.07, "fixed deposit": 0.07,
+    "sip": 0.11, "mutual fund": 0.11, "elss": 0.11, "nps": 0.09, "apy": 0.08, "pension": 0.08,
+    "gold": 0.08, "investment": 0.08,
+}
+RETIREMENT_CATEGORIES = {"nps", "apy", "pension", "ppf"}
+MAX_RETURN = max(INVESTMENT_RETURNS.values())
+
+REVIEW_INTERVAL_DAYS = 90
+
+
+def health_aggregates(
+    rows: List[Dict[str, Any]],
+    profiles: Dict[str, Dict[str, Any]],
+    users: List[str],
+    as_of: Optional[date] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Per-user aggregates the health scores are computed from
+
+    Args:
+        rows: Transactions (user_id, amount, transaction_type, category, source, transaction_date)
+        profiles: user_id -> user_profiles row
+        users: Users to aggregate for (output order)
+        as_of: Last day of history (defaults to today)
+
+    Returns:
+        Aggregate name -> array per user
+    """
+    as_of = as_of or datetime.now().date()
+    start_day = window_start(as_of, HISTORY_DAYS)
+    days = to_day_numbers(r["transaction_date"] for r in rows)
+    rows = [r for r, day in zip(rows, days) if start_day <= day < start_day + HISTORY_DAYS]
+    user_ids = np.array([r["user_id"] for r in rows], dtype=object)
+    aggregates = aggregate_transactions(user_ids, transaction_arrays(rows), users, as_of)
+
+    position = {user: i for i, user in enumerate(users)}
+    n = len(users)
+    essential, investment, retirement, weighted_return = (np.zeros(n) for _ in range(4))
+    investment_types: List[set] = [set() for _ in range(n)]
+    income_by_source: List[Dict[str, float]] = [{} for _ in range(n)]
+    for r in rows:
+        i = position.get(r["user_id"])
+        if i is None:
+            continue
+        amount = float(r.get("amount") or 0)
+        category = (r.get("category") or "").strip().lower()
+        if r.get("transaction_type") == "income":
+            source = (r.get("source") or "other").strip().lower()
+            income_by_source[i][source] = income_by_source[i].get(source, 0.0) + amount
+        elif category in INVESTMENT_RETURNS:
+            investment[i] += amount
+            weighted_return[i] += amount * INVESTMENT_RETURNS[category]
+            investment_types[i].add(category)
+            retirement[i] += amount if category in RETIREMENT_CATEGORIES else 0.0
+        elif category in ESSENTIAL_CATEGORIES:
+            essential[i] += amount
+
+    # Diversification = 1 - Herfindahl index of income shares by source
+    diversification = np.array([
+        1.0 - sum((v / sum(s.values())) ** 2 for v in s.values()) if sum(s.values()) > 0 else 0.0
+        for s in income_by_source
+    ])
+    months = HISTORY_DAYS / 30.0
+    total_spend = aggregates["monthly_expenses"] * months
+
+    def profile_column(key: str) -> np.ndarray:
+        return np.array([float((profiles.get(u) or {}).get(key) or 0) for u in users])
+
+    total_debt = np.array([
+        sum(float(d.get("outstanding") or d.get("principal") or d.get("amount") or 0)
+            for d in ((profiles.get(u) or {}).get("debt_obligations") or []) if isinstance(d, dict))
+        for u in users
+    ])
+
+    aggregates.update({
+        "emergency_fund": profile_column("current_emergency_fund"),
+        "profile_expenses": profile_column("monthly_expenses_avg"),
+        "profile_debt_payments": np.array([profile_debt_payments(profiles.get(u)) for u in users]),
+        "total_debt": total_debt,
+        "risk_tolerance": np.array([(profiles.get(u) or {}).get("risk_tolerance") or "moderate" for u in users], dtype=object),
+        "essential_spend": essential,
+        "discretionary_spend": np.maximum(total_spend - essential - investment, 0.0),
+        "monthly_investment": investment / months,
+        "monthly_retirement": retirement / months,
+        "investment_return": np.divide(weighted_return, investment, out=np.zeros(n), where=investment > 0),
+        "investment_types": np.array([len(t) for t in investment_types], dtype=np.float64),
+        "income_diversification": diversification,
+    })
+    return aggregates
+
+
+def _unit(value: np.ndarray) -> np.ndarray:
+    return np.clip(value, 0.0, 1.0)
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray, default: float = 0.0) -> np.ndarray:
+    return np.divide(numerator, denominator, out=np.full(len(numerator), default, dtype=np.float64), where=denominator > 0)
+
+
+def compute_health(aggregates: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Sub-scores and overall 0-100 score for many users
+
+    Args:
+        aggregates: health_aggregates output (or the same arrays from elsewhere)
+
+    Returns:
+        Metric / score name -> array per user
+    """
+    income = aggregates["monthly_income"]
+    expenses = np.where(aggregates["monthly_expenses"] > 0, aggregates["monthly_expenses"], aggregates["profile_expenses"])
+    debt_payments = np.maximum(aggregates["monthly_debt_payments"], aggregates["profile_debt_payments"])
+
+    emergency_months = _ratio(aggregates["emergency_fund"], expenses)
+    savings_rate = _ratio(income - expenses, income)
+    retirement_on_track = aggregates["monthly_retirement"] > 0
+    savings = (50 * _unit(emergency_months / TARGET_EMERGENCY_MONTHS)
+               + 40 * _unit(savings_rate / TARGET_SAVINGS_RATE) + 10 * retirement_on_track)
+
+    dti = np.where(debt_payments > 0, _ratio(debt_payments, income, default=1.0), 0.0)
+    # Trend of EMIs paid: last 30 days against the monthly average of the months before
+    recent_debt, baseline_debt = aggregates["recent_debt_payments"], aggregates["baseline_debt_payments"]
+    debt_increasing = recent_debt > baseline_debt * (1 + DEBT_TREND_TOLERANCE)
+    debt_decreasing = recent_debt < baseline_debt * (1 - DEBT_TREND_TOLERANCE)
+    debt = np.maximum(100 * (1 - _unit(dti / MAX_HEALTHY_DTI)) - 10 * debt_increasing, 0.0)
+
+    volatility = aggregates["volatility_score"]
+    growth = _ratio(aggregates["recent_income"], aggregates["baseline_income"], default=1.0) - 1.0
+    diversification = aggregates["income_diversification"]
+    income_score = 50 * (1 - _unit(volatility / 0.6)) + 25 * _unit((growth + 0.2) / 0.4) + 25 * _unit(diversification / 0.5)
+
+    spend_total = aggregates["essential_spend"] + aggregates["discretionary_spend"]
+    essential_ratio = _ratio(aggregates["essential_spend"], spend_total, default=1.0)
+    discretionary_ratio = 1.0 - essential_ratio
+    spike = _ratio(aggregates["recent_expenses"], aggregates["baseline_expenses"], default=1.0)
+    adherence = _unit(_ratio(np.ones(len(income)), spike, default=1.0))
+    spending = 50 * adherence + 50 * (1 - _unit((discretionary_ratio - MAX_HEALTHY_DISCRETIONARY) / 0.4))
+
+    diversity = _unit(aggregates["investment_types"] / 4)
+    investment_rate = _ratio(aggregates["monthly_investment"], income)
+    investment = (40 * diversity + 40 * _unit(investment_rate / TARGET_INVESTMENT_RATE)
+                  + 20 * _unit(aggregates["investment_return"] / MAX_RETURN))
+
+    scores = {"savings": savings, "debt": debt, "income": income_score, "spending": spending, "investment": investment}
+    overall = sum(SUB_SCORE_WEIGHTS[name] * score for name, score in scores.items())
+
+    return {
+        "scores": {name: np.round(score).astype(int) for name, score in scores.items()},
+        "overall_score": np.round(overall).astype(int),
+        "emergency_fund_months": emergency_months,
+        "savings_rate": savings_rate,
+        "retirement_on_track": retirement_on_track,
+        "debt_to_income": dti,
+        "total_debt": aggregates["total_debt"],
+        "volatility": volatility,
+        "income_growth": growth,
+        "diversification_score": diversification,
+        "budget_adherence": adherence,
+        "discretionary_ratio": discretionary_ratio,
+        "essential_ratio": essential_ratio,
+        "portfolio_diversity": diversity,
+        "investment_return": aggregates["investment_return"],
+        "risk_appetite": aggregates["risk_tolerance"],
+        "debt_increasing": debt_increasing,
+        "debt_decreasing": debt_decreasing,
+    }
+
+
+# Text for a sub-score that is a strength (>= 70) or needs work (< 50), plus the matching recommendation
+SUB_SCORE_TEXT = {
+    "savings": ("Strong emergency fund and savings rate", "Low savings buffer",
+                f"Build a {TARGET_EMERGENCY_MONTHS}-month emergency fund"),
+    "debt": ("Manageable debt load", "High EMI burden", "Keep total EMIs below 40% of income or consolidate debt"),
+    "income": ("Stable, diversified income", "Volatile or concentrated income", "Add a second platform or client"),
+    "spending": ("Good spending discipline", "High discretionary spending", "Cap discretionary spending at 30% of income"),
+    "investment": ("Regular investing", "Little or no investing", "Start a small SIP, RD or PPF contribution"),
+}
+
+
+def health_category(score: int) -> str:
+    for upper, category in HEALTH_CATEGORIES:
+        if score <= upper:
+            return category
+    return HEALTH_CATEGORIES[-1][1]
+
+
+def financial_health(result: Dict[str, Any], i: int, as_of: Optional[date] = None) -> Dict[str, Any]:
+    """Format user i's results as a financial_health object"""
+    as_of = as_of or datetime.now().date()
+    scores = {name: int(value[i]) for name, value in result["scores"].items()}
+    overall = int(result["overall_score"][i])
+    volatility = float(result["volatility"][i])
+    r = lambda key, digits=2: round(float(result[key][i]), digits)  # noqa: E731
+
+    strengths = [SUB_SCORE_TEXT[name][0] for name, score in scores.items() if score >= 70]
+    weak = sorted((score, name) for name, score in scores.items() if score < 50)
+
+    return {
+        "overall_score": overall,
+        "health_category": health_category(overall),
+        "savings_health": {
+            "score": scores["savings"],
+            "emergency_fund_months": r("emergency_fund_months", 1),
+            "savings_rate": r("savings_rate"),
+            "retirement_on_track": bool(result["retirement_on_track"][i]),
+        },
+        "debt_health": {
+            "score": scores["debt"],
+            "debt_to_income": r("debt_to_income"),
+            "total_debt": r("total_debt"),
+            "debt_trend": ("increasing" if result["debt_increasing"][i]
+                           else "decreasing" if result["debt_decreasing"][i] else "stable"),
+        },
+        "income_health": {
+            "score": scores["income"],
+            "income_stability": "stable" if volatility < 0.2 else "moderate" if volatility < 0.4 else "volatile",
+            "income_growth": r("income_growth"),
+            "diversification_score": r("diversification_score"),
+        },
+        "spending_health": {
+            "score": scores["spending"],
+            "budget_adherence": r("budget_adherence"),
+            "discretionary_ratio": r("discretionary_ratio"),
+            "essential_ratio": r("essential_ratio"),
+        },
+        "investment_health": {
+            "score": scores["investment"],
+            "portfolio_diversity": r("portfolio_diversity"),
+            "risk_appetite": str(result["risk_appetite"][i]),
+            "investment_return": r("investment_return", 3),
+        },
+        "key_strengths": strengths,
+        "improvement_areas": [SUB_SCORE_TEXT[name][1] for _, name in weak],
+        "recommendations": [SUB_SCORE_TEXT[name][2] for _, name in weak],
+        "next_review_date": (as_of + timedelta(days=REVIEW_INTERVAL_DAYS)).isoformat(),
+    }
+
+
+def compute_financial_health(
+    rows: List[Dict[str, Any]],
+    profiles: Dict[str, Dict[str, Any]],
+    users: List[str],
+    as_of: Optional[date] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Score many users at once
+
+    Returns:
+        user_id -> financial_health dict
+    """
+    result = compute_health(health_aggregates(rows, profiles, users, as_of))
+    return {user: financial_health(result, i, as_of) for i, user in enumerate(users)}
@@ -1,18 +1,36 @@
 """
 Knowledge Integration Agent
 Matches users with 200+ government schemes based on eligibility
-Writes to: government_schemes, user_schemes tables
+Matching runs against a compiled rule index; the LLM only adds an optional narrative
+Writes to: user_schemes table
 """
 
 import asyncio
 import json
+import time
 from datetime import datetime
+from typing import Dict, List, Optional, Set
 import os
 import sys
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from autogen_runtime import run_autogen_mcp_task
+from autogen_runtime import AGENT_OUTPUT_UPSERT_KEYS, build_agent_rows, run_autogen_mcp_task, write_agent_data
+from postgrest_client import get_postgrest_client
+from user_snapshot import UserSnapshot
+from scheme_engine import SchemeIndex, scheme_user
+
+# Set KNOWLEDGE_AGENT_LLM_NARRATIVE=true to also ask the LLM to explain the matches
+LLM_NARRATIVE = os.getenv("KNOWLEDGE_AGENT_LLM_NARRATIVE", "false").lower() == "true"
+
+# Seconds before the compiled scheme index is rebuilt from government_schemes
+SCHEME_INDEX_TTL = int(os.getenv("SCHEME_INDEX_TTL", "300"))
+
+# Rows per PostgREST page / array insert in bulk rematch mode
+REMATCH_PAGE_SIZE = 1000
+
+# User ids per stale-match delete (keeps the in.(...) filter well under URL limits)
+STALE_DELETE_CHUNK = 100
 
 
 class KnowledgeIntegrationAgent:
@@ -21,64 +39,43 @@ class KnowledgeIntegrationAgent:
     def __init__(self, mcp_servers: str = ".mcp.json"):
         self.mcp_servers = mcp_servers
         self.system_prompt = self._create_system_prompt()
+        self._index: Optional[SchemeIndex] = None
+        self._index_built_at = 0.0
 
     def _create_system_prompt(self) -> str:
         return """You are a Knowledge Integration Engine specializing in Indian government schemes for gig workers.
 
-Your task is to match users with relevant government schemes and benefits.
-
-**What you do:**
-1. Read user_profiles to understand user demographics and financial situation
-2. Read existing government_schemes table for available schemes
-3. Match user with eligible schemes based on:
-   - Income level (below poverty line, EWS, etc.)
-   - State/location (state-specific schemes)
-   - Occupation (gig worker, self-employed)
-   - Age, gender (women-focused schemes)
-   - Family size
-4. Create entries in user_schemes table for matched schemes
-5. Update application_status as 'eligible'
-6. Log your actions to agent_logs table
-
-**Key Government Schemes for Gig Workers:**
-- PM-SYM (Pension for unorganized workers)
-- Atal Pension Yojana
-- PM Jan Dhan Yojana (bank accounts)
-- Ayushman Bharat (health insurance)
-- PM SVANidhi (street vendor loans)
-- PMEGP (self-employment loans)
-- State-specific welfare schemes
-- Food security (ration card)
-- Housing schemes
-- Skill development programs
-
-**Eligibility Criteria Examples:**
-- Income thresholds (₹15,000/month for many schemes)
-- Age limits (18-40 for PMEGP)
-- Occupation type
-- State residence
-- Bank account requirement
-
-**Available MCP Tools:**
-- mcp__supabase-postgres__postgrestRequest: Execute database queries
-- mcp__supabase-postgres__sqlToRest: Convert SQL to REST API calls
-
-**Output Format:**
-Store in user_schemes table with fields:
-- user_id
-- scheme_id (from government_schemes table)
-- eligibility_matched (boolean)
-- match_confidence (0-1)
-- missing_requirements (JSON array)
-- application_status (eligible/not_eligible/applied)
-- matched_at"""
-
-    async def analyze_user(self, user_id: str) -> dict:
+You are given the government schemes a user has already been matched with, each with
+a match_confidence and any missing_requirements. Do not change the matches and do not
+write to the database.
+
+Explain the matches to the gig worker in 3-5 short sentences:
+- Which schemes are most valuable for them and why
+- What they still need to provide or confirm to apply"""
+
+    async def get_scheme_index(self, refresh: bool = False) -> SchemeIndex:
+        """Compiled index over active schemes, rebuilt every SCHEME_INDEX_TTL seconds"""
+        if refresh or self._index is None or time.monotonic() - self._index_built_at > SCHEME_INDEX_TTL:
+            today = datetime.now().date().isoformat()
+            schemes = await get_postgrest_client().select_all(
+                "government_schemes",
+                filters={"is_active": "is.true"},
+                columns="scheme_id,scheme_name,eligibility_criteria,state_applicable,valid_until",
+                order="scheme_id"
+            )
+            schemes = [s for s in schemes if not s.get("valid_until") or s["valid_until"] >= today]
+            self._index = SchemeIndex(schemes)
+            self._index_built_at = time.monotonic()
+            print(f"[Knowledge Agent] Compiled scheme index over {len(schemes)} active schemes")
+        return self._index
+
+    async def analyze_user(self, user_id: str, snapshot: Optional[UserSnapshot] = None) -> dict:
         """
         Match government schemes for a specific user
 
         Args:
             user_id: UUID of the user to analyze
+            snapshot: Per-run snapshot of the user's input rows (read from the database if None)
 
         Returns:
             dict with analysis results and success status
@@ -86,31 +83,32 @@ Store in user_schemes table with fields:
         print(f"[Knowledge Agent] Starting analysis for user {user_id}")
 
         try:
-            prompt = f"""Match government schemes for user {user_id}.
-
-Steps:
-1. Read user_profiles for user {user_id} to understand eligibility
-2. Read government_schemes table to see available schemes
-3. Match user with eligible schemes based on:
-   - Income level
-   - Location
-   - Occupation
-   - Age and demographics
-4. Create entries in user_schemes table for each match
-5. Include match_confidence and any missing_requirements
-6. Log to agent_logs table
-
-User ID: {user_id}
-
-Please execute this analysis and report which schemes you matched."""
-
-            result = await run_autogen_mcp_task(
-                agent_name="knowledge_agent",
-                system_prompt=self.system_prompt,
-                task=prompt,
-                user_id=user_id,
-                use_azure=True
+            client = snapshot or get_postgrest_client()
+            index, users, profiles = await asyncio.gather(
+                self.get_scheme_index(),
+                client.select("users", filters={"user_id": user_id},
+                              columns="user_id,date_of_birth,state,occupation,user_type"),
+                client.select("user_profiles", filters={"user_id": user_id},
+                              columns="monthly_income_min,monthly_income_max"),
             )
+            if not users:
+                raise ValueError(f"User {user_id} not found")
+
+            matches = index.match(scheme_user(users[0], profiles[0] if profiles else None))
+            print(f"[Knowledge Agent] Matched {len(matches)} schemes")
+
+            written = await write_agent_data(user_id, "knowledge_agent", {"user_schemes": matches})
+            await self.remove_stale_matches({user_id: {m["scheme_id"] for m in matches}})
+
+            result = {"user_schemes": matches, "written": written}
+            if LLM_NARRATIVE and matches:
+                result["narrative"] = await run_autogen_mcp_task(
+                    agent_name="knowledge_narrative",
+                    system_prompt=self.system_prompt,
+                    task=f"Scheme matches for user {user_id}:\n{json.dumps(matches, indent=2, ensure_ascii=False)}",
+                    user_id=user_id,
+                    use_azure=True
+                )
 
             print(f"[Knowledge Agent] Analysis complete for user {user_id}")
 
@@ -132,6 +130,124 @@ Please execute this analysis and report which schemes you matched."""
                 "timestamp": datetime.now().isoformat()
             }
 
+    async def remove_stale_matches(self, current: Dict[str, Set[str]], scheme_id: Optional[str] = None) -> int:
+        """
+        Delete 'eligible' user_schemes rows that are no longer in a user's matches
+
+        Applications already in progress are never touched.
+
+        Args:
+            current: user_id -> scheme_ids matched now (users that were
+                rematched; a user mapped to an empty set loses every eligible row)
+            scheme_id: Only consider rows of this scheme
+
+        Returns:
+            Number of stale rows found
+        """
+        client = get_postgrest_client()
+        if len(current) == 1 and scheme_id is None:
+            # Single user: one filtered delete, no read needed
+            (user_id, scheme_ids), = current.items()
+            filters = {"user_id": user_id, "application_status": "eligible"}
+            if scheme_ids:
+                filters["scheme_id"] = f"not.in.({','.join(sorted(scheme_ids))})"
+            removed = await client.delete("user_schemes", filters)
+            return len(removed or [])
+
+        filters = {"application_status": "eligible"}
+        if scheme_id is not None:
+            filters["scheme_id"] = scheme_id
+        existing = await client.select_all(
+            "user_schemes", filters=filters, columns="user_id,scheme_id",
+            order="user_id,scheme_id", page_size=REMATCH_PAGE_SIZE
+        )
+        stale_users_by_scheme: Dict[str, List[str]] = {}
+        for row in existing:
+            if row["user_id"] in current and row["scheme_id"] not in current[row["user_id"]]:
+                stale_users_by_scheme.setdefault(row["scheme_id"], []).append(row["user_id"])
+
+        await client.pipeline(*(
+            client.delete("user_schemes", {
+                "scheme_id": stale_scheme,
+                "application_status": "eligible",
+                "user_id": f"in.({','.join(user_ids[i:i + STALE_DELETE_CHUNK])})",
+            })
+            for stale_scheme, user_ids in stale_users_by_scheme.items()
+            for i in range(0, len(user_ids), STALE_DELETE_CHUNK)
+        ))
+        return sum(len(user_ids) for user_ids in stale_users_by_scheme.values())
+
+    async def rematch_all_users(self, scheme_id: Optional[str] = None) -> dict:
+        """
+        Rematch every active user against the scheme index
+
+        Run after government_schemes changes. With scheme_id, only that
+        scheme is rematched. Afterwards the rematched users' 'eligible' rows
+        that no longer match are removed; applications already in progress
+        are never touched.
+
+        Args:
+            scheme_id: Scheme that changed (None = all schemes)
+
+        Returns:
+            dict with user/match counts, write errors and timing
+        """
+        started = datetime.now()
+        client = get_postgrest_client()
+
+        index, users, profiles = await asyncio.gather(
+            self.get_scheme_index(refresh=True),
+            client.select_all(
+                "users", filters={"is_active": "is.true"},
+                columns="user_id,date_of_birth,state,occupation,user_type",
+                order="user_id", page_size=REMATCH_PAGE_SIZE
+            ),
+            client.select_all(
+                "user_profiles", columns="user_id,monthly_income_min,monthly_income_max",
+                order="user_id", page_size=REMATCH_PAGE_SIZE
+            ),
+        )
+        profiles_by_user = {profile["user_id"]: profile for profile in profiles}
+        matches = index.match_all(
+            [scheme_user(user, profiles_by_user.get(user["user_id"])) for user in users],
+            scheme_id=scheme_id
+        )
+
+        rows = []
+        for user_id, user_matches in matches.items():
+            rows.extend(build_agent_rows(user_id, "knowledge_agent", {"user_schemes": user_matches})["user_schemes"])
+
+        reports = await asyncio.gather(*(
+            client.bulk_insert(
+                "user_schemes", rows[i:i + REMATCH_PAGE_SIZE],
+                on_conflict=AGENT_OUTPUT_UPSERT_KEYS["user_schemes"]
+            )
+            for i in range(0, len(rows), REMATCH_PAGE_SIZE)
+        ))
+        inserted = sum(report["inserted"] for report in reports)
+        errors = sum(len(report["errors"]) for report in reports)
+
+        removed = await self.remove_stale_matches(
+            {user["user_id"]: {m["scheme_id"] for m in matches.get(user["user_id"], [])} for user in users},
+            scheme_id=scheme_id
+        )
+
+        elapsed = (datetime.now() - started).total_seconds()
+        print(f"[Knowledge Agent] Rematch: {inserted}/{len(rows)} matches for {len(users)} users, "
+              f"{removed} stale removed in {elapsed:.1f}s")
+
+        return {
+            "success": errors == 0,
+            "agent": "knowledge_integration",
+            "scheme_id": scheme_id,
+            "users": len(users),
+            "matches": inserted,
+            "removed": removed,
+            "errors": errors,
+            "elapsed_seconds": elapsed,
+            "timestamp": datetime.now().isoformat()
+        }
+
 
 async def main():
     """Test the knowledge integration agent"""
@@ -1,6 +1,7 @@
 """
 Agent Monitoring Script
 View what agents have pushed to the database
+Queries bypass the LLM response cache, since they report live table contents
 """
 
 import asyncio
@@ -54,6 +55,7 @@ Present in a clear, readable table format."""
             system_prompt=system_prompt,
             task=prompt,
             mcp_config_path=self.mcp_config_path,
+            use_cache=False,
         )
         print(result)
 
@@ -125,6 +127,7 @@ Present in a well-organized, readable format with clear sections."""
             system_prompt=system_prompt,
             task=prompt,
             mcp_config_path=self.mcp_config_path,
+            use_cache=False,
         )
         print(result)
 
@@ -162,6 +165,7 @@ Present as a clear summary."""
             system_prompt=system_prompt,
             task=prompt,
             mcp_config_path=self.mcp_config_path,
+            use_cache=False,
         )
         print(result)
 
@@ -1,15 +1,18 @@
 """
 Pattern Recognition Engine Agent
-Analyzes transaction history to identify income patterns using LSTM-style analysis
+Analyzes transaction history to identify income patterns
+Statistics come from the NumPy pattern engine; the LLM only adds an optional narrative
 Writes to: income_patterns table
 """
 
 import asyncio
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Optional
 import os
 import sys
+
+import numpy as np
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -17,7 +20,27 @@ load_dotenv()
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from autogen_runtime import run_autogen_mcp_task
+from autogen_runtime import (
+    AGENT_OUTPUT_UPSERT_KEYS,
+    build_agent_rows,
+    run_autogen_mcp_task,
+    write_agent_data,
+)
+from postgrest_client import get_postgrest_client
+from user_snapshot import UserSnapshot
+from pattern_engine import (
+    WINDOW_DAYS,
+    compute_income_pattern,
+    compute_income_patterns_batch,
+    to_day_numbers,
+    transactions_to_arrays,
+)
+
+# Set PATTERN_AGENT_LLM_NARRATIVE=true to also ask the LLM to explain the computed pattern
+LLM_NARRATIVE = os.getenv("PATTERN_AGENT_LLM_NARRATIVE", "false").lower() == "true"
+
+# Rows per PostgREST page when reading, and per array insert when writing, in batch mode
+BATCH_PAGE_SIZE = int(os.getenv("PATTERN_BATCH_PAGE_SIZE", "1000"))
 
 
 class PatternRecognitionAgent:
@@ -33,28 +56,35 @@ class PatternRecognitionAgent:
         """Create the system prompt for the pattern recognition agent"""
         return """You are a Pattern Recognition Agent specializing in income pattern analysis.
 
-Your task is to analyze transaction data and identify income patterns including:
-- Weekly income cycles
-- Seasonal variations  
-- Income stability metrics
-- Trend analysis
-
-You must output your analysis in JSON format with:
-- user_id
-- average_weekly_income
-- income_volatility
-- seasonal_factors
-- confidence_score
-- last_updated
-
-Use the postgrestRequest tool to query the transactions table for income transactions."""
+You are given an income pattern that has already been computed from the user's
+transactions (weekly averages, weekday cycles, seasonal indices, volatility and trend).
+Do not recalculate the numbers and do not write to the database.
+
+Explain the pattern to a gig worker in 3-5 short sentences:
+- When they earn the most and least
+- How stable their income is
+- Whether income is trending up or down"""
+
+    async def fetch_income_transactions(self, user_id: str, snapshot: Optional[UserSnapshot] = None) -> list:
+        """Fetch the user's income transactions for the analysis window"""
+        start = (datetime.now() - timedelta(days=WINDOW_DAYS)).date().isoformat()
+        return await (snapshot or get_postgrest_client()).select(
+            "transactions",
+            filters={
+                "user_id": user_id,
+                "transaction_type": "income",
+                "transaction_date": f"gte.{start}",
+            },
+            columns="amount,transaction_date",
+        )
 
-    async def analyze_user(self, user_id: str) -> dict:
+    async def analyze_user(self, user_id: str, snapshot: Optional[UserSnapshot] = None) -> dict:
         """
         Analyze transaction patterns for a specific user
 
         Args:
             user_id: UUID of the user to analyze
+            snapshot: Per-run snapshot of the user's input rows (read from the database if None)
 
         Returns:
             dict with analysis results and success status
@@ -62,28 +92,22 @@ Use the postgrestRequest tool to query the transactions table for income transac
         print(f"[Pattern Agent] Starting analysis for user {user_id}")
 
         try:
-            # Create the analysis prompt
-            prompt = f"""Analyze income patterns for user {user_id}.
-
-Steps:
-1. Query transactions table for this user (last 60 days)
-2. Calculate income statistics  
-3. Identify weekday patterns
-4. Detect trends
-5. Write results to income_patterns table
-6. Log to agent_logs table
-
-User ID: {user_id}
-
-Please execute this analysis and report what you found."""
-
-            result = await run_autogen_mcp_task(
-                agent_name="pattern_agent",
-                system_prompt=self.system_prompt,
-                task=prompt,
-                user_id=user_id,
-                use_azure=True
-            )
+            transactions = await self.fetch_income_transactions(user_id, snapshot)
+            day_numbers, amounts = transactions_to_arrays(transactions)
+            pattern = compute_income_pattern(day_numbers, amounts)
+            print(f"[Pattern Agent] Computed pattern from {len(transactions)} income transactions")
+
+            written = await write_agent_data(user_id, "pattern_agent", {"income_patterns": dict(pattern)})
+
+            result = {"income_patterns": pattern, "written": written}
+            if LLM_NARRATIVE:
+                result["narrative"] = await run_autogen_mcp_task(
+                    agent_name="pattern_narrative",
+                    system_prompt=self.system_prompt,
+                    task=f"Income pattern for user {user_id}:\n{json.dumps(pattern, indent=2)}",
+                    user_id=user_id,
+                    use_azure=True
+                )
 
             print(f"[Pattern Agent] Analysis complete for user {user_id}")
 
@@ -105,6 +129,75 @@ Please execute this analysis and report what you found."""
                 "timestamp": datetime.now().isoformat()
             }
 
+    async def analyze_all_users(self) -> dict:
+        """
+        Recompute income_patterns for every active user in one vectorised pass
+
+        Reads the window's income transactions of active users in paginated
+        requests (filtered server-side through the users join), computes
+        every pattern with a single engine sweep and upserts the rows with
+        array inserts. Active users without income in the window get a zero
+        pattern, as in analyze_user.
+
+        Returns:
+            dict with user/row counts, write errors and timing
+        """
+        started = datetime.now()
+        client = get_postgrest_client()
+        start = (started - timedelta(days=WINDOW_DAYS)).date().isoformat()
+
+        active_users, transactions = await asyncio.gather(
+            client.select_all(
+                "users", filters={"is_active": "is.true"}, columns="user_id",
+                order="user_id", page_size=BATCH_PAGE_SIZE
+            ),
+            client.select_all(
+                "transactions",
+                filters={
+                    "transaction_type": "income",
+                    "transaction_date": f"gte.{start}",
+                    "users.is_active": "is.true",
+                },
+                columns="user_id,amount,transaction_date,users!inner(is_active)",
+                order="user_id,transaction_id",
+                page_size=BATCH_PAGE_SIZE
+            ),
+        )
+        active = [row["user_id"] for row in active_users]
+        print(f"[Pattern Agent] Batch: {len(transactions)} income transactions for {len(active)} active users")
+
+        user_ids = np.array([row["user_id"] for row in transactions], dtype=object)
+        day_numbers = to_day_numbers(row["transaction_date"] for row in transactions)
+        amounts = np.array([float(row.get("amount") or 0) for row in transactions], dtype=np.float64)
+        patterns = compute_income_patterns_batch(user_ids, day_numbers, amounts, all_users=active)
+
+        rows = []
+        for user_id, pattern in patterns.items():
+            rows.extend(build_agent_rows(user_id, "pattern_agent", {"income_patterns": pattern})["income_patterns"])
+
+        reports = await asyncio.gather(*(
+            client.bulk_insert(
+                "income_patterns", rows[i:i + BATCH_PAGE_SIZE],
+                on_conflict=AGENT_OUTPUT_UPSERT_KEYS["income_patterns"]
+            )
+            for i in range(0, len(rows), BATCH_PAGE_SIZE)
+        ))
+        inserted = sum(report["inserted"] for report in reports)
+        errors = sum(len(report["errors"]) for report in reports)
+
+        elapsed = (datetime.now() - started).total_seconds()
+        print(f"[Pattern Agent] Batch: wrote {inserted}/{len(rows)} income patterns in {elapsed:.1f}s")
+
+        return {
+            "success": errors == 0,
+            "agent": "pattern_recognition",
+            "users": len(patterns),
+            "inserted": inserted,
+            "errors": errors,
+            "elapsed_seconds": elapsed,
+            "timestamp": datetime.now().isoformat()
+        }
+
 
 async def main():
     """Test the pattern recognition agent"""
@@ -0,0 +1,299 @@
+"""
+Income Pattern Engine
+Deterministic, vectorised income statistics behind the Pattern Recognition Agent
+
+Works on a (users x days) matrix of daily income so the same code serves one
+user or, via compute_income_patterns_batch, every user in a single sweep. Amounts in avg_income/min_income/max_income are weekly
+totals, matching the "average weekly income" the agent used to ask GPT for.
+"""
+
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+WINDOW_DAYS = 60
+ROLLING_DAYS = 7
+WEEKDAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Relative change over the window above which a trend counts as increasing/decreasing
+TREND_THRESHOLD = 0.10
+
+# Transactions needed for full confidence
+CONFIDENT_TRANSACTION_COUNT = 30
+
+
+def to_day_numbers(dates: Iterable[Any]) -> np.ndarray:
+    """Convert ISO date strings / date objects to int64 days since 1970-01-01"""
+    values = [str(d)[:10] for d in dates]
+    return np.array(values, dtype="datetime64[D]").astype(np.int64)
+
+
+def weekday_of(day_numbers: np.ndarray) -> np.ndarray:
+    """Monday=0 ... Sunday=6 (1970-01-01 was a Thursday)"""
+    return (day_numbers + 3) % 7
+
+
+def transactions_to_arrays(rows: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Turn PostgREST transaction rows into (day_numbers, amounts) arrays"""
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    days = to_day_numbers(row["transaction_date"] for row in rows)
+    amounts = np.array([float(row.get("amount") or 0) for row in rows], dtype=np.float64)
+    return days, amounts
+
+
+def window_start(as_of: Optional[date] = None, window_days: int = WINDOW_DAYS) -> int:
+    """First day number of the analysis window ending on as_of (inclusive)"""
+    as_of = as_of or datetime.now().date()
+    return int(np.datetime64(as_of, "D").astype(np.int64)) - window_days + 1
+
+
+def daily_income_matrix(
+    user_index: np.ndarray,
+    day_numbers: np.ndarray,
+    amounts: np.ndarray,
+    n_users: int,
+    start_day: int,
+    window_days: int = WINDOW_DAYS,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Scatter transactions into a dense (users x days) income matrix
+
+    Returns:
+        (daily income matrix, transaction count per user)
+    """
+    offset = day_numbers - start_day
+    in_window = (offset >= 0) & (offset < window_days)
+    flat = user_index[in_window] * window_days + offset[in_window]
+    daily = np.bincount(flat, weights=amounts[in_window], minlength=n_users * window_days)
+    counts = np.bincount(user_index[in_window], minlength=n_users)
+    return daily.reshape(n_users, window_days), counts
+
+
+def _safe_divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator, dtype=np.float64), where=denominator != 0)
+
+
+def pattern_metrics(daily: np.ndarray, start_day: int, transaction_counts: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Compute every income-pattern statistic for all users at once
+
+    Args:
+        daily: (users x days) daily income matrix
+        start_day: Day number of column 0
+        transaction_counts: Income transactions per user inside the window
+
+    Returns:
+        Metric name -> array with one entry (or row) per user
+    """
+    n_users, n_days = daily.shape
+    day_numbers = start_day + np.arange(n_days)
+    mean_daily = daily.mean(axis=1)
+
+    # Weekly totals over complete weeks, aligned to the end of the window
+    n_weeks = n_days // ROLLING_DAYS
+    weekly = daily[:, n_days - n_weeks * ROLLING_DAYS:].reshape(n_users, n_weeks, ROLLING_DAYS).sum(axis=2)
+    weekly_mean = weekly.mean(axis=1)
+    weekly_std = weekly.std(axis=1)
+
+    # Weekday histogram: mean income per weekday, and its seasonal index vs the overall mean
+    weekday = weekday_of(day_numbers)
+    weekday_days = np.bincount(weekday, minlength=7)
+    weekday_onehot = np.eye(7)[weekday]                        # days x 7
+    weekday_mean = (daily @ weekday_onehot) / weekday_days    # users x 7
+    weekday_index = _safe_divide(weekday_mean, mean_daily[:, None])
+
+    # Week-of-month seasonality (days 1-7, 8-14, 15-21, 22+)
+    day_of_month = (day_numbers.astype("datetime64[D]") - day_numbers.astype("datetime64[D]").astype("datetime64[M]")).astype(np.int64)
+    week_of_month = np.minimum(day_of_month // 7, 3)
+    wom_onehot = np.eye(4)[week_of_month]
+    wom_mean = (daily @ wom_onehot) / np.maximum(wom_onehot.sum(axis=0), 1)
+    wom_index = _safe_divide(wom_mean, mean_daily[:, None])
+
+    # Rolling 7-day mean/std at the end of the window
+    windows = np.lib.stride_tricks.sliding_window_view(daily, ROLLING_DAYS, axis=1)
+    rolling_mean = windows.mean(axis=2)
+    rolling_std = windows.std(axis=2)
+
+    # Linear trend by least squares on the daily series
+    t = np.arange(n_days) - (n_days - 1) / 2.0
+    slope = (daily - mean_daily[:, None]) @ t / (t @ t)
+    relative_change = _safe_divide(slope * n_days, mean_daily)
+
+    # Monthly totals
+    months = day_numbers.astype("datetime64[D]").astype("datetime64[M]")
+    month_keys, month_index = np.unique(months, return_inverse=True)
+    monthly = daily @ np.eye(len(month_keys))[month_index]
+
+    daily_cv = _safe_divide(daily.std(axis=1), mean_daily)
+    weekly_cv = _safe_divide(weekly_std, weekly_mean)
+    active_fraction = (daily > 0).mean(axis=1)
+    confidence = 0.5 * np.minimum(transaction_counts / CONFIDENT_TRANSACTION_COUNT, 1.0) + 0.5 * active_fraction
+
+    return {
+        "mean_daily": mean_daily,
+        "weekly_mean": weekly_mean,
+        "weekly_min": weekly.min(axis=1),
+        "weekly_max": weekly.max(axis=1),
+        "weekly_std": weekly_std,
+        "daily_cv": daily_cv,
+        "weekly_cv": weekly_cv,
+        "volatility_score": np.clip(weekly_cv, 0.0, 1.0),
+        "weekday_mean": weekday_mean,
+        "weekday_index": weekday_index,
+        "week_of_month_index": wom_index,
+        "rolling_mean_7d": rolling_mean[:, -1],
+        "rolling_std_7d": rolling_std[:, -1],
+        "slope_per_day": slope,
+        "relative_change": relative_change,
+        "monthly": monthly,
+        "month_keys": month_keys.astype(str),
+        "active_fraction": active_fraction,
+        "confidence_score": confidence,
+    }
+
+
+def _trend_direction(relative_change: float) -> str:
+    if relative_change > TREND_THRESHOLD:
+        return "increasing"
+    if relative_change < -TREND_THRESHOLD:
+        return "decreasing"
+    return "stable"
+
+
+def pattern_row(metrics: Dict[str, np.ndarray], i: int) -> Dict[str, Any]:
+    """Format user i's metrics as an income_patterns row"""
+    r = lambda value: round(float(value), 2)  # noqa: E731
+
+    return {
+        "pattern_type": "baseline",
+        "avg_income": r(metrics["weekly_mean"][i]),
+        "min_income": r(metrics["weekly_min"][i]),
+        "max_income": r(metrics["weekly_max"][i]),
+        "confidence_score": round(float(metrics["confidence_score"][i]), 2),
+        "weekday_income": {
+            name: r(metrics["weekday_mean"][i, d]) for d, name in enumerate(WEEKDAY_NAMES)
+        },
+        "monthly_trend": {
+            "monthly_totals": {
+                str(month): r(metrics["monthly"][i, m]) for m, month in enumerate(metrics["month_keys"])
+            },
+            "trend_direction": _trend_direction(metrics["relative_change"][i]),
+            "slope_per_day": r(metrics["slope_per_day"][i]),
+            "relative_change": round(float(metrics["relative_change"][i]), 3),
+            "average_daily_income": r(metrics["mean_daily"][i]),
+            "rolling_7d_mean": r(metrics["rolling_mean_7d"][i]),
+            "rolling_7d_std": r(metrics["rolling_std_7d"][i]),
+            "weekly_std": r(metrics["weekly_std"][i]),
+            "coefficient_of_variation": round(float(metrics["weekly_cv"][i]), 3),
+            "daily_coefficient_of_variation": round(float(metrics["daily_cv"][i]), 3),
+            "volatility_score": round(float(metrics["volatility_score"][i]), 3),
+        },
+        "seasonal_factors": {
+            "weekday_index": {
+                name: round(float(metrics["weekday_index"][i, d]), 3) for d, name in enumerate(WEEKDAY_NAMES)
+            },
+            "week_of_month_index": {
+                f"week_{w + 1}": round(float(metrics["week_of_month_index"][i, w]), 3) for w in range(4)
+            },
+            "active_day_fraction": round(float(metrics["active_fraction"][i]), 3),
+        },
+    }
+
+
+def compute_income_pattern(
+    day_numbers: np.ndarray,
+    amounts: np.ndarray,
+    as_of: Optional[date] = None,
+    window_days: int = WINDOW_DAYS,
+) -> Dict[str, Any]:
+    """
+    Compute one user's income_patterns row from their income transactions
+
+    Args:
+        day_numbers: Transaction dates as days since epoch (see to_day_numbers)
+        amounts: Transaction amounts
+        as_of: Last day of the analysis window (defaults to today)
+        window_days: Length of the analysis window
+
+    Returns:
+        income_patterns row (without user_id / timestamps)
+    """
+    start_day = window_start(as_of, window_days)
+    user_index = np.zeros(len(day_numbers), dtype=np.int64)
+    daily, counts = daily_income_matrix(user_index, day_numbers, amounts, 1, start_day, window_days)
+    return pattern_row(pattern_metrics(daily, start_day, counts), 0)
+
+
+# Users per vectorised sweep; bounds the (users x days) matrix to ~10 MB
+BATCH_USERS = 20000
+
+
+def group_by_user(
+    user_ids: np.ndarray,
+    day_numbers: np.ndarray,
+    amounts: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Group flat transaction columns by user
+
+    Returns:
+        (unique user ids, offsets, day_numbers, amounts) where user k's
+        transactions are day_numbers[offsets[k]:offsets[k + 1]] (same for amounts)
+    """
+    order = np.argsort(user_ids, kind="stable")
+    sorted_users = user_ids[order]
+    users, starts = np.unique(sorted_users, return_index=True)
+    offsets = np.append(starts, len(sorted_users))
+    return users, offsets, day_numbers[order], amounts[order]
+
+
+def compute_income_patterns_batch(
+    user_ids: np.ndarray,
+    day_numbers: np.ndarray,
+    amounts: np.ndarray,
+    as_of: Optional[date] = None,
+    window_days: int = WINDOW_DAYS,
+    batch_users: int = BATCH_USERS,
+    all_users: Optional[Iterable[str]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Compute income_patterns rows for many users at once
+
+    Args:
+        user_ids: User id of each transaction
+        day_numbers: Transaction dates as days since epoch
+        amounts: Transaction amounts
+        as_of: Last day of the analysis window (defaults to today)
+        window_days: Length of the analysis window
+        batch_users: Users per vectorised sweep
+        all_users: Users to return a row for even without transactions in the
+            window (they get the same zero pattern as compute_income_pattern)
+
+    Returns:
+        user_id -> income_patterns row (without user_id / timestamps)
+    """
+    users, offsets, day_numbers, amounts = group_by_user(user_ids, day_numbers, amounts)
+    start_day = window_start(as_of, window_days)
+    rows: Dict[str, Dict[str, Any]] = {}
+
+    for first in range(0, len(users), batch_users):
+        last = min(first + batch_users, len(users))
+        lo, hi = offsets[first], offsets[last]
+        user_index = np.repeat(np.arange(last - first), np.diff(offsets[first:last + 1]))
+        daily, counts = daily_income_matrix(
+            user_index, day_numbers[lo:hi], amounts[lo:hi], last - first, start_day, window_days
+        )
+        metrics = pattern_metrics(daily, start_day, counts)
+        for i in range(last - first):
+            rows[str(users[first + i])] = pattern_row(metrics, i)
+
+    missing = [user_id for user_id in (all_users or []) if user_id not in rows]
+    if missing:
+        empty = compute_income_pattern(np.empty(0, dtype=np.int64), np.empty(0), as_of, window_days)
+        for user_id in missing:
+            rows[user_id] = dict(empty)
+
+    return rows
@@ -1,18 +1,36 @@
 """
 Recommendation Engine Agent
 Generates personalized financial guidance based on all available data
+Candidates come from the recommendation rules engine; the LLM only optionally rephrases the top ones
 Writes to: recommendations table
 """
 
 import asyncio
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 import sys
+from typing import Any, Dict, List, Optional
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from autogen_runtime import run_autogen_mcp_task
+from autogen_runtime import parse_agent_json, run_autogen_mcp_task, write_agent_data
+from forecast_engine import HISTORY_DAYS
+from postgrest_client import get_postgrest_client
+from user_snapshot import UserSnapshot
+from recommendation_engine import TOP_K, compute_recommendations
+from tax_engine import financial_year
+
+# Set RECOMMENDATION_AGENT_LLM_PHRASING=true to have the LLM rewrite the recommendation text
+LLM_PHRASING = os.getenv("RECOMMENDATION_AGENT_LLM_PHRASING", "false").lower() == "true"
+
+TRANSACTION_COLUMNS = "user_id,amount,transaction_type,category,source,payment_method,transaction_date"
+PROFILE_COLUMNS = "user_id,current_emergency_fund,monthly_expenses_avg,debt_obligations,risk_tolerance"
+BILL_COLUMNS = "id,user_id,bill_name,amount,due_date,frequency,priority,late_fee,grace_period_days,last_paid_date"
+UNPAID_BILL_STATUSES = "in.(pending,overdue,scheduled)"
+
+# Fields the LLM may rewrite; title stays fixed because it is part of the upsert key
+PHRASED_FIELDS = ("description", "reasoning", "action_items", "expected_outcome")
 
 
 class RecommendationAgent:
@@ -23,123 +41,94 @@ class RecommendationAgent:
         self.system_prompt = self._create_system_prompt()
 
     def _create_system_prompt(self) -> str:
-        return """You are a Recommendation Engine providing personalized financial guidance to gig workers.
+        return """You are a Recommendation Engine providing personalized financial guidance to gig workers in India.
+
+You are given recommendations that have already been chosen and ranked from the
+user's transactions, profile, bills and tax estimate. Do not add, remove or reorder
+recommendations, do not change any amount or date, and do not write to the database.
 
-Your task is to analyze all available data and generate actionable recommendations in the exact JSON format required by the recommendations table.
+Rewrite the text of each recommendation in simple, encouraging language for a gig worker.
 
-**CRITICAL: You must output ONLY valid JSON that matches the recommendations table schema:**
+**Output ONLY valid JSON, one entry per recommendation in the same order:**
 
 ```json
 {
   "recommendations": [
     {
-      "recommendation_type": "savings",
-      "priority": "high",
-      "title": "Build Emergency Fund",
-      "description": "Create a 6-month emergency fund to handle income volatility",
-      "reasoning": "Gig workers have irregular income patterns and need safety net",
-      "action_items": ["Open separate savings account", "Set up auto-transfer of 10% income", "Track progress monthly"],
-      "target_amount": 50000.00,
-      "target_date": "2026-06-30",
-      "confidence_score": 0.85,
-      "expected_outcome": "Financial security during low income periods",
-      "success_probability": 0.75,
-      "agent_source": "recommendation_agent",
-      "context_data": {"income_volatility": "high", "current_savings": 5000}
-    },
-    {
-      "recommendation_type": "income_optimization",
-      "priority": "medium", 
-      "title": "Diversify Income Sources",
-      "description": "Add additional gig platforms to reduce dependency",
-      "reasoning": "Multiple income streams reduce volatility risk",
-      "action_items": ["Register on 2 new platforms", "Schedule peak hours", "Track platform performance"],
-      "target_amount": 8000.00,
-      "target_date": "2026-03-31",
-      "confidence_score": 0.70,
-      "expected_outcome": "20% increase in monthly income",
-      "success_probability": 0.80,
-      "agent_source": "recommendation_agent",
-      "context_data": {"current_platforms": 1, "peak_hours": "evening"}
+      "description": "One sentence on what to do",
+      "reasoning": "One or two sentences on why, using the user's numbers",
+      "action_items": ["Concrete step", "Concrete step", "Concrete step"],
+      "expected_outcome": "What changes for the user"
     }
   ]
 }
-```
-
-**What you do:**
-1. Read multiple data sources using postgrestRequest():
-   - income_patterns: postgrestRequest("income_patterns", "GET", filters={"user_id": "USER_ID"})
-   - budgets: postgrestRequest("budgets", "GET", filters={"user_id": "USER_ID"})
-   - income_forecasts: postgrestRequest("income_forecasts", "GET", filters={"user_id": "USER_ID"})
-   - risk_assessments: postgrestRequest("risk_assessments", "GET", filters={"user_id": "USER_ID"})
-   - user_profiles: postgrestRequest("user_profiles", "GET", filters={"user_id": "USER_ID"})
-   - transactions: postgrestRequest("transactions", "GET", filters={"user_id": "USER_ID"})
-2. Identify opportunities for improvement in:
-   - Savings (emergency fund, goals)
-   - Income optimization (timing, diversification)
-   - Debt management (prioritization, consolidation)
-   - Budget optimization (reduce waste)
-   - Risk mitigation (insurance, diversification)
-   - Tax efficiency (deductions, regime choice)
-3. Create 3-7 prioritized recommendations
-4. Output ONLY the JSON format above - no explanations
-5. Use realistic amounts and dates for Indian gig workers
-
-**Database Tool Usage:**
-- Use postgrestRequest() to read data from tables
-- Example: postgrestRequest("risk_assessments", "GET", filters={"user_id": "153735c8-b1e3-4fc6-aa4e-7deb6454990b"})
-- This returns JSON data you can analyze for recommendations
-
-**Database Schema Requirements:**
-- recommendation_type: "savings", "income_optimization", "debt_management", "budget_optimization", "risk_mitigation", "tax_efficiency"
-- priority: "urgent", "high", "medium", "low"
-- target_amount: Number with 2 decimals
-- target_date: Date string in YYYY-MM-DD format
-- confidence_score: Number between 0-1
-- success_probability: Number between 0-1
-- action_items: Array of strings
-- context_data: JSON object with relevant data
-
-**Output ONLY the JSON array. No other text.**
-5. Write results to recommendations table
-6. Log your actions to agent_logs table
-
-**Recommendation Types:**
-- savings: Build emergency fund, increase savings rate
-- income: Diversify income sources, optimize timing
-- debt: Pay off high-interest debt, consolidate loans
-- budget: Reduce discretionary spending, optimize categories
-- risk: Get insurance, build emergency fund
-- tax: Maximize deductions, choose optimal regime
-
-**Priority Levels:**
-- high: Critical issues (high debt, no emergency fund)
-- medium: Important improvements (increase savings)
-- low: Nice-to-have optimizations (minor budget tweaks)
-
-**Available MCP Tools:**
-- mcp__supabase-postgres__postgrestRequest: Execute database queries
-- mcp__supabase-postgres__sqlToRest: Convert SQL to REST API calls
-
-**Output Format:**
-Store in recommendations table with fields:
-- user_id
-- recommendation_type (savings/income/debt/budget/risk/tax)
-- priority (high/medium/low)
-- title (short summary)
-- description (detailed explanation)
-- reasoning (AI explanation)
-- action_items (JSON array of concrete steps)
-- confidence_score (0-1)
-- success_probability (0-1)
-- created_at"""
-
-    async def analyze_user(self, user_id: str) -> dict:
+```"""
+
+    async def fetch_recommendation_inputs(self, user_id: str, snapshot: Optional[UserSnapshot] = None) -> tuple:
+        """Fetch the user's transactions, profile, unpaid bills, bank balances and occupation"""
+        client = snapshot or get_postgrest_client()
+        history_start = (datetime.now() - timedelta(days=HISTORY_DAYS + 1)).date()
+        start = min(history_start, financial_year()["start"]).isoformat()
+        return await asyncio.gather(
+            client.select("transactions", filters={"user_id": user_id, "transaction_date": f"gte.{start}"},
+                          columns=TRANSACTION_COLUMNS),
+            client.select("user_profiles", filters={"user_id": user_id}, columns=PROFILE_COLUMNS),
+            client.select("bills", filters={"user_id": user_id, "status": UNPAID_BILL_STATUSES}, columns=BILL_COLUMNS),
+            client.select("bank_accounts", filters={"user_id": user_id, "is_active": "is.true"},
+                          columns="user_id,current_balance"),
+            client.select("users", filters={"user_id": user_id}, columns="occupation"),
+        )
+
+    async def phrase_recommendations(self, user_id: str, recommendations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Ask the LLM to rewrite the recommendation text
+
+        Amounts, dates, priorities and titles are kept from the rules engine;
+        if the output can't be parsed the template text is kept.
+        """
+        facts = [
+            {key: rec[key] for key in ("title", "priority", "target_amount", "target_date", *PHRASED_FIELDS)}
+            for rec in recommendations
+        ]
+        output = await run_autogen_mcp_task(
+            agent_name="recommendation_phrasing",
+            system_prompt=self.system_prompt,
+            task=f"Recommendations for user {user_id}:\n{json.dumps(facts, indent=2)}",
+            user_id=user_id,
+            use_azure=True
+        )
+        try:
+            phrased = parse_agent_json(output).get("recommendations", [])
+        except (json.JSONDecodeError, AttributeError):
+            print("[Recommendation Agent] Could not parse LLM phrasing, keeping template text")
+            return recommendations
+        if len(phrased) != len(recommendations):
+            return recommendations
+        return [
+            {**rec, **{key: text[key] for key in PHRASED_FIELDS if isinstance(text, dict) and text.get(key)}}
+            for rec, text in zip(recommendations, phrased)
+        ]
+
+    async def retire_recommendations(self, user_id: str, current: List[Dict[str, Any]]) -> None:
+        """
+        Delete this agent's pending recommendations whose rule is no longer in the top-k
+
+        Recommendations the user has already acted on (any status other than
+        pending) are kept.
+        """
+        filters = {"user_id": user_id, "agent_source": "recommendation_agent", "status": "pending"}
+        if current:
+            titles = ",".join('"{}"'.format(rec["title"].replace('"', '\\"')) for rec in current)
+            filters["title"] = f"not.in.({titles})"
+        await get_postgrest_client().delete("recommendations", filters)
+
+    async def analyze_user(self, user_id: str, snapshot: Optional[UserSnapshot] = None) -> dict:
         """
         Generate recommendations for a specific user
 
         Args:
             user_id: UUID of the user to analyze
+            snapshot: Per-run snapshot of the user's input rows (read from the database if None)
 
         Returns:
             dict with analysis results and success status
@@ -147,37 +136,27 @@ Store in recommendations table with fields:
         print(f"[Recommendation Agent] Starting analysis for user {user_id}")
 
         try:
-            prompt = f"""Generate personalized recommendations for user {user_id}.
-
-Steps:
-1. Read all available data:
-   - income_patterns
-   - budgets
-   - income_forecasts
-   - risk_assessments
-   - user_profiles
-   - Recent transactions
-2. Identify 3-7 key recommendations across different types
-3. Prioritize by impact and urgency
-4. For each recommendation:
-   - Write clear title and description
-   - Explain AI reasoning
-   - Provide actionable steps
-   - Estimate confidence and success probability
-5. Write all recommendations to recommendations table
-6. Log to agent_logs table
-
-User ID: {user_id}
-
-Please execute this analysis and report the recommendations created."""
-
-            result = await run_autogen_mcp_task(
-                agent_name="recommendation_agent",
-                system_prompt=self.system_prompt,
-                task=prompt,
-                user_id=user_id,
-                use_azure=True
+            transactions, profiles, bills, accounts, users = await self.fetch_recommendation_inputs(user_id, snapshot)
+            cash = sum(float(account.get("current_balance") or 0) for account in accounts)
+            recommendations = compute_recommendations(
+                transactions,
+                {user_id: profiles[0]} if profiles else {},
+                {user_id: bills},
+                {user_id: cash},
+                {user_id: users[0].get("occupation") if users else None},
+                [user_id],
+                top_k=TOP_K,
+            )[user_id]
+            print(f"[Recommendation Agent] {len(recommendations)} recommendations: "
+                  f"{', '.join(rec['context_data']['rule'] for rec in recommendations) or 'none'}")
+
+            if LLM_PHRASING and recommendations:
+                recommendations = await self.phrase_recommendations(user_id, recommendations)
+
+            written = await write_agent_data(
+                user_id, "recommendation_agent", {"recommendations": [dict(rec) for rec in recommendations]}
             )
+            await self.retire_recommendations(user_id, recommendations)
 
             print(f"[Recommendation Agent] Analysis complete for user {user_id}")
 
@@ -185,7 +164,7 @@ Please execute this analysis and report the recommendations created."""
                 "success": True,
                 "user_id": user_id,
                 "agent": "recommendation_engine",
-                "result": result,
+                "result": {"recommendations": recommendations, "written": written},
                 "timestamp": datetime.now().isoformat()
             }
 
@@ -0,0 +1,345 @@
+"""
+Recommendation Engine
+Rule-based recommendation candidates behind the Recommendation Agent
+
+Metrics come from the other engines (health aggregates for the emergency
+fund, debt-to-income and surplus, the tax engine for old vs new regime, the
+bill scheduler for bills that can't be paid on time). Each rule turns one
+metric into at most one candidate with a 0-1 score (how far past its
+threshold the metric is, times the rule's weight); the top-k candidates
+become the user's recommendations. Titles are fixed per rule, so a rerun
+upserts the same (user_id, recommendation_type, title) rows.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from bill_engine import compute_bill_schedules
+from forecast_engine import EMERGENCY_FUND_MONTHS, volatility_category
+from goal_engine import add_months
+from health_engine import TARGET_INVESTMENT_RATE, compute_health, health_aggregates
+from tax_engine import compute_tax, financial_year, summarise_transactions
+
+
+TOP_K = 5
+
+# Rule weight in the candidate score (score = weight x severity)
+RULE_WEIGHTS = {
+    "missed_bill_risk": 1.0,
+    "emergency_fund_gap": 0.9,
+    "high_debt_to_income": 0.85,
+    "regime_switch": 0.6,
+    "idle_surplus": 0.5,
+}
+
+# Lower bound of each priority band
+PRIORITY_SCORES = [(0.75, "urgent"), (0.5, "high"), (0.25, "medium"), (0.0, "low")]
+
+# EMIs above this share of income get a debt recommendation (severity 1 at MAX_DEBT_TO_INCOME)
+DEBT_TO_INCOME_THRESHOLD = 0.40
+MAX_DEBT_TO_INCOME = 0.60
+
+# Regime a return is filed under unless the user opts out (Section 115BAC)
+DEFAULT_REGIME = "new"
+
+# Regime savings below this aren't worth the paperwork; severity 1 at REGIME_SAVING_SCALE
+MIN_REGIME_SAVING = 1000
+REGIME_SAVING_SCALE = 25000
+
+# Cash above this (after a month of expenses and upcoming bills) counts as idle
+MIN_IDLE_SURPLUS = 10000
+IDLE_SURPLUS_MONTHS = 3  # idle cash worth this many months of expenses scores 1
+
+# Months to close an emergency fund gap when the surplus doesn't say otherwise
+DEFAULT_FILL_MONTHS = 12
+MAX_FILL_MONTHS = 36
+
+
+def priority_for(score: float) -> str:
+    for lower, priority in PRIORITY_SCORES:
+        if score >= lower:
+            return priority
+    return PRIORITY_SCORES[-1][1]
+
+
+def recommendation_metrics(
+    transactions: List[Dict[str, Any]],
+    profiles: Dict[str, Dict[str, Any]],
+    bills_by_user: Dict[str, List[Dict[str, Any]]],
+    cash_by_user: Dict[str, float],
+    occupations: Dict[str, Optional[str]],
+    users: List[str],
+    as_of: Optional[date] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Metrics the rules read, for many users at once
+
+    Args:
+        transactions: Transactions (user_id, amount, transaction_type, category, source,
+            payment_method, transaction_date) since the earlier of the health
+            window and the financial year start
+        profiles: user_id -> user_profiles row
+        bills_by_user: user_id -> unpaid bills rows
+        cash_by_user: user_id -> current bank balance
+        occupations: user_id -> users.occupation
+        users: Users to compute metrics for
+        as_of: Calculation date (defaults to today)
+
+    Returns:
+        user_id -> metric name -> value
+    """
+    as_of = as_of or datetime.now().date()
+    position = {user: i for i, user in enumerate(users)}
+
+    aggregates = health_aggregates(transactions, profiles, users, as_of)
+    health = compute_health(aggregates)
+    income_rows = [r for r in transactions if r.get("transaction_type") == "income"]
+    bills = compute_bill_schedules(bills_by_user, income_rows, cash_by_user, users, as_of)
+
+    # Regime comparison on this financial year's transactions
+    fy_start = financial_year(as_of)["start"].isoformat()
+    fy_rows: Dict[str, List[Dict[str, Any]]] = {user: [] for user in users}
+    for r in transactions:
+        if r["user_id"] in position and str(r.get("transaction_date") or "")[:10] >= fy_start:
+            fy_rows[r["user_id"]].append(r)
+    summaries = [summarise_transactions(fy_rows[user], occupations.get(user), as_of) for user in users]
+    column = lambda key: [s[key] for s in summaries]  # noqa: E731
+    tax = compute_tax(
+        gross_receipts=column("gross_receipts"),
+        business_expenses=column("business_expenses"),
+        digital_share=column("digital_share"),
+        is_professional=column("is_professional"),
+        deductions={"80c": column("80c"), "80d": column("80d")},
+        platform_receipts=column("platform_receipts"),
+        advance_tax_paid=column("advance_tax_paid"),
+        fy=financial_year(as_of)["financial_year"],
+    ) if users else {}
+
+    metrics = {}
+    for user, i in position.items():
+        income = float(aggregates["monthly_income"][i])
+        expenses = float(aggregates["monthly_expenses"][i]) or float(aggregates["profile_expenses"][i])
+        debt_payments = max(float(aggregates["monthly_debt_payments"][i]), float(aggregates["profile_debt_payments"][i]))
+        analysis = bills[user]
+        metrics[user] = {
+            "monthly_income": income,
+            "monthly_expenses": expenses,
+            "monthly_surplus": income - expenses,
+            "monthly_debt_payments": debt_payments,
+            "debt_to_income": float(health["debt_to_income"][i]),
+            "emergency_fund": float(aggregates["emergency_fund"][i]),
+            "emergency_fund_months": float(health["emergency_fund_months"][i]),
+            "emergency_target_months": EMERGENCY_FUND_MONTHS[volatility_category(float(health["volatility"][i]))],
+            "monthly_investment": float(aggregates["monthly_investment"][i]),
+            "cash": float(cash_by_user.get(user) or 0),
+            "bills_due": analysis["total_bills_due"],
+            "unfunded_bills": analysis["unfunded_bills"],
+            "late_bills": [p for p in analysis["payments"] if p["late"]],
+            "late_fee_risk": analysis["late_fee_risk"],
+            "current_regime": DEFAULT_REGIME,
+            "new_regime_tax": float(tax["new_regime_tax"][i]),
+            "old_regime_tax": float(tax["old_regime_tax"][i]),
+            "transaction_count": len(fy_rows[user]),
+        }
+    return metrics
+
+
+def _recommendation(
+    rule: str,
+    severity: float,
+    recommendation_type: str,
+    title: str,
+    description: str,
+    reasoning: str,
+    action_items: List[str],
+    target_amount: float,
+    target_date: date,
+    expected_outcome: str,
+    confidence: float,
+    success_probability: float,
+    context: Dict[str, Any],
+) -> Tuple[float, Dict[str, Any]]:
+    score = round(RULE_WEIGHTS[rule] * min(max(severity, 0.0), 1.0), 3)
+    return score, {
+        "recommendation_type": recommendation_type,
+        "priority": priority_for(score),
+        "title": title,
+        "description": description,
+        "reasoning": reasoning,
+        "action_items": action_items,
+        "target_amount": round(float(target_amount), 2),
+        "target_date": target_date.isoformat(),
+        "confidence_score": round(confidence, 2),
+        "expected_outcome": expected_outcome,
+        "success_probability": round(success_probability, 2),
+        "agent_source": "recommendation_agent",
+        "context_data": {"rule": rule, "score": score, **context},
+    }
+
+
+def _missed_bill_risk(m: Dict[str, Any], as_of: date) -> Optional[Tuple[float, Dict[str, Any]]]:
+    unfunded, late = m["unfunded_bills"], m["late_bills"]
+    if not unfunded and not late:
+        return None
+    at_risk = unfunded + late
+    amount = sum(b["amount"] for b in at_risk)
+    names = ", ".join(b["bill_name"] or "bill" for b in at_risk[:3])
+    first_due = min(date.fromisoformat(b["due_date"]) for b in at_risk)
+    return _recommendation(
+        "missed_bill_risk",
+        1.0 if unfunded else 0.8,
+        "risk_mitigation",
+        "Cover Bills at Risk of Being Missed",
+        f"Expected cash does not cover {names} (Rs {amount:,.0f}) by the due date",
+        f"{len(unfunded)} bill(s) can't be funded and {len(late)} would land after the grace period, "
+        f"with Rs {m['late_fee_risk']:,.0f} in expected late fees",
+        ["Set aside earnings from the next few working days for these bills",
+         "Ask the biller to move the due date closer to your high-income days",
+         "Turn on auto-pay once the balance is in place"],
+        amount, first_due,
+        "All bills paid on time with no late fees",
+        0.8, 0.7,
+        {"bills": [b["bill_name"] for b in at_risk], "late_fee_risk": m["late_fee_risk"]},
+    )
+
+
+def _emergency_fund_gap(m: Dict[str, Any], as_of: date) -> Optional[Tuple[float, Dict[str, Any]]]:
+    target_months = m["emergency_target_months"]
+    if m["monthly_expenses"] <= 0 or m["emergency_fund_months"] >= target_months:
+        return None
+    target = target_months * m["monthly_expenses"]
+    gap = target - m["emergency_fund"]
+    surplus = m["monthly_surplus"]
+    fill_months = min(int(-(-gap // surplus)), MAX_FILL_MONTHS) if surplus > 0 else DEFAULT_FILL_MONTHS
+    monthly = gap / fill_months
+    return _recommendation(
+        "emergency_fund_gap",
+        1.0 - m["emergency_fund_months"] / target_months,
+        "savings",
+        "Build Emergency Fund",
+        f"Grow your emergency fund from Rs {m['emergency_fund']:,.0f} to Rs {target:,.0f} "
+        f"({target_months} months of expenses)",
+        f"Savings cover {m['emergency_fund_months']:.1f} months of expenses; with your income volatility "
+        f"the target is {target_months} months",
+        ["Open a separate savings account for the fund",
+         f"Move Rs {monthly:,.0f} into it every month, more in high-income weeks",
+         "Only use it for lost work, medical bills or urgent repairs"],
+        target, add_months(as_of, fill_months),
+        f"A {target_months}-month buffer against slow weeks",
+        0.85, 0.75 if surplus > 0 else 0.4,
+        {"emergency_fund_months": round(m["emergency_fund_months"], 1), "monthly_contribution": round(monthly, 2)},
+    )
+
+
+def _high_debt_to_income(m: Dict[str, Any], as_of: date) -> Optional[Tuple[float, Dict[str, Any]]]:
+    dti = m["debt_to_income"]
+    if dti <= DEBT_TO_INCOME_THRESHOLD:
+        return None
+    excess = m["monthly_debt_payments"] - DEBT_TO_INCOME_THRESHOLD * m["monthly_income"]
+    return _recommendation(
+        "high_debt_to_income",
+        (dti - DEBT_TO_INCOME_THRESHOLD) / (MAX_DEBT_TO_INCOME - DEBT_TO_INCOME_THRESHOLD),
+        "debt_management",
+        "Reduce EMI Burden",
+        f"EMIs take {dti:.0%} of your income; bring them below {DEBT_TO_INCOME_THRESHOLD:.0%}",
+        f"Monthly EMIs of Rs {m['monthly_debt_payments']:,.0f} against Rs {m['monthly_income']:,.0f} "
+        "income leave little room for a slow month",
+        ["Pay off the highest-interest loan first",
+         "Ask your lender about consolidating or extending the tenure",
+         "Avoid new loans or buy-now-pay-later until EMIs are lower"],
+        excess, as_of + timedelta(days=180),
+        f"Rs {excess:,.0f} less in monthly EMIs",
+        0.8, 0.6,
+        {"debt_to_income": round(dti, 2), "monthly_debt_payments": round(m["monthly_debt_payments"], 2)},
+    )
+
+
+def _regime_switch(m: Dict[str, Any], as_of: date) -> Optional[Tuple[float, Dict[str, Any]]]:
+    taxes = {"new": m["new_regime_tax"], "old": m["old_regime_tax"]}
+    better = min(taxes, key=taxes.get)
+    current = m["current_regime"] if m["current_regime"] in taxes else "new"
+    saving = taxes[current] - taxes[better]
+    if saving < MIN_REGIME_SAVING:
+        return None
+    fy = financial_year(as_of)
+    return _recommendation(
+        "regime_switch",
+        saving / REGIME_SAVING_SCALE,
+        "tax_efficiency",
+        f"Switch to the {better.title()} Tax Regime",
+        f"Filing under the {better} regime saves Rs {saving:,.0f} in tax for {fy['financial_year']}",
+        f"Estimated tax is Rs {taxes['new']:,.0f} under the new regime and Rs {taxes['old']:,.0f} under the old regime",
+        [f"Choose the {better} regime when filing your return",
+         "File Form 10-IEA before the return due date to opt out of the new regime" if better == "old"
+         else "No form is needed - the new regime is the default",
+         "Keep deduction proofs (80C, 80D) with your tax papers"],
+        saving, date(fy["end"].year, 7, 31),
+        f"Rs {saving:,.0f} lower tax this year",
+        0.7 if m["transaction_count"] >= 30 else 0.5, 0.9,
+        {"new_regime_tax": round(taxes["new"], 2), "old_regime_tax": round(taxes["old"], 2), "current_regime": current},
+    )
+
+
+def _idle_surplus(m: Dict[str, Any], as_of: date) -> Optional[Tuple[float, Dict[str, Any]]]:
+    if m["emergency_fund_months"] < m["emergency_target_months"]:
+        return None
+    if m["monthly_income"] > 0 and m["monthly_investment"] / m["monthly_income"] >= TARGET_INVESTMENT_RATE:
+        return None
+    idle = m["cash"] - m["monthly_expenses"] - m["bills_due"]
+    if idle < MIN_IDLE_SURPLUS:
+        return None
+    scale = IDLE_SURPLUS_MONTHS * m["monthly_expenses"]
+    return _recommendation(
+        "idle_surplus",
+        idle / scale if scale > 0 else 1.0,
+        "savings",
+        "Invest Idle Savings",
+        f"Rs {idle:,.0f} is sitting in your bank account beyond a month of expenses and upcoming bills",
+        "Your emergency fund is complete and you invest less than "
+        f"{TARGET_INVESTMENT_RATE:.0%} of income, so spare cash is losing value to inflation",
+        ["Start a recurring deposit or PPF account for part of the surplus",
+         "Set up a small monthly index fund SIP",
+         "Keep one month of expenses in your bank account"],
+        idle, as_of + timedelta(days=30),
+        "Spare cash earning 7-11% a year instead of savings account interest",
+        0.75, 0.8,
+        {"idle_cash": round(idle, 2), "cash": round(m["cash"], 2)},
+    )
+
+
+RULES = [_missed_bill_risk, _emergency_fund_gap, _high_debt_to_income, _regime_switch, _idle_surplus]
+
+
+def generate_candidates(metrics: Dict[str, Any], as_of: Optional[date] = None) -> List[Tuple[float, Dict[str, Any]]]:
+    """
+    Run every rule against one user's metrics
+
+    Returns:
+        (score, recommendation) pairs, best first
+    """
+    as_of = as_of or datetime.now().date()
+    candidates = [c for c in (rule(metrics, as_of) for rule in RULES) if c is not None]
+    return sorted(candidates, key=lambda c: -c[0])
+
+
+def compute_recommendations(
+    transactions: List[Dict[str, Any]],
+    profiles: Dict[str, Dict[str, Any]],
+    bills_by_user: Dict[str, List[Dict[str, Any]]],
+    cash_by_user: Dict[str, float],
+    occupations: Dict[str, Optional[str]],
+    users: List[str],
+    as_of: Optional[date] = None,
+    top_k: int = TOP_K,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Top-k recommendations for many users at once
+
+    Returns:
+        user_id -> recommendations, best first
+    """
+    metrics = recommendation_metrics(transactions, profiles, bills_by_user, cash_by_user, occupations, users, as_of)
+    return {
+        user: [rec for _, rec in generate_candidates(m, as_of)[:top_k]]
+        for user, m in metrics.items()
+    }
@@ -1,18 +1,34 @@
 """
 Risk Assessment Agent
 Evaluates financial health and identifies risk factors
+Scores and escalations come from the risk engine; the LLM only adds an optional narrative
 Writes to: risk_assessments table
 """
 
 import asyncio
 import json
-from datetime import datetime
+from collections import defaultdict
+from datetime import datetime, timedelta
 import os
 import sys
+from typing import Optional
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from autogen_runtime import run_autogen_mcp_task
+from autogen_runtime import AGENT_OUTPUT_UPSERT_KEYS, build_agent_rows, run_autogen_mcp_task, write_agent_data
+from postgrest_client import get_postgrest_client
+from user_snapshot import UserSnapshot
+from risk_engine import HISTORY_DAYS, RECENT_DAYS, compute_risk_assessments
+
+# Set RISK_AGENT_LLM_NARRATIVE=true to also ask the LLM to explain the assessment
+LLM_NARRATIVE = os.getenv("RISK_AGENT_LLM_NARRATIVE", "false").lower() == "true"
+
+# Rows per PostgREST page / array insert in batch mode
+BATCH_PAGE_SIZE = 1000
+
+TRANSACTION_COLUMNS = "user_id,amount,transaction_type,category,transaction_date"
+PROFILE_COLUMNS = "user_id,current_emergency_fund,monthly_expenses_avg,debt_obligations"
+ANOMALY_COLUMNS = "user_id,transaction_id,transaction_date,category,amount,expected_amount,anomaly_type,anomaly_score,severity"
 
 
 class RiskAssessmentAgent:
@@ -25,119 +41,23 @@ class RiskAssessmentAgent:
     def _create_system_prompt(self) -> str:
         return """You are a Risk Assessment Engine evaluating financial health for gig workers.
 
-Your task is to identify risks and determine if escalation to human advisors is needed, outputting structured JSON for the risk_assessments table.
-
-**CRITICAL: You must output ONLY valid JSON that matches the risk_assessments table schema:**
-
-```json
-{
-  "risk_assessment": {
-    "overall_risk_level": "medium",
-    "risk_score": 4.9,
-    "risk_factors": [
-      {"factor": "Emergency fund", "impact": "3.5 months coverage"},
-      {"factor": "Debt-to-income", "impact": "19% of income goes to EMIs"},
-      {"factor": "Income stability", "impact": "4% potential income drop scenario"}
-    ],
-    "debt_to_income_ratio": 0.19,
-    "income_drop_percentage": 0.044,
-    "expense_spike_factor": 1.36,
-    "emergency_fund_coverage": 3.5,
-    "transaction_anomalies": null,
-    "escalation_needed": false,
-    "escalation_priority": null,
-    "escalation_reason": null,
-    "recommended_actions": [
-      {"action": "Build emergency fund", "description": "Target at least 6 months of expenses in liquid savings"},
-      {"action": "Cap discretionary spending", "description": "Limit lifestyle spends to 20–30% of net income"},
-      {"action": "Control EMIs", "description": "Keep total EMIs below 40% of monthly income"}
-    ],
-    "ai_risk_analysis": "Moderate risk profile with adequate emergency fund but high debt burden"
-  }
-}
-```
-
-**What you do:**
-1. Read multiple data sources:
-   - transactions (recent patterns)
-   - income_patterns (volatility)
-   - budgets (financial constraints)
-   - user_profiles (debt, emergency fund)
-   - income_forecasts (future outlook)
-2. Evaluate 7 risk dimensions:
-   - Income volatility risk (high variation)
-   - Debt burden risk (high debt-to-income ratio)
-   - Emergency fund risk (no safety net)
-   - Expense spike risk (sudden large expenses)
-   - Income drop risk (declining trend)
-   - Transaction anomalies (unusual patterns)
-   - Overall financial health
-3. Calculate composite risk_score (0-10)
-4. Determine overall_risk_level (low/medium/high)
-5. Calculate debt_to_income_ratio and emergency_fund_coverage
-6. Decide if escalation_needed (critical cases require human advisor)
-7. Recommend specific actions to mitigate risks
-8. Output ONLY the JSON format above - no explanations
-
-**Database Schema Requirements:**
-- overall_risk_level: "low", "medium", "high"
-- risk_score: Number between 0-10 with 1 decimal
-- risk_factors: Array of objects with factor and impact
-- debt_to_income_ratio: Number between 0-1
-- income_drop_percentage: Number between 0-1
-- expense_spike_factor: Number (1.0 = normal, >1.0 = spike risk)
-- emergency_fund_coverage: Number (months of expenses)
-- transaction_anomalies: Array or null
-- escalation_needed: Boolean
-- escalation_priority: "urgent", "high", "medium", "low" or null
-- escalation_reason: String or null
-- recommended_actions: Array of objects with action and description
-- ai_risk_analysis: String summary
-
-**Output ONLY the JSON object. No other text.**
-9. Log to agent_logs table
-
-**Risk Scoring Guidelines:**
-- 0-3: Low risk (stable income, good savings)
-- 4-6: Medium risk (some concerns, manageable)
-- 7-10: High risk (critical issues, needs intervention)
-
-**Escalation Triggers:**
-- Debt-to-income ratio > 50%
-- No emergency fund + high volatility
-- Income dropped > 30% recently
-- Multiple late payments/defaults
-- Severe budget deficit
-
-**Key Metrics:**
-- Debt-to-income ratio: Total debt / Monthly income
-- Emergency fund coverage: Savings / Monthly expenses
-- Volatility index: From income_patterns
-- Trend: Improving/stable/declining
-
-**Available MCP Tools:**
-- mcp__supabase-postgres__postgrestRequest: Execute database queries
-- mcp__supabase-postgres__sqlToRest: Convert SQL to REST API calls
-
-**Output Format:**
-Store in risk_assessments table with fields:
-- user_id
-- overall_risk_level (low/medium/high)
-- risk_score (0-10)
-- risk_factors (JSON: {volatility: X, debt: Y, ...})
-- debt_to_income_ratio
-- emergency_fund_coverage (months)
-- escalation_needed (boolean)
-- escalation_priority (low/medium/high/critical)
-- recommended_actions (JSON array)
-- assessment_date"""
-
-    async def analyze_user(self, user_id: str) -> dict:
+You are given a risk assessment that has already been calculated from the user's
+transactions and profile (debt-to-income, emergency fund coverage, income drop,
+expense spikes, volatility, unusual transactions, 0-10 risk score and escalation rules).
+Do not change the numbers and do not write to the database.
+
+Explain the assessment to the gig worker in 3-5 short sentences:
+- Their overall risk and the main reason for it
+- Whether a human advisor will contact them and why
+- The first action they should take"""
+
+    async def analyze_user(self, user_id: str, snapshot: Optional[UserSnapshot] = None) -> dict:
         """
         Assess financial risks for a specific user
 
         Args:
             user_id: UUID of the user to analyze
+            snapshot: Per-run snapshot of the user's input rows (read from the database if None)
 
         Returns:
             dict with analysis results and success status
@@ -145,35 +65,34 @@ Store in risk_assessments table with fields:
         print(f"[Risk Agent] Starting analysis for user {user_id}")
 
         try:
-            prompt = f"""Assess financial risks for user {user_id}.
-
-Steps:
-1. Read all relevant data:
-   - transactions
-   - income_patterns
-   - budgets
-   - user_profiles
-   - income_forecasts
-2. Evaluate 7 risk dimensions
-3. Calculate composite risk_score (0-10)
-4. Determine overall_risk_level (low/medium/high)
-5. Calculate debt_to_income_ratio and emergency_fund_coverage
-6. Decide if escalation_needed (critical cases require human advisor)
-7. Recommend specific actions to mitigate risks
-8. Write results to risk_assessments table
-9. Log to agent_logs table
-
-User ID: {user_id}
-
-Please execute this assessment and report the risk level."""
-
-            result = await run_autogen_mcp_task(
-                agent_name="risk_agent",
-                system_prompt=self.system_prompt,
-                task=prompt,
-                user_id=user_id,
-                use_azure=True
+            client = snapshot or get_postgrest_client()
+            start = (datetime.now() - timedelta(days=HISTORY_DAYS)).date().isoformat()
+            recent = (datetime.now() - timedelta(days=RECENT_DAYS)).date().isoformat()
+            transactions, profiles, anomalies = await asyncio.gather(
+                client.select("transactions", filters={"user_id": user_id, "transaction_date": f"gte.{start}"},
+                              columns=TRANSACTION_COLUMNS),
+                client.select("user_profiles", filters={"user_id": user_id}, columns=PROFILE_COLUMNS),
+                client.select("transaction_anomalies", filters={"user_id": user_id, "transaction_date": f"gte.{recent}"},
+                              columns=ANOMALY_COLUMNS),
             )
+            profiles_by_user = {user_id: profiles[0]} if profiles else {}
+            assessment = compute_risk_assessments(
+                transactions, profiles_by_user, [user_id], anomalies_by_user={user_id: anomalies}
+            )[user_id]
+            print(f"[Risk Agent] {assessment['overall_risk_level']} risk ({assessment['risk_score']}/10), "
+                  f"escalation_needed={assessment['escalation_needed']}")
+
+            written = await write_agent_data(user_id, "risk_agent", {"risk_assessment": dict(assessment)})
+
+            result = {"risk_assessment": assessment, "written": written}
+            if LLM_NARRATIVE:
+                result["narrative"] = await run_autogen_mcp_task(
+                    agent_name="risk_narrative",
+                    system_prompt=self.system_prompt,
+                    task=f"Risk assessment for user {user_id}:\n{json.dumps(assessment, indent=2)}",
+                    user_id=user_id,
+                    use_azure=True
+                )
 
             print(f"[Risk Agent] Analysis complete for user {user_id}")
 
@@ -195,6 +114,65 @@ Please execute this assessment and report the risk level."""
                 "timestamp": datetime.now().isoformat()
             }
 
+    async def analyze_all_users(self) -> dict:
+        """
+        Score every active user in one vectorised pass
+
+        Returns:
+            dict with user/escalation counts, write errors and timing
+        """
+        started = datetime.now()
+        client = get_postgrest_client()
+        start = (started - timedelta(days=HISTORY_DAYS)).date().isoformat()
+        recent = (started - timedelta(days=RECENT_DAYS)).date().isoformat()
+
+        users, transactions, profiles, anomalies = await asyncio.gather(
+            client.select_all("users", filters={"is_active": "is.true"}, columns="user_id",
+                              order="user_id", page_size=BATCH_PAGE_SIZE),
+            client.select_all("transactions", filters={"transaction_date": f"gte.{start}"},
+                              columns=TRANSACTION_COLUMNS, order="user_id,transaction_id", page_size=BATCH_PAGE_SIZE),
+            client.select_all("user_profiles", columns=PROFILE_COLUMNS, order="user_id", page_size=BATCH_PAGE_SIZE),
+            client.select_all("transaction_anomalies", filters={"transaction_date": f"gte.{recent}"},
+                              columns=ANOMALY_COLUMNS, order="user_id,transaction_id", page_size=BATCH_PAGE_SIZE),
+        )
+        user_ids = [user["user_id"] for user in users]
+        anomalies_by_user = defaultdict(list)
+        for anomaly in anomalies:
+            anomalies_by_user[anomaly["user_id"]].append(anomaly)
+        assessments = compute_risk_assessments(
+            transactions, {profile["user_id"]: profile for profile in profiles}, user_ids,
+            anomalies_by_user=anomalies_by_user
+        )
+
+        rows = []
+        for user_id, assessment in assessments.items():
+            rows.extend(build_agent_rows(user_id, "risk_agent", {"risk_assessment": assessment})["risk_assessments"])
+
+        reports = await asyncio.gather(*(
+            client.bulk_insert(
+                "risk_assessments", rows[i:i + BATCH_PAGE_SIZE],
+                on_conflict=AGENT_OUTPUT_UPSERT_KEYS["risk_assessments"]
+            )
+            for i in range(0, len(rows), BATCH_PAGE_SIZE)
+        ))
+        inserted = sum(report["inserted"] for report in reports)
+        errors = sum(len(report["errors"]) for report in reports)
+        escalations = sum(1 for a in assessments.values() if a["escalation_needed"])
+
+        elapsed = (datetime.now() - started).total_seconds()
+        print(f"[Risk Agent] Batch: scored {len(assessments)} users ({escalations} escalations) in {elapsed:.1f}s")
+
+        return {
+            "success": errors == 0,
+            "agent": "risk_assessment",
+            "users": len(assessments),
+            "inserted": inserted,
+            "escalations": escalations,
+            "errors": errors,
+            "elapsed_seconds": elapsed,
+            "timestamp": datetime.now().isoformat()
+        }
+
 
 async def main():
     """Test the risk assessment agent"""
@@ -0,0 +1,308 @@
+"""
+Risk Engine
+Deterministic composite risk scoring behind the Risk Assessment Agent
+
+Transaction aggregates and profile values go in as arrays (one entry per
+user); every ratio, the 0-10 score and the escalation rules are evaluated
+with NumPy, so one call scores a single user after a transaction or the whole
+user base in a scheduled sweep.
+"""
+
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from anomaly_engine import summarise_anomalies
+from pattern_engine import daily_income_matrix, pattern_metrics, to_day_numbers, window_start
+
+
+HISTORY_DAYS = 90
+RECENT_DAYS = 30
+
+# Expense categories that are loan / card repayments
+DEBT_CATEGORIES = {"emi", "loan", "loan repayment", "credit card", "debt"}
+
+# Escalation triggers
+MAX_DEBT_TO_INCOME = 0.50
+MAX_INCOME_DROP = 0.30
+NO_EMERGENCY_FUND_MONTHS = 0.5
+HIGH_VOLATILITY = 0.40
+SEVERE_DEFICIT_RATIO = 1.20
+
+# Dimension weight in the 0-10 score, and the value at which a dimension maxes out
+RISK_WEIGHTS = {
+    "volatility": (2.0, 0.60),
+    "debt": (2.0, 0.60),
+    "emergency_fund": (2.0, 6.0),
+    "expense_spike": (1.5, 1.0),
+    "income_drop": (1.5, 0.50),
+    "budget_deficit": (1.0, 0.50),
+}
+
+LOW_RISK_SCORE = 4.0
+HIGH_RISK_SCORE = 7.0
+TARGET_EMERGENCY_MONTHS = 6
+
+
+def aggregate_transactions(
+    user_ids: np.ndarray,
+    transactions: Dict[str, np.ndarray],
+    users: List[str],
+    as_of: Optional[date] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Per-user income/expense aggregates for the risk ratios
+
+    Args:
+        user_ids: User id of each transaction
+        transactions: {"day_numbers", "amounts", "is_income", "is_debt"} arrays
+        users: Users to aggregate for (output order)
+        as_of: Last day of history (defaults to today)
+
+    Returns:
+        Aggregate name -> array per user (monthly amounts are per 30 days)
+    """
+    n_users = len(users)
+    position = {user: i for i, user in enumerate(users)}
+    index = np.array([position.get(u, -1) for u in user_ids], dtype=np.int64)
+
+    start_day = window_start(as_of, HISTORY_DAYS)
+    offset = transactions["day_numbers"] - start_day
+    keep = (index >= 0) & (offset >= 0) & (offset < HISTORY_DAYS)
+    index, offset = index[keep], offset[keep]
+    amounts = transactions["amounts"][keep]
+    is_income = transactions["is_income"][keep]
+    is_debt = transactions["is_debt"][keep]
+    recent = offset >= HISTORY_DAYS - RECENT_DAYS
+
+    def total(mask: np.ndarray) -> np.ndarray:
+        return np.bincount(index, weights=amounts * mask, minlength=n_users)
+
+    baseline_months = (HISTORY_DAYS - RECENT_DAYS) / 30.0
+    daily, counts = daily_income_matrix(index[is_income], offset[is_income] + start_day,
+                                        amounts[is_income], n_users, start_day, HISTORY_DAYS)
+    return {
+        "income_transactions": np.bincount(index, weights=is_income.astype(np.float64), minlength=n_users),
+        "monthly_income": total(is_income) / (HISTORY_DAYS / 30.0),
+        "monthly_expenses": total(~is_income) / (HISTORY_DAYS / 30.0),
+        "monthly_debt_payments": total(~is_income & is_debt) / (HISTORY_DAYS / 30.0),
+        "recent_income": total(is_income & recent),
+        "baseline_income": total(is_income & ~recent) / baseline_months,
+        "recent_debt_payments": total(~is_income & is_debt & recent),
+        "baseline_debt_payments": total(~is_income & is_debt & ~recent) / baseline_months,
+        "recent_expenses": total(~is_income & recent),
+        "baseline_expenses": total(~is_income & ~recent) / baseline_months,
+        "volatility_score": pattern_metrics(daily, start_day, counts)["volatility_score"],
+    }
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray, default: float) -> np.ndarray:
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    return np.divide(numerator, denominator, out=np.full_like(numerator, default), where=denominator > 0)
+
+
+def compute_risk(
+    aggregates: Dict[str, np.ndarray],
+    emergency_fund: np.ndarray,
+    profile_debt_payments: np.ndarray,
+    profile_expenses: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """
+    Risk ratios, dimension scores, 0-10 score and escalation flags for many users
+
+    Args:
+        aggregates: aggregate_transactions output
+        emergency_fund: user_profiles.current_emergency_fund per user
+        profile_debt_payments: Monthly EMIs from user_profiles.debt_obligations
+        profile_expenses: user_profiles.monthly_expenses_avg (used when no expenses are recorded)
+
+    Returns:
+        Field name -> array per user
+    """
+    income = aggregates["monthly_income"]
+    recorded = aggregates["monthly_expenses"] > 0
+    expenses = np.where(recorded, aggregates["monthly_expenses"], profile_expenses)
+    debt = np.maximum(aggregates["monthly_debt_payments"], profile_debt_payments)
+    # Recorded expenses already contain the EMIs paid as transactions; add only the declared EMIs on top
+    outgoings = expenses - np.where(recorded, aggregates["monthly_debt_payments"], 0.0) + debt
+
+    # Without any income rows the income-based ratios are unknown rather than worst-case
+    income_known = aggregates["income_transactions"] > 0
+    dti = _ratio(debt, income, default=1.0)
+    dti = np.where((debt > 0) & income_known, dti, 0.0)
+    coverage = _ratio(emergency_fund, expenses, default=0.0)
+    income_drop = np.clip(1.0 - _ratio(aggregates["recent_income"], aggregates["baseline_income"], 1.0), 0.0, 1.0)
+    spike = _ratio(aggregates["recent_expenses"], aggregates["baseline_expenses"], 1.0)
+    deficit = np.where(income_known, np.clip(_ratio(outgoings - income, income, 1.0), 0.0, None), 0.0)
+    volatility = aggregates["volatility_score"]
+
+    # Each dimension scaled to 0-1 (1 = worst)
+    dimensions = {
+        "volatility": volatility / RISK_WEIGHTS["volatility"][1],
+        "debt": dti / RISK_WEIGHTS["debt"][1],
+        "emergency_fund": 1.0 - coverage / RISK_WEIGHTS["emergency_fund"][1],
+        "expense_spike": (spike - 1.0) / RISK_WEIGHTS["expense_spike"][1],
+        "income_drop": income_drop / RISK_WEIGHTS["income_drop"][1],
+        "budget_deficit": deficit / RISK_WEIGHTS["budget_deficit"][1],
+    }
+    dimensions = {name: np.clip(value, 0.0, 1.0) for name, value in dimensions.items()}
+    score = sum(RISK_WEIGHTS[name][0] * value for name, value in dimensions.items())
+
+    triggers = {
+        "debt": dti > MAX_DEBT_TO_INCOME,
+        "income_drop": income_drop > MAX_INCOME_DROP,
+        "no_safety_net": (coverage < NO_EMERGENCY_FUND_MONTHS) & (volatility >= HIGH_VOLATILITY),
+        "deficit": income_known & (outgoings > SEVERE_DEFICIT_RATIO * income),
+    }
+    trigger_count = sum(t.astype(int) for t in triggers.values())
+
+    return {
+        "debt_to_income_ratio": dti,
+        "emergency_fund_coverage": coverage,
+        "income_drop_percentage": income_drop,
+        "expense_spike_factor": spike,
+        "budget_deficit": deficit,
+        "income_known": income_known,
+        "volatility_score": volatility,
+        "dimensions": dimensions,
+        "risk_score": np.round(score, 1),
+        "triggers": triggers,
+        "trigger_count": trigger_count,
+    }
+
+
+def _severity(value: float) -> str:
+    return "high" if value >= 0.66 else "medium" if value >= 0.33 else "low"
+
+
+def risk_assessment(result: Dict[str, Any], i: int, anomalies: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Format user i's results (plus their recent transaction anomalies) as a risk_assessment object"""
+    dims = {name: float(value[i]) for name, value in result["dimensions"].items()}
+    dti = float(result["debt_to_income_ratio"][i])
+    coverage = float(result["emergency_fund_coverage"][i])
+    drop = float(result["income_drop_percentage"][i])
+    spike = float(result["expense_spike_factor"][i])
+    score = float(result["risk_score"][i])
+    income_known = bool(result["income_known"][i])
+    level = "low" if score < LOW_RISK_SCORE else "medium" if score < HIGH_RISK_SCORE else "high"
+
+    risk_factors = [
+        {"factor": "Income volatility", "impact": f"Weekly income varies by {float(result['volatility_score'][i]):.0%}",
+         "severity": _severity(dims["volatility"])},
+        {"factor": "Debt-to-income",
+         "impact": f"{dti:.0%} of income goes to EMIs" if income_known else f"No income recorded in the last {HISTORY_DAYS} days",
+         "severity": _severity(dims["debt"])},
+        {"factor": "Emergency fund", "impact": f"{coverage:.1f} months coverage", "severity": _severity(dims["emergency_fund"])},
+        {"factor": "Expense spike", "impact": f"Last 30 days spending is {spike:.2f}x normal",
+         "severity": _severity(dims["expense_spike"])},
+        {"factor": "Income drop", "impact": f"Income down {drop:.0%} vs previous months", "severity": _severity(dims["income_drop"])},
+        {"factor": "Budget deficit",
+         "impact": f"Spending exceeds income by {float(result['budget_deficit'][i]):.0%}" if income_known
+                   else "Unknown until income is recorded",
+         "severity": _severity(dims["budget_deficit"])},
+    ]
+
+    if anomalies:
+        high = sum(1 for a in anomalies if a.get("severity") == "high")
+        risk_factors.append({
+            "factor": "Unusual transactions",
+            "impact": f"{len(anomalies)} transactions in the last {RECENT_DAYS} days far outside your usual amounts",
+            "severity": "high" if high else "medium",
+        })
+
+    actions = []
+    if dims["emergency_fund"] >= 0.33:
+        actions.append({"action": "Build emergency fund",
+                        "description": f"Target at least {TARGET_EMERGENCY_MONTHS} months of expenses in liquid savings"})
+    if dims["debt"] >= 0.33:
+        actions.append({"action": "Control EMIs", "description": "Keep total EMIs below 40% of monthly income"})
+    if dims["expense_spike"] >= 0.33 or dims["budget_deficit"] >= 0.33:
+        actions.append({"action": "Cap discretionary spending", "description": "Limit lifestyle spends to 20-30% of net income"})
+    if dims["income_drop"] >= 0.33 or dims["volatility"] >= 0.66:
+        actions.append({"action": "Diversify income", "description": "Add a second platform or client to smooth weekly income"})
+
+    reasons = {
+        "debt": f"Debt-to-income ratio {dti:.0%} is above {MAX_DEBT_TO_INCOME:.0%}",
+        "income_drop": f"Income dropped {drop:.0%} (more than {MAX_INCOME_DROP:.0%})",
+        "no_safety_net": "No emergency fund with highly volatile income",
+        "deficit": "Spending and EMIs are well above income",
+    }
+    fired = [reasons[name] for name, flags in result["triggers"].items() if flags[i]]
+    count = int(result["trigger_count"][i])
+
+    worst = max(dims, key=dims.get)
+    return {
+        "overall_risk_level": level,
+        "risk_score": score,
+        "risk_factors": risk_factors,
+        "debt_to_income_ratio": round(dti, 3),
+        "income_drop_percentage": round(drop, 3),
+        "expense_spike_factor": round(spike, 2),
+        "emergency_fund_coverage": round(coverage, 1),
+        "transaction_anomalies": summarise_anomalies(anomalies or []),
+        "escalation_needed": bool(fired),
+        "escalation_priority": ("urgent" if count >= 2 else "high") if fired else None,
+        "escalation_reason": "; ".join(fired) if fired else None,
+        "recommended_actions": actions,
+        "ai_risk_analysis": (
+            f"{level.capitalize()} risk profile (score {score:.1f}/10); "
+            f"the biggest concern is {worst.replace('_', ' ')}."
+        ),
+    }
+
+
+def transaction_arrays(rows: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Turn PostgREST transaction rows into the arrays aggregate_transactions expects"""
+    return {
+        "day_numbers": to_day_numbers(r["transaction_date"] for r in rows),
+        "amounts": np.array([float(r.get("amount") or 0) for r in rows], dtype=np.float64),
+        "is_income": np.array([r.get("transaction_type") == "income" for r in rows], dtype=bool),
+        "is_debt": np.array([(r.get("category") or "").strip().lower() in DEBT_CATEGORIES for r in rows], dtype=bool),
+    }
+
+
+def profile_debt_payments(profile: Optional[Dict[str, Any]]) -> float:
+    """Monthly EMIs listed in user_profiles.debt_obligations"""
+    debts = (profile or {}).get("debt_obligations")
+    if not isinstance(debts, list):
+        return 0.0
+    return sum(
+        float(d.get("emi") or d.get("monthly_payment") or d.get("monthly_emi") or 0)
+        for d in debts if isinstance(d, dict)
+    )
+
+
+def compute_risk_assessments(
+    rows: List[Dict[str, Any]],
+    profiles: Dict[str, Dict[str, Any]],
+    users: List[str],
+    as_of: Optional[date] = None,
+    anomalies_by_user: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Score many users at once
+
+    Args:
+        rows: Transactions (user_id, amount, transaction_type, category, transaction_date)
+        profiles: user_id -> user_profiles row
+        users: Users to score
+        as_of: Last day of history (defaults to today)
+        anomalies_by_user: user_id -> recent transaction_anomalies rows
+
+    Returns:
+        user_id -> risk_assessment dict
+    """
+    as_of = as_of or datetime.now().date()
+    user_ids = np.array([r["user_id"] for r in rows], dtype=object)
+    aggregates = aggregate_transactions(user_ids, transaction_arrays(rows), users, as_of)
+    column = lambda key: np.array([float((profiles.get(u) or {}).get(key) or 0) for u in users])  # noqa: E731
+    result = compute_risk(
+        aggregates,
+        emergency_fund=column("current_emergency_fund"),
+        profile_debt_payments=np.array([profile_debt_payments(profiles.get(u)) for u in users]),
+        profile_expenses=column("monthly_expenses_avg"),
+    )
+    anomalies_by_user = anomalies_by_user or {}
+    return {user: risk_assessment(result, i, anomalies_by_user.get(user)) for i, user in enumerate(users)}
@@ -1,18 +1,32 @@
 """
 Savings & Investment Planning Agent
 Creates personalized savings plans and investment recommendations
+Plans and return projections come from the goal simulator; the LLM only adds an optional narrative
 Writes to: savings_goals, investment_recommendations tables
 """
 
 import asyncio
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 import sys
+from typing import Optional
+
+import numpy as np
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from autogen_runtime import run_autogen_mcp_task
+from autogen_runtime import run_autogen_mcp_task, write_agent_data
+from forecast_engine import EMERGENCY_FUND_MONTHS, volatility_category
+from goal_engine import HISTORY_DAYS, savings_plan, surplus_stats
+from postgrest_client import get_postgrest_client
+from user_snapshot import UserSnapshot
+from risk_engine import aggregate_transactions, transaction_arrays
+
+# Set SAVINGS_AGENT_LLM_NARRATIVE=true to also ask the LLM for personalised tips
+LLM_NARRATIVE = os.getenv("SAVINGS_AGENT_LLM_NARRATIVE", "false").lower() == "true"
+
+PROFILE_COLUMNS = "user_id,monthly_expenses_avg,current_emergency_fund,risk_tolerance"
 
 
 class SavingsInvestmentAgent:
@@ -25,114 +39,33 @@ class SavingsInvestmentAgent:
     def _create_system_prompt(self) -> str:
         return """You are a Savings & Investment Planning Agent for gig workers in India.
 
-Your task is to analyze user finances and create personalized savings and investment plans, outputting structured JSON.
-
-**CRITICAL: You must output ONLY valid JSON that matches the savings_goals table schema:**
-
-```json
-{
-  "savings_plan": {
-    "emergency_fund": {
-      "target_amount": 90000.00,
-      "current_amount": 15000.00,
-      "monthly_contribution": 5000.00,
-      "target_months": 6,
-      "priority": "high",
-      "status": "in_progress",
-      "reasoning": "Build 6-month emergency fund based on average monthly expenses of Rs 15,000"
-    },
-    "short_term_goals": [
-      {
-        "goal_name": "Festival Expenses Fund",
-        "target_amount": 20000.00,
-        "current_amount": 0,
-        "monthly_contribution": 4000.00,
-        "target_date": "2025-10-15",
-        "priority": "medium",
-        "category": "lifestyle"
-      }
-    ],
-    "investment_recommendations": [
-      {
-        "investment_type": "recurring_deposit",
-        "provider": "Post Office RD",
-        "recommended_amount": 2000.00,
-        "frequency": "monthly",
-        "expected_return": 7.5,
-        "risk_level": "low",
-        "reasoning": "Safe investment for gig workers with variable income",
-        "min_lock_in_months": 12
-      },
-      {
-        "investment_type": "sip",
-        "provider": "Index Fund SIP",
-        "recommended_amount": 1000.00,
-        "frequency": "monthly",
-        "expected_return": 12.0,
-        "risk_level": "moderate",
-        "reasoning": "Long-term wealth building through market-linked returns",
-        "min_lock_in_months": 36
-      }
-    ],
-    "savings_rate": 0.20,
-    "investable_surplus": 8000.00,
-    "confidence_score": 0.82,
-    "personalized_tips": [
-      "Start SIP on your highest earning day of the month",
-      "Keep 2 months expenses in savings account for liquidity",
-      "Consider PPF for tax-free long-term savings"
-    ]
-  }
-}
-```
-
-**What you do:**
-1. Read user_profiles for income, expenses, risk tolerance
-2. Read transactions to understand spending patterns
-3. Read income_patterns for income volatility
-4. Calculate emergency fund needs (3-6 months expenses)
-5. Identify savings capacity (income - expenses)
-6. Recommend appropriate investments based on:
-   - Risk tolerance (low/moderate/high)
-   - Income stability
-   - Financial goals
-   - Tax benefits (80C, 80CCD)
-7. Create actionable savings plan with monthly targets
-8. Output ONLY the JSON format above - no explanations
-
-**Investment Options for Indian Gig Workers:**
-- Post Office Recurring Deposit (RD): 7.5% p.a., low risk
-- Public Provident Fund (PPF): 7.1% p.a., 15-year lock-in, tax-free
-- National Pension System (NPS): 8-10% p.a., retirement focused
-- Sukanya Samriddhi (if daughter): 8.2% p.a., tax-free
-- SIP in Index Funds: 10-12% p.a., moderate risk
-- Fixed Deposits: 6-7% p.a., low risk
-- Gold Savings Scheme: Hedge against inflation
-
-**Savings Priority Order:**
-1. Emergency Fund (highest priority)
-2. Insurance (health + term)
-3. Debt repayment
-4. Short-term goals
-5. Long-term investments
-
-**Database Schema Requirements:**
-- target_amount/current_amount: Numbers with 2 decimals
-- monthly_contribution: Recommended monthly saving
-- priority: "high", "medium", "low"
-- status: "not_started", "in_progress", "completed"
-- risk_level: "low", "moderate", "high"
-- expected_return: Percentage as number
-- confidence_score: Number between 0-1
-
-**Output ONLY the JSON object. No other text.**"""
-
-    async def analyze_user(self, user_id: str) -> dict:
+You are given a savings plan that has already been calculated from the user's
+transactions and profile: emergency fund target and monthly contribution, and
+monthly investments (RD 7.5%, PPF 7.1%, index fund SIP 10-12%) with simulated
+10th/50th/90th percentile values at the end of their lock-in.
+Do not change the numbers and do not write to the database.
+
+Give 3 short, practical tips for this gig worker to stick to the plan
+(for example which day to invest, how to handle a slow week, tax benefits under 80C)."""
+
+    async def fetch_savings_inputs(self, user_id: str, snapshot: Optional[UserSnapshot] = None) -> tuple:
+        """Fetch the user's recent transactions and financial profile"""
+        client = snapshot or get_postgrest_client()
+        start = (datetime.now() - timedelta(days=HISTORY_DAYS + 1)).date().isoformat()
+        transactions, profiles = await asyncio.gather(
+            client.select("transactions", filters={"user_id": user_id, "transaction_date": f"gte.{start}"},
+                          columns="user_id,amount,transaction_type,category,transaction_date"),
+            client.select("user_profiles", filters={"user_id": user_id}, columns=PROFILE_COLUMNS),
+        )
+        return transactions, (profiles[0] if profiles else {})
+
+    async def analyze_user(self, user_id: str, snapshot: Optional[UserSnapshot] = None) -> dict:
         """
         Create savings and investment plan for a specific user
 
         Args:
             user_id: UUID of the user to analyze
+            snapshot: Per-run snapshot of the user's input rows (read from the database if None)
 
         Returns:
             dict with analysis results and success status
@@ -140,32 +73,36 @@ Your task is to analyze user finances and create personalized savings and invest
         print(f"[Savings Agent] Starting analysis for user {user_id}")
 
         try:
-            prompt = f"""Create a savings and investment plan for user {user_id}.
-
-Steps:
-1. Read user_profiles for income range, expenses, risk tolerance
-2. Read transactions to calculate actual income and spending
-3. Read income_patterns for volatility assessment
-4. Calculate:
-   - Emergency fund target (6 months of expenses)
-   - Monthly savings capacity
-   - Investable surplus after expenses
-5. Recommend savings goals with timelines
-6. Suggest appropriate investments based on risk profile
-7. Create personalized tips for this gig worker
-8. Output structured JSON
-
-User ID: {user_id}
-
-Please analyze and provide a complete savings and investment plan."""
-
-            result = await run_autogen_mcp_task(
-                agent_name="savings_investment_agent",
-                system_prompt=self.system_prompt,
-                task=prompt,
-                user_id=user_id,
-                use_azure=True
+            transactions, profile = await self.fetch_savings_inputs(user_id, snapshot)
+            aggregates = aggregate_transactions(
+                np.array([user_id] * len(transactions), dtype=object), transaction_arrays(transactions), [user_id]
+            )
+            expenses = float(aggregates["monthly_expenses"][0]) or float(profile.get("monthly_expenses_avg") or 0)
+            category = volatility_category(float(aggregates["volatility_score"][0]))
+
+            plan = savings_plan(
+                user_id,
+                monthly_surplus=surplus_stats(transactions)["monthly_surplus"],
+                monthly_expenses=expenses,
+                emergency_fund=float(profile.get("current_emergency_fund") or 0),
+                emergency_months=EMERGENCY_FUND_MONTHS[category],
+                risk_tolerance=profile.get("risk_tolerance"),
+                monthly_income=float(aggregates["monthly_income"][0]),
             )
+            print(f"[Savings Agent] Investable surplus Rs {plan['investable_surplus']:,.0f}/month, "
+                  f"{len(plan['investment_recommendations'])} investments")
+
+            written = await write_agent_data(user_id, "savings_investment_agent", {"savings_plan": plan})
+
+            result = {"savings_plan": plan, "written": written}
+            if LLM_NARRATIVE:
+                result["narrative"] = await run_autogen_mcp_task(
+                    agent_name="savings_narrative",
+                    system_prompt=self.system_prompt,
+                    task=f"Savings plan for user {user_id}:\n{json.dumps(plan, indent=2)}",
+                    user_id=user_id,
+                    use_azure=True
+                )
 
             print(f"[Savings Agent] Analysis complete for user {user_id}")
 
@@ -1,14 +1,22 @@
 """
 Background Scheduler Service
-Runs all 9 agents periodically for active users
+Runs the 11 scheduled agents periodically for active users
+(savings, bills and goals only run through the API)
 """
 
 import asyncio
 import json
 from datetime import datetime
 from typing import List
+import os
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from agent_graph import run_agent_graph
+from circuit_breaker import get_circuit_breaker
+from user_snapshot import load_user_snapshot
+
 # Import all agents
 from pattern_agent import PatternRecognitionAgent
 from budget_agent import BudgetAnalysisAgent
@@ -19,15 +27,17 @@ from tax_agent import TaxComplianceAgent
 from recommendation_agent import RecommendationAgent
 from risk_agent import RiskAssessmentAgent
 from action_agent import ActionExecutionAgent
+from financial_agent import FinancialHealthAgent
+from anomaly_agent import TransactionAnomalyAgent
 
 
 class AgentScheduler:
-    """Coordinates periodic execution of all 9 financial agents"""
+    """Coordinates periodic execution of the 11 scheduled financial agents"""
 
     def __init__(self, mcp_config_path: str = ".mcp.json"):
         self.mcp_config_path = mcp_config_path
 
-        # Initialize all 9 agents
+        # Initialize the 11 scheduled agents
         self.agents = {
             "pattern": PatternRecognitionAgent(mcp_config_path),
             "budget": BudgetAnalysisAgent(mcp_config_path),
@@ -37,12 +47,14 @@ class AgentScheduler:
             "tax": TaxComplianceAgent(mcp_config_path),
             "recommendation": RecommendationAgent(mcp_config_path),
             "risk": RiskAssessmentAgent(mcp_config_path),
-            "action": ActionExecutionAgent(mcp_config_path)
+            "action": ActionExecutionAgent(mcp_config_path),
+            "financial": FinancialHealthAgent(mcp_config_path),
+            "anomaly": TransactionAnomalyAgent(mcp_config_path)
         }
 
     async def run_all_agents(self, user_id: str) -> dict:
         """
-        Run all 9 agents for a specific user in sequence
+        Run the scheduled agents for a specific user in dependency order
 
         Args:
             user_id: UUID of the user to analyze
@@ -60,50 +72,15 @@ class AgentScheduler:
             "agents": {}
         }
 
-        # Run agents in order (some depend on others)
-        # 1. Pattern Recognition (foundation)
-        print("[1/9] Running Pattern Recognition Agent...")
-        results["agents"]["pattern"] = await self.agents["pattern"].analyze_user(user_id)
-        await asyncio.sleep(2)  # Brief pause between agents
-
-        # 2. Context Intelligence (enriches patterns)
-        print("\n[2/9] Running Context Intelligence Agent...")
-        results["agents"]["context"] = await self.agents["context"].analyze_user(user_id)
-        await asyncio.sleep(2)
-
-        # 3. Volatility Forecaster (needs patterns)
-        print("\n[3/9] Running Volatility Forecaster Agent...")
-        results["agents"]["volatility"] = await self.agents["volatility"].analyze_user(user_id)
-        await asyncio.sleep(2)
-
-        # 4. Budget Analysis (needs patterns and forecasts)
-        print("\n[4/9] Running Budget Analysis Agent...")
-        results["agents"]["budget"] = await self.agents["budget"].analyze_user(user_id)
-        await asyncio.sleep(2)
-
-        # 5. Knowledge Integration (independent)
-        print("\n[5/9] Running Knowledge Integration Agent...")
-        results["agents"]["knowledge"] = await self.agents["knowledge"].analyze_user(user_id)
-        await asyncio.sleep(2)
-
-        # 6. Tax & Compliance (needs income data)
-        print("\n[6/9] Running Tax & Compliance Agent...")
-        results["agents"]["tax"] = await self.agents["tax"].analyze_user(user_id)
-        await asyncio.sleep(2)
-
-        # 7. Risk Assessment (needs all financial data)
-        print("\n[7/9] Running Risk Assessment Agent...")
-        results["agents"]["risk"] = await self.agents["risk"].analyze_user(user_id)
-        await asyncio.sleep(2)
-
-        # 8. Recommendation Engine (needs everything)
-        print("\n[8/9] Running Recommendation Engine Agent...")
-        results["agents"]["recommendation"] = await self.agents["recommendation"].analyze_user(user_id)
-        await asyncio.sleep(2)
-
-        # 9. Action Execution (needs recommendations)
-        print("\n[9/9] Running Action Execution Agent...")
-        results["agents"]["action"] = await self.agents["action"].analyze_user(user_id)
+        # The user's input tables are read once and shared by every agent
+        try:
+            snapshot = await load_user_snapshot(user_id)
+        except Exception as e:
+            print(f"X Snapshot load failed, agents will read directly: {str(e)}")
+            snapshot = None
+
+        # Each agent starts as soon as the agents it depends on have finished
+        results["agents"] = await run_agent_graph(self.agents, user_id, snapshot=snapshot)
 
         results["analysis_completed"] = datetime.now().isoformat()
 
@@ -130,6 +107,65 @@ class AgentScheduler:
 
         return results
 
+    async def run_pattern_batch(self) -> dict:
+        """
+        Refresh income patterns for every active user in one batch sweep
+
+        Much cheaper than running the pattern agent once per user inside
+        run_all_agents, so it can run every cycle for the whole user base.
+
+        Returns:
+            Batch summary from PatternRecognitionAgent.analyze_all_users
+        """
+        try:
+            return await self.agents["pattern"].analyze_all_users()
+        except Exception as e:
+            print(f"[Scheduler] Pattern batch failed: {str(e)}")
+            return {"success": False, "agent": "pattern_recognition", "error": str(e)}
+
+    async def run_anomaly_batch(self, backfill: bool = False) -> dict:
+        """
+        Score all transactions added since the last sweep (or the whole history)
+
+        Args:
+            backfill: Rebuild every detector state from the full history
+
+        Returns:
+            Sweep summary from TransactionAnomalyAgent
+        """
+        try:
+            agent = self.agents["anomaly"]
+            return await (agent.backfill() if backfill else agent.process_new())
+        except Exception as e:
+            print(f"[Scheduler] Anomaly sweep failed: {str(e)}")
+            return {"success": False, "agent": "transaction_anomaly", "error": str(e)}
+
+    async def run_risk_batch(self) -> dict:
+        """
+        Re-score risk for every active user in one batch sweep
+
+        Returns:
+            Batch summary from RiskAssessmentAgent.analyze_all_users
+        """
+        try:
+            return await self.agents["risk"].analyze_all_users()
+        except Exception as e:
+            print(f"[Scheduler] Risk batch failed: {str(e)}")
+            return {"success": False, "agent": "risk_assessment", "error": str(e)}
+
+    async def run_financial_health_batch(self) -> dict:
+        """
+        Re-score financial health for every active user in one batch sweep
+
+        Returns:
+            Batch summary from FinancialHealthAgent.analyze_all_users
+        """
+        try:
+            return await self.agents["financial"].analyze_all_users()
+        except Exception as e:
+            print(f"[Scheduler] Financial health batch failed: {str(e)}")
+            return {"success": False, "agent": "financial_health", "error": str(e)}
+
     async def scheduled_run(self, interval_seconds: int = 3600):
         """
         Run scheduler in a loop with specified interval
@@ -149,7 +185,20 @@ class AgentScheduler:
             try:
                 print(f"\n[{datetime.now().isoformat()}] Starting scheduled analysis cycle...")
 
+                # Income patterns, transaction anomalies, risk and financial health for all
+                # users in one pass each, then the full chain for the MVP users
+                await self.run_pattern_batch()
+                await self.run_anomaly_batch()
+                await self.run_risk_batch()
+                await self.run_financial_health_batch()
+
+                database = get_circuit_breaker("supabase")
                 for user_id in active_users:
+                    # Don't start more users while the database circuit is open
+                    if database.is_open():
+                        print(f"Database circuit open, skipping the remaining users this cycle "
+                              f"(retry in {database.retry_in():.0f}s)")
+                        break
                     await self.run_all_agents(user_id)
 
                 print(f"\n[{datetime.now().isoformat()}] Cycle complete. Sleeping for {interval_seconds}s...")
@@ -180,9 +229,29 @@ async def main():
             result = await scheduler.run_all_agents(user_id)
             print("\nFinal Result:")
             print(json.dumps(result, indent=2))
+        elif sys.argv[1] == "--patterns":
+            # Refresh income patterns for all active users
+            result = await scheduler.run_pattern_batch()
+            print(json.dumps(result, indent=2))
+        elif sys.argv[1] == "--anomalies":
+            # Score new transactions for all users ("--anomalies backfill" rescans the full history)
+            result = await scheduler.run_anomaly_batch(backfill=len(sys.argv) > 2 and sys.argv[2] == "backfill")
+            print(json.dumps(result, indent=2))
+        elif sys.argv[1] == "--risk":
+            # Re-score risk for all active users
+            result = await scheduler.run_risk_batch()
+            print(json.dumps(result, indent=2))
+        elif sys.argv[1] == "--health":
+            # Re-score financial health for all active users
+            result = await scheduler.run_financial_health_batch()
+            print(json.dumps(result, indent=2))
         else:
             print("Usage:")
             print("  python scheduler.py --user <user_id>          # Run once for specific user")
+            print("  python scheduler.py --patterns                # Refresh income patterns for all users")
+            print("  python scheduler.py --anomalies [backfill]    # Score new (or all) transactions for anomalies")
+            print("  python scheduler.py --risk                    # Re-score risk for all users")
+            print("  python scheduler.py --health                  # Re-score financial health for all users")
             print("  python scheduler.py --scheduled [interval]    # Run as background service")
     else:
         # Default: run once for test user
@@ -0,0 +1,277 @@
+"""
+Government Scheme Matching Engine
+Rule index behind the Knowledge Integration Agent
+
+Eligibility criteria from government_schemes are compiled once into an index:
+sorted lower/upper bounds with prefix bitsets for age and income, and one
+bitset per state and occupation keyword (bit i = scheme i). Matching a user is
+a handful of bisects and integer ANDs, so rematching every user after a scheme
+changes takes seconds instead of one LLM call per user.
+"""
+
+import re
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Criteria keys understood by the index (anything else is reported as unverified)
+AGE_MIN_KEYS = ("min_age", "age_min", "minimum_age")
+AGE_MAX_KEYS = ("max_age", "age_max", "maximum_age")
+MONTHLY_INCOME_MAX_KEYS = ("max_monthly_income", "monthly_income_max", "income_max", "max_income")
+ANNUAL_INCOME_MAX_KEYS = ("max_annual_income", "annual_income_max", "annual_income_limit")
+MONTHLY_INCOME_MIN_KEYS = ("min_monthly_income", "monthly_income_min", "income_min", "min_income")
+STATE_KEYS = ("states", "state", "state_applicable")
+OCCUPATION_KEYS = ("occupations", "occupation", "eligible_occupations")
+INDEXED_KEYS = set(
+    AGE_MIN_KEYS + AGE_MAX_KEYS + MONTHLY_INCOME_MAX_KEYS + ANNUAL_INCOME_MAX_KEYS
+    + MONTHLY_INCOME_MIN_KEYS + STATE_KEYS + OCCUPATION_KEYS + ("age_range", "age")
+)
+
+# State values meaning "applies everywhere"
+ALL_STATES = {"", "all", "all states", "india", "pan india", "central", "national"}
+
+# Occupation tags every gig worker carries, on top of their own occupation text
+GIG_WORKER_TAGS = ("gig worker", "unorganised worker", "unorganized worker", "self-employed", "platform worker")
+
+# Confidence lost for each requirement we could not verify
+UNVERIFIED_PENALTY = 0.15
+MIN_CONFIDENCE = 0.3
+
+INF = float("inf")
+
+
+def _first(criteria: Dict[str, Any], keys: Tuple[str, ...]) -> Any:
+    for key in keys:
+        if criteria.get(key) not in (None, ""):
+            return criteria[key]
+    return None
+
+
+def _number(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.search(r"\d+(?:\.\d+)?", str(value).replace(",", ""))
+    return float(match.group()) if match else None
+
+
+def _text_set(value: Any) -> set:
+    if value is None:
+        return set()
+    items = value if isinstance(value, (list, tuple, set)) else re.split(r"[,/;]", str(value))
+    return {str(item).strip().lower() for item in items if str(item).strip()}
+
+
+def parse_criteria(scheme: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Normalise a government_schemes row into indexable bounds and sets
+
+    Returns:
+        {"min_age", "max_age", "min_income", "max_income" (monthly, inf when
+        unbounded), "states" (empty = all), "occupations" (empty = any),
+        "unverified" (criteria the index can't check)}
+    """
+    criteria = scheme.get("eligibility_criteria") or {}
+    if not isinstance(criteria, dict):
+        criteria = {"requirement": criteria}
+
+    min_age, max_age = _number(_first(criteria, AGE_MIN_KEYS)), _number(_first(criteria, AGE_MAX_KEYS))
+    age_range = criteria.get("age_range") or criteria.get("age")
+    if age_range is not None and min_age is None and max_age is None:
+        bounds = age_range if isinstance(age_range, (list, tuple)) else re.findall(r"\d+", str(age_range))
+        if len(bounds) == 2:
+            min_age, max_age = float(bounds[0]), float(bounds[1])
+
+    max_income = _number(_first(criteria, MONTHLY_INCOME_MAX_KEYS))
+    annual_max = _number(_first(criteria, ANNUAL_INCOME_MAX_KEYS))
+    if max_income is None and annual_max is not None:
+        max_income = annual_max / 12
+
+    states = _text_set(scheme.get("state_applicable")) | _text_set(_first(criteria, STATE_KEYS))
+    if states & ALL_STATES:
+        states = set()
+
+    return {
+        "min_age": min_age if min_age is not None else -INF,
+        "max_age": max_age if max_age is not None else INF,
+        "min_income": _number(_first(criteria, MONTHLY_INCOME_MIN_KEYS)) or -INF,
+        "max_income": max_income if max_income is not None else INF,
+        "states": states,
+        "occupations": _text_set(_first(criteria, OCCUPATION_KEYS)),
+        "unverified": [
+            key.replace("_", " ") if value is True else f"{key.replace('_', ' ')}: {value}"
+            for key, value in criteria.items()
+            if key not in INDEXED_KEYS and value not in (None, "", False)
+        ],
+    }
+
+
+class RangeIndex:
+    """Schemes whose [low, high] range contains a value, via sorted bounds and prefix bitsets"""
+
+    def __init__(self, lows: List[float], highs: List[float]):
+        by_low = sorted(range(len(lows)), key=lambda i: lows[i])
+        by_high = sorted(range(len(highs)), key=lambda i: highs[i])
+        self.lows = [lows[i] for i in by_low]
+        self.highs = [highs[i] for i in by_high]
+
+        # low_prefix[k]: schemes with the k smallest lows; high_suffix[k]: schemes from the k-th smallest high on
+        self.low_prefix = [0]
+        for i in by_low:
+            self.low_prefix.append(self.low_prefix[-1] | (1 << i))
+        self.high_suffix = [0] * (len(highs) + 1)
+        for k in range(len(highs) - 1, -1, -1):
+            self.high_suffix[k] = self.high_suffix[k + 1] | (1 << by_high[k])
+
+    def containing(self, value: float) -> int:
+        """Bitset of schemes with low <= value <= high"""
+        return self.low_prefix[bisect_right(self.lows, value)] & self.high_suffix[bisect_left(self.highs, value)]
+
+
+def _bits(bitset: int) -> Iterator[int]:
+    while bitset:
+        low = bitset & -bitset
+        yield low.bit_length() - 1
+        bitset ^= low
+
+
+def age_on(date_of_birth: Any, as_of: Optional[date] = None) -> Optional[int]:
+    """Age in whole years from an ISO date of birth"""
+    if not date_of_birth:
+        return None
+    born = datetime.strptime(str(date_of_birth)[:10], "%Y-%m-%d").date()
+    as_of = as_of or datetime.now().date()
+    return as_of.year - born.year - ((as_of.month, as_of.day) < (born.month, born.day))
+
+
+class SchemeIndex:
+    """Compiled eligibility index over the active government schemes"""
+
+    def __init__(self, schemes: List[Dict[str, Any]]):
+        self.schemes = schemes
+        self.criteria = [parse_criteria(scheme) for scheme in schemes]
+        self.all_bits = (1 << len(schemes)) - 1
+
+        self.age = RangeIndex([c["min_age"] for c in self.criteria], [c["max_age"] for c in self.criteria])
+        self.income = RangeIndex([c["min_income"] for c in self.criteria], [c["max_income"] for c in self.criteria])
+        self.age_bounded = sum(1 << i for i, c in enumerate(self.criteria) if c["min_age"] > -INF or c["max_age"] < INF)
+        self.income_bounded = sum(
+            1 << i for i, c in enumerate(self.criteria) if c["min_income"] > -INF or c["max_income"] < INF
+        )
+
+        # State / occupation bitsets; schemes without a restriction sit in the "any" bitset
+        self.any_state = 0
+        self.state_bits: Dict[str, int] = {}
+        self.any_occupation = 0
+        self.occupation_bits: Dict[str, int] = {}
+        for i, c in enumerate(self.criteria):
+            if not c["states"]:
+                self.any_state |= 1 << i
+            for state in c["states"]:
+                self.state_bits[state] = self.state_bits.get(state, 0) | (1 << i)
+            if not c["occupations"]:
+                self.any_occupation |= 1 << i
+            for occupation in c["occupations"]:
+                self.occupation_bits[occupation] = self.occupation_bits.get(occupation, 0) | (1 << i)
+
+    def _occupation_match(self, occupation: Optional[str], user_type: Optional[str]) -> int:
+        text = (occupation or "").strip().lower()
+        tags = set(GIG_WORKER_TAGS) if (user_type or "gig_worker") == "gig_worker" else set()
+        bits = self.any_occupation
+        for keyword, keyword_bits in self.occupation_bits.items():
+            if keyword in tags or (text and (keyword in text or text in keyword)):
+                bits |= keyword_bits
+        return bits
+
+    def match(self, user: Dict[str, Any], as_of: Optional[date] = None) -> List[Dict[str, Any]]:
+        """
+        Find the schemes a user is eligible for
+
+        Unknown user attributes (no date of birth, income, state or
+        occupation) don't exclude a scheme; they are listed as missing
+        requirements and lower the match confidence instead. A gig worker
+        without an occupation still matches gig-worker schemes outright.
+
+        Args:
+            user: {"date_of_birth", "state", "occupation", "user_type", "monthly_income"}
+            as_of: Date used for the age calculation
+
+        Returns:
+            [{"scheme_id", "scheme_name", "match_confidence", "missing_requirements"}]
+        """
+        age = age_on(user.get("date_of_birth"), as_of)
+        income = user.get("monthly_income")
+        state = (user.get("state") or "").strip().lower()
+        occupation = (user.get("occupation") or "").strip()
+        occupation_bits = self._occupation_match(occupation, user.get("user_type"))
+
+        eligible = self.all_bits
+        eligible &= self.age.containing(age) if age is not None else self.all_bits
+        eligible &= self.income.containing(float(income)) if income is not None else self.all_bits
+        eligible &= (self.any_state | self.state_bits.get(state, 0)) if state else self.all_bits
+        eligible &= occupation_bits if occupation else self.all_bits
+        # Occupation-restricted schemes that only an unknown occupation could confirm
+        occupation_unverified = 0 if occupation else self.all_bits & ~occupation_bits
+
+        matches = []
+        for i in _bits(eligible):
+            c = self.criteria[i]
+            missing = list(c["unverified"])
+            if age is None and (self.age_bounded >> i) & 1:
+                missing.append(f"Date of birth needed to confirm age {c['min_age']:g}-{c['max_age']:g}")
+            if income is None and (self.income_bounded >> i) & 1:
+                missing.append("Monthly income needed to confirm income limit")
+            if not state and c["states"]:
+                missing.append(f"State of residence needed (scheme applies in {', '.join(sorted(c['states']))})")
+            if (occupation_unverified >> i) & 1:
+                missing.append(f"Occupation needed (scheme is for {', '.join(sorted(c['occupations']))})")
+
+            matches.append({
+                "scheme_id": self.schemes[i]["scheme_id"],
+                "scheme_name": self.schemes[i].get("scheme_name"),
+                "match_confidence": round(max(1.0 - UNVERIFIED_PENALTY * len(missing), MIN_CONFIDENCE), 2),
+                "missing_requirements": missing,
+            })
+        return matches
+
+    def match_all(
+        self,
+        users: List[Dict[str, Any]],
+        scheme_id: Optional[str] = None,
+        as_of: Optional[date] = None,
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Match many users at once, optionally restricted to one scheme
+
+        Returns:
+            user_id -> matches (users with no match are omitted)
+        """
+        results = {}
+        for user in users:
+            matches = self.match(user, as_of)
+            if scheme_id is not None:
+                matches = [m for m in matches if m["scheme_id"] == scheme_id]
+            if matches:
+                results[user["user_id"]] = matches
+        return results
+
+
+def scheme_user(user: Dict[str, Any], profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Combine a users row and its user_profiles row into match() input
+
+    Monthly income is the midpoint of the profile's income range when both
+    ends are known.
+    """
+    profile = profile or {}
+    low, high = _number(profile.get("monthly_income_min")), _number(profile.get("monthly_income_max"))
+    known = [value for value in (low, high) if value is not None]
+    return {
+        "user_id": user.get("user_id"),
+        "date_of_birth": user.get("date_of_birth"),
+        "state": user.get("state"),
+        "occupation": user.get("occupation"),
+        "user_type": user.get("user_type"),
+        "monthly_income": sum(known) / len(known) if known else None,
+    }
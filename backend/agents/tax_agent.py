@@ -1,6 +1,7 @@
 """
 Tax and Compliance Engine Agent
 Handles ITR filing preparation and tax calculations for gig workers
+Tax rules live in the tax engine; the LLM only adds an optional narrative
 Writes to: tax_records table
 """
 
@@ -9,10 +10,17 @@ import json
 from datetime import datetime
 import os
 import sys
+from typing import Optional
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from autogen_runtime import run_autogen_mcp_task
+from autogen_runtime import run_autogen_mcp_task, write_agent_data
+from postgrest_client import get_postgrest_client
+from user_snapshot import UserSnapshot
+from tax_engine import compute_tax_records, financial_year, summarise_transactions
+
+# Set TAX_AGENT_LLM_NARRATIVE=true to also ask the LLM to explain the tax calculation
+LLM_NARRATIVE = os.getenv("TAX_AGENT_LLM_NARRATIVE", "false").lower() == "true"
 
 
 class TaxComplianceAgent:
@@ -25,369 +33,37 @@ class TaxComplianceAgent:
     def _create_system_prompt(self) -> str:
         return """You are a Tax and Compliance Engine specializing in Indian tax law for gig workers.
 
-You have comprehensive knowledge of Indian Income Tax for FY 2024-25 (AY 2025-26) specifically for gig workers.
-
-Your task is to calculate taxes and prepare structured data for the tax_records table.
-
-**CRITICAL: You must output ONLY valid JSON that matches the tax_records table schema:**
-
-```json
-{
-  "tax_record": {
-    "financial_year": "2024-25",
-    "assessment_year": "2025-26",
-    "total_income": 485000.00,
-    "business_income": 485000.00,
-    "deductions": 150000.00,
-    "taxable_income": 335000.00,
-    "total_tax_liability": 9800.00,
-    "advance_tax_paid": 0.00,
-    "tax_due": 9800.00,
-    "tax_regime": "new",
-    "presumptive_income": 485000.00,
-    "presumptive_tax": 9700.00,
-    "tds_deducted": 1200.00,
-    "tax_suggestions": [
-      "File advance tax by March 15th",
-      "Maintain proper books of accounts",
-      "Consider presumptive taxation scheme"
-    ],
-    "compliance_status": "compliant",
-    "filing_due_date": "2025-07-31",
-    "itr_type": "ITR-4"
-  }
-}
-```
-
-**What you do:**
-1. Read transactions for income calculation using: postgrestRequest("transactions", "GET", filters={"user_id": "USER_ID", "transaction_type": "income"})
-2. Read user_profiles for deduction eligibility using: postgrestRequest("user_profiles", "GET", filters={"user_id": "USER_ID"})
-3. Calculate total business income from gig work
-4. Apply deductions under Section 80
-5. Determine optimal tax regime (old vs new)
-6. Calculate tax liability under presumptive scheme
-7. Check TDS deducted and advance tax
-8. Generate tax planning suggestions
-9. Output ONLY the JSON format above - no explanations
-
-**Database Tool Usage:**
-- Use postgrestRequest() to read transaction and profile data
-- Example: postgrestRequest("transactions", "GET", filters={"user_id": "153735c8-b1e3-4fc6-aa4e-7deb6454990b", "transaction_type": "income"})
-- This returns JSON income data you can use for tax calculations
-
-**Database Schema Requirements:**
-- financial_year/assessment_year: String format
-- total_income/business_income/taxable_income: Numbers with 2 decimals
-- deductions/total_tax_liability/advance_tax_paid/tax_due: Numbers with 2 decimals
-- tax_regime: "old" or "new"
-- presumptive_income/presumptive_tax: Numbers with 2 decimals
-- tds_deducted: Number with 2 decimals
-- tax_suggestions: Array of strings
-- compliance_status: "compliant", "non_compliant", "attention_needed"
-- filing_due_date: Date string YYYY-MM-DD
-- itr_type: "ITR-1", "ITR-4", etc.
-
-**Output ONLY the JSON object. No other text.**
-1. Read transactions table to calculate gross annual income
-2. Read user_profiles for deduction eligibility (debt_obligations, etc.)
-3. Calculate applicable deductions
-4. Determine optimal tax regime (old vs new)
-5. Calculate final tax liability
-6. Prepare ITR form data (ITR-3 or ITR-4)
-7. Write results to tax_records table
-8. Log your actions to agent_logs table
-
-═══════════════════════════════════════════════════════
-INDIAN INCOME TAX FOR GIG WORKERS - FY 2024-25 (AY 2025-26)
-═══════════════════════════════════════════════════════
-
-## 1. CURRENT TAX REGIME SLABS (NEW REGIME - FY 2024-25)
-
-| Income Slab           | Tax Rate | Tax Payable                      |
-|-----------------------|----------|----------------------------------|
-| Up to ₹4 lakh         | 0%       | ₹0                               |
-| ₹4L - ₹8L             | 5%       | 5% on amount above ₹4L           |
-| ₹8L - ₹12L            | 10%      | ₹20,000 + 10% above ₹8L          |
-| ₹12L - ₹16L           | 15%      | ₹60,000 + 15% above ₹12L         |
-| ₹16L - ₹20L           | 20%      | ₹1,20,000 + 20% above ₹16L       |
-| ₹20L - ₹24L           | 25%      | ₹2,00,000 + 25% above ₹20L       |
-| Above ₹24L            | 30%      | ₹3,00,000 + 30% above ₹24L       |
-
-**CRITICAL: Section 87A Rebate**
-- Income up to ₹12 lakh gets rebate of ₹60,000
-- This makes income up to ₹12 lakh EFFECTIVELY TAX-FREE
-
-## 2. PRESUMPTIVE TAXATION SCHEMES
-
-### Section 44ADA (Professionals - Freelancers, Consultants)
-- Gross Receipts Limit: ₹50 lakh/year (₹75 lakh if 95%+ digital)
-- **Presumptive Income: 50% of gross receipts**
-- ITR Form: ITR-4 (Sugam)
-- Books of Accounts: NOT required
-- Audit: NOT required (unless income < 50% of receipts)
-
-### Section 44AD (Business - E-commerce, Delivery)
-- Non-digital transactions: 8% of gross receipts
-- Digital transactions (≥95%): 6% of gross receipts
-- E-commerce operators: 6% of gross receipts
-- ITR Form: ITR-4
-
-### Section 44AE (Vehicle Operators - Taxi, Auto)
-- Gross Receipts Limit: ₹50 lakh per vehicle
-- Presumptive Income: Typically 50% of gross receipts
-- ITR Form: ITR-4
-
-## 3. TAX DEDUCTIONS AVAILABLE
-
-### Section 80C (₹1,50,000 limit)
-- LIC premiums
-- EPF contributions
-- Mutual Fund SIPs (ELSS)
-- PPF deposits
-
-### Section 80D (Health Insurance)
-- Self/family: ₹25,000
-- Parents (senior citizens): ₹50,000
-
-### Section 80E (Education Loan Interest)
-- Unlimited deduction on interest paid
-
-### Section 80TTA (Savings Account Interest)
-- ₹10,000 limit
-
-## 4. BUSINESS EXPENSE DEDUCTIONS
-
-### Direct Business Expenses (Deductible):
-- Equipment & Software: ₹50,000 for laptop
-- Office Supplies: ₹5,000/month
-- Internet & Phone: 70% of bill (business portion)
-- Subscription Services: ₹500/month for tools
-- Professional Development: ₹20,000 for certification
-- Insurance: ₹10,000/year
-- Licenses & Permits: ₹2,000/year
-
-### Vehicle & Transportation (Deductible):
-- Fuel/Petrol/Diesel (business portion)
-- Vehicle Maintenance
-- Vehicle Insurance (business portion)
-- Registration & Road Tax
-- Tolls & Parking (business-related)
-- Vehicle Depreciation
-
-**Example for Delivery Driver:**
-- Annual vehicle expenses: ₹1,20,000
-- Business usage: 85%
-- Deductible: ₹1,02,000
-
-### Home Office Deduction (If Applicable):
-- Formula: (Business area ÷ Total area) × Monthly expenses
-- Example: 300 sq ft office in 1,500 sq ft home (20%)
-- Monthly rent ₹20,000 → Deductible: ₹4,000/month
-
-### NOT Deductible:
-- Personal entertainment
-- Commuting to/from residence
-- Meals at home
-- Personal phone/internet (100%)
-- Life insurance premiums
-- Income tax payments
-- Fines and penalties
-
-## 5. TDS (Tax Deducted at Source)
-
-### Section 194O - E-Commerce TDS
-- Rate: 0.1% (reduced from 1% from Oct 1, 2024)
-- Higher Rate: 5% (if PAN not furnished)
-- Threshold: ₹5 lakh annual payments
-
-**Example:**
-- Annual sales: ₹8,00,000
-- TDS: ₹8,00,000 × 0.1% = ₹800
-- Amount received: ₹7,99,200
-
-## 6. ITR FORM SELECTION
-
-### ITR-3 (Use When):
-- Maintaining detailed accounts with invoices
-- Gross receipts > ₹2 crore (business) or ₹50 lakh (profession)
-- High expenses (> 50% of income)
-- Declaring income below presumptive rate
-
-### ITR-4 (Use When):
-- Opting for presumptive taxation (44AD, 44ADA, 44AE)
-- Meeting turnover limits
-- Preferring simplified compliance
-- Low expenses (< 50% of income)
-
-### Salary + Gig Income:
-- Combined ≤ ₹50 lakh: ITR-1 or ITR-4
-- Combined > ₹50 lakh: ITR-3
-
-## 7. TAX AUDIT REQUIREMENTS (Section 44AB)
-
-### Mandatory Audit If:
-- Business (non-digital): Turnover > ₹1 crore
-- Business (95%+ digital): Turnover > ₹10 crore
-- Professional: Gross receipts > ₹50 lakh
-- Professional (95% digital): > ₹75 lakh
-- 44AD (declaring < 8%): Income exceeds exemption
-- 44ADA (declaring < 50%): Income exceeds exemption
-
-**Audit Details:**
-- Cost: ₹10,000 to ₹50,000
-- Duration: 2-6 weeks
-- Conducted by: Chartered Accountant (CA)
-- Form: 3CD (professions) or 3CG (business)
-- File by: October 31
-
-## 8. ADVANCE TAX SCHEDULE
-
-For Regular Taxpayers (ITR-3):
-- Q1 (June 15): 15% of estimated tax
-- Q2 (Sept 15): 45% cumulative
-- Q3 (Dec 15): 75% cumulative
-- Q4 (Mar 15): 100% (full amount)
-
-For Presumptive Taxation (ITR-4):
-- Single installment by March 15/31
-- Or 4 quarterly installments if preferred
-
-**Interest Penalties:**
-- Shortfall in any quarter: 1% per month (Section 234B)
-- No advance tax paid: 1% per month from due date
-- Safe Harbor: If 90% paid by March 31
-
-## 9. FILING DEADLINES & PENALTIES
-
-### Due Dates (FY 2024-25):
-- No audit required: July 31, 2025
-- Tax audit required: October 31, 2025
-- Revised returns: December 31, 2025
-
-### Late Filing Penalties (Section 234F):
-- Aug 1 - Dec 31: ₹5,000 or actual tax (whichever is less)
-- After Dec 31: ₹10,000 or actual tax (whichever is less)
-- Income < ₹5 lakh: ₹1,000
-- Failed despite notice: ₹10,000 + imprisonment
-
-### Interest on Late Tax Payment:
-- Tax not paid by July 31: 1% per month from Aug 1
-- Advance tax shortfall: 1% per month from due date
-
-═══════════════════════════════════════════════════════
-END OF TAX KNOWLEDGE BASE
-═══════════════════════════════════════════════════════
-
-**CALCULATION METHODOLOGY:**
-
-1. **Calculate Gross Income:**
-   - Sum all income transactions from database
-   - Include platform payments, direct client income
-
-2. **Determine Presumptive vs Actual:**
-   - If user qualifies for 44ADA: Compare 50% presumptive vs actual expenses
-   - Choose method that minimizes tax
-
-3. **Apply Deductions:**
-   - Section 80C: Check user_profiles.debt_obligations for investments
-   - Section 80D: Assume ₹25,000 if health insurance indicated
-   - Calculate taxable income
-
-4. **Calculate Tax (New Regime FY 2024-25):**
-   ```
-   If income ≤ ₹4L: Tax = 0
-   If income ≤ ₹8L: Tax = (income - 4L) × 5%
-   If income ≤ ₹12L: Tax = 20,000 + (income - 8L) × 10%
-   If income ≤ ₹16L: Tax = 60,000 + (income - 12L) × 15%
-   If income ≤ ₹20L: Tax = 1,20,000 + (income - 16L) × 20%
-   If income ≤ ₹24L: Tax = 2,00,000 + (income - 20L) × 25%
-   If income > ₹24L: Tax = 3,00,000 + (income - 24L) × 30%
-   ```
-
-5. **Apply Section 87A Rebate:**
-   - If taxable income ≤ ₹12L: Rebate = min(₹60,000, calculated tax)
-   - Effectively makes income up to ₹12L tax-free
-
-6. **Subtract TDS:**
-   - Check Form 26AS equivalent from database
-   - Final tax = Calculated tax - TDS paid
-
-7. **Determine ITR Form:**
-   - If using presumptive (44ADA) and income ≤ ₹50L: ITR-4
-   - If detailed accounting or income > ₹50L: ITR-3
-
-**OUTPUT TO tax_records TABLE:**
-
-Write to `tax_records` table with these exact fields:
-- tax_record_id: (UUID, auto-generated)
-- user_id: (from input)
-- financial_year: "2024-25"
-- gross_income: (calculated from transactions)
-- income_by_source: (JSON: {platform_name: amount, ...})
-- total_deductions: (sum of all 80C, 80D, etc.)
-- deduction_details: (JSON: {section_80c: X, section_80d: Y, ...})
-- taxable_income: (gross_income - total_deductions)
-- tax_liability: (calculated per slabs)
-- tax_paid: (TDS deducted, if available)
-- refund_amount: (if tax_paid > tax_liability)
-- itr_form_type: "ITR-3" or "ITR-4"
-- filing_status: "not_filed"
-- filing_date: null
-- acknowledgement_number: null
-- created_at: (current timestamp)
-- updated_at: (current timestamp)
-
-**IMPORTANT NOTES:**
-- Use FY 2024-25 (AY 2025-26) tax slabs
-- Section 87A rebate is CRITICAL for incomes ≤ ₹12L
-- Presumptive taxation (44ADA) often best for gig workers
-- TDS rate for e-commerce is 0.1% (as of Oct 2024)
-- Audit required if professional income > ₹50 lakh
-- Always log your actions to agent_logs table
-
-**Available MCP Tools:**
-- mcp__supabase-postgres__postgrestRequest: Execute database queries
-- mcp__supabase-postgres__sqlToRest: Convert SQL to REST API calls
-
-**Old Regime (with deductions):**
-- ₹0-2.5L: Nil
-- ₹2.5-5L: 5%
-- ₹5-10L: 20%
-- Above ₹10L: 30%
-
-**ITR Forms for Gig Workers:**
-- ITR-3: For business/profession income (most gig workers)
-- ITR-4: Presumptive taxation (if turnover < ₹2 crore)
-
-**Important Considerations:**
-- Gig workers are typically treated as self-employed
-- Need to maintain books of accounts if turnover > ₹25L
-- TDS may be deducted by platforms (show separately)
-- GST registration required if turnover > ₹20L (₹10L for special states)
-
-**Available MCP Tools:**
-- mcp__supabase-postgres__postgrestRequest: Execute database queries
-- mcp__supabase-postgres__sqlToRest: Convert SQL to REST API calls
-
-**Output Format:**
-Store in tax_records table with fields:
-- user_id
-- assessment_year (e.g., '2024-25')
-- gross_income
-- deductions (JSON: {section_80c: X, section_80d: Y, ...})
-- taxable_income
-- tax_liability
-- regime_used (old/new)
-- itr_form_data (JSON with all ITR fields)
-- filing_status (not_filed/filed/verified)
-- created_at"""
-
-    async def analyze_user(self, user_id: str) -> dict:
+You are given a tax record that has already been calculated from the user's
+transactions (presumptive vs actual income, old vs new regime, Section 87A rebate,
+TDS and ITR form). Do not recalculate the numbers and do not write to the database.
+
+Explain the result to the gig worker in 3-5 short sentences:
+- How much tax they owe (if any) and why
+- Which regime and ITR form to use
+- The most important deadline or action"""
+
+    async def fetch_tax_inputs(self, user_id: str, snapshot: Optional[UserSnapshot] = None) -> tuple:
+        """Fetch the user's financial-year transactions and occupation"""
+        client = snapshot or get_postgrest_client()
+        fy_start = financial_year()["start"].isoformat()
+        transactions, users = await asyncio.gather(
+            client.select(
+                "transactions",
+                filters={"user_id": user_id, "transaction_date": f"gte.{fy_start}"},
+                columns="amount,transaction_type,category,source,payment_method,transaction_date",
+            ),
+            client.select("users", filters={"user_id": user_id}, columns="occupation"),
+        )
+        occupation = users[0].get("occupation") if users else None
+        return transactions, occupation
+
+    async def analyze_user(self, user_id: str, snapshot: Optional[UserSnapshot] = None) -> dict:
         """
         Calculate taxes and prepare ITR for a specific user
 
         Args:
             user_id: UUID of the user to analyze
+            snapshot: Per-run snapshot of the user's input rows (read from the database if None)
 
         Returns:
             dict with analysis results and success status
@@ -395,30 +71,22 @@ Store in tax_records table with fields:
         print(f"[Tax Agent] Starting analysis for user {user_id}")
 
         try:
-            prompt = f"""Calculate taxes and prepare ITR for user {user_id}.
-
-Steps:
-1. Read transactions to calculate annual gross income
-2. Read user_profiles for deduction information
-3. Calculate applicable deductions (80C, 80D, etc.)
-4. Calculate taxable income
-5. Compare old vs new tax regime - choose better option
-6. Calculate final tax liability
-7. Prepare ITR form data (ITR-3 or ITR-4)
-8. Write results to tax_records table
-9. Log to agent_logs table
-
-User ID: {user_id}
-
-Please execute this analysis and report the tax calculations."""
-
-            result = await run_autogen_mcp_task(
-                agent_name="tax_agent",
-                system_prompt=self.system_prompt,
-                task=prompt,
-                user_id=user_id,
-                use_azure=True
-            )
+            transactions, occupation = await self.fetch_tax_inputs(user_id, snapshot)
+            tax_record = compute_tax_records([summarise_transactions(transactions, occupation)])[0]
+            print(f"[Tax Agent] {tax_record['tax_regime']} regime, {tax_record['itr_type']}, "
+                  f"tax due {tax_record['tax_due']} from {len(transactions)} transactions")
+
+            written = await write_agent_data(user_id, "tax_agent", {"tax_record": dict(tax_record)})
+
+            result = {"tax_record": tax_record, "written": written}
+            if LLM_NARRATIVE:
+                result["narrative"] = await run_autogen_mcp_task(
+                    agent_name="tax_narrative",
+                    system_prompt=self.system_prompt,
+                    task=f"Tax record for user {user_id}:\n{json.dumps(tax_record, indent=2, ensure_ascii=False)}",
+                    user_id=user_id,
+                    use_azure=True
+                )
 
             print(f"[Tax Agent] Analysis complete for user {user_id}")
 
@@ -0,0 +1,386 @@
+"""
+Tax Engine
+Deterministic Indian income-tax calculation for gig workers behind the Tax Compliance Agent
+
+The rules (slabs, 87A rebate, presumptive schemes, deduction limits, TDS) are
+plain data tables below, and every calculation takes NumPy arrays, so one call
+can compute a single user or the whole user base.
+"""
+
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+# Financial year -> (lower bound, rate) per slab. A year without its own table
+# uses the latest earlier one, so add a year here when its budget changes the rules.
+NEW_REGIME_SLABS = {
+    "2024-25": [
+        (0, 0.00),
+        (300000, 0.05),
+        (700000, 0.10),
+        (1000000, 0.15),
+        (1200000, 0.20),
+        (1500000, 0.30),
+    ],
+    "2025-26": [
+        (0, 0.00),
+        (400000, 0.05),
+        (800000, 0.10),
+        (1200000, 0.15),
+        (1600000, 0.20),
+        (2000000, 0.25),
+        (2400000, 0.30),
+    ],
+}
+OLD_REGIME_SLABS = {
+    "2024-25": [
+        (0, 0.00),
+        (250000, 0.05),
+        (500000, 0.20),
+        (1000000, 0.30),
+    ],
+}
+
+# Section 87A: financial year -> regime -> (max taxable income, max rebate)
+REBATE_87A = {
+    "2024-25": {"new": (700000, 25000), "old": (500000, 12500)},
+    "2025-26": {"new": (1200000, 60000), "old": (500000, 12500)},
+}
+
+# Health and education cess on tax after rebate
+CESS_RATE = 0.04
+
+# Chapter VI-A deductions (old regime only): section -> limit
+DEDUCTION_LIMITS = {"80c": 150000, "80d": 25000, "80tta": 10000}
+
+# Expense categories that count towards each deduction (matched case-insensitively)
+DEDUCTION_CATEGORIES = {
+    "80c": {"investment", "lic", "life insurance", "ppf", "elss", "epf", "sip"},
+    "80d": {"health insurance", "medical insurance"},
+}
+
+# Expense categories treated as business expenses when computing actual profit
+BUSINESS_EXPENSE_CATEGORIES = {
+    "fuel", "vehicle", "vehicle maintenance", "transport", "internet", "phone",
+    "mobile", "equipment", "software", "business", "tools", "repairs",
+}
+
+# Expense categories recording tax already paid
+ADVANCE_TAX_CATEGORIES = {"tax", "advance tax", "income tax"}
+
+# Presumptive schemes: 44ADA for professionals, 44AD for business (delivery, driving, ...)
+PRESUMPTIVE_44ADA_RATE = 0.50
+PRESUMPTIVE_44AD_RATE = 0.08
+PRESUMPTIVE_44AD_DIGITAL_RATE = 0.06
+DIGITAL_SHARE_THRESHOLD = 0.95
+PRESUMPTIVE_44ADA_LIMIT = 5000000
+PRESUMPTIVE_44ADA_DIGITAL_LIMIT = 7500000
+PRESUMPTIVE_44AD_LIMIT = 20000000
+PRESUMPTIVE_44AD_DIGITAL_LIMIT = 30000000
+
+# Occupations (matched as substrings of users.occupation) taxed as professionals under 44ADA
+PROFESSIONAL_OCCUPATIONS = ("freelan", "consult", "design", "developer", "writer", "tutor", "photograph", "architect")
+
+# Section 194O e-commerce TDS
+TDS_194O_RATE = 0.001
+TDS_194O_THRESHOLD = 500000
+ECOMMERCE_PLATFORMS = {
+    "uber", "ola", "rapido", "swiggy", "zomato", "zepto", "blinkit", "dunzo",
+    "amazon", "flipkart", "meesho", "urban company", "porter",
+}
+
+# Advance tax is due once the year's tax (after TDS) reaches this amount (Section 208)
+ADVANCE_TAX_THRESHOLD = 10000
+
+# Turnover above which GST registration is required
+GST_THRESHOLD = 2000000
+
+# ITR-1/ITR-4 income ceiling
+ITR4_INCOME_LIMIT = 5000000
+
+
+def financial_year(as_of: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Indian financial year (April-March) containing as_of
+
+    Returns:
+        {"financial_year": "2025-26", "assessment_year": "2026-27", "start": date, "end": date}
+    """
+    as_of = as_of or datetime.now().date()
+    first = as_of.year if as_of.month >= 4 else as_of.year - 1
+    return {
+        "financial_year": f"{first}-{str(first + 1)[2:]}",
+        "assessment_year": f"{first + 1}-{str(first + 2)[2:]}",
+        "start": date(first, 4, 1),
+        "end": date(first + 1, 3, 31),
+    }
+
+
+def year_rules(table: Dict[str, Any], fy: str) -> Any:
+    """Entry of a per-year table for financial year fy (the latest year at or before it, else the earliest)"""
+    known = [year for year in sorted(table) if year <= fy]
+    return table[known[-1] if known else min(table)]
+
+
+def slab_tax(income: np.ndarray, slabs: List[tuple]) -> np.ndarray:
+    """Tax on each income under a slab table (before rebate and cess)"""
+    bounds = np.array([lower for lower, _ in slabs], dtype=np.float64)
+    rates = np.array([rate for _, rate in slabs], dtype=np.float64)
+    widths = np.append(np.diff(bounds), np.inf)
+    taxed = np.clip(np.asarray(income, dtype=np.float64)[:, None] - bounds[None, :], 0, widths)
+    return taxed @ rates
+
+
+def regime_tax(taxable: np.ndarray, regime: str, fy: str) -> np.ndarray:
+    """Final tax under a regime in financial year fy: slabs, then 87A rebate, then cess"""
+    slabs = year_rules(NEW_REGIME_SLABS if regime == "new" else OLD_REGIME_SLABS, fy)
+    tax = slab_tax(taxable, slabs)
+    rebate_limit, max_rebate = year_rules(REBATE_87A, fy)[regime]
+    rebate = np.where(taxable <= rebate_limit, np.minimum(tax, max_rebate), 0.0)
+    tax = tax - rebate
+    if regime == "new":
+        # Marginal relief: just above the rebate limit, tax can't exceed the income over it
+        tax = np.where(taxable > rebate_limit, np.minimum(tax, taxable - rebate_limit), tax)
+    return np.round(tax * (1 + CESS_RATE), 2)
+
+
+def compute_tax(
+    gross_receipts: np.ndarray,
+    business_expenses: np.ndarray,
+    digital_share: np.ndarray,
+    is_professional: np.ndarray,
+    deductions: Dict[str, np.ndarray],
+    platform_receipts: np.ndarray,
+    advance_tax_paid: np.ndarray,
+    fy: Optional[str] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Evaluate presumptive vs actual income and old vs new regime for many users
+
+    Args:
+        gross_receipts: Annual gross receipts per user
+        business_expenses: Annual business expenses per user
+        digital_share: Fraction of receipts received digitally (0-1)
+        is_professional: True for 44ADA professionals, False for 44AD business
+        deductions: Section ("80c", "80d", "80tta") -> claimed amount per user
+        platform_receipts: Receipts paid out by e-commerce platforms (Section 194O)
+        advance_tax_paid: Advance/self-assessment tax already paid
+        fy: Financial year whose rules apply, e.g. "2024-25" (defaults to the current one)
+
+    Returns:
+        Field name -> array per user (see tax_record for the meaning)
+    """
+    fy = fy or financial_year()["financial_year"]
+    gross = np.asarray(gross_receipts, dtype=np.float64)
+    digital = np.asarray(digital_share) >= DIGITAL_SHARE_THRESHOLD
+    professional = np.asarray(is_professional, dtype=bool)
+
+    # Presumptive income and eligibility
+    presumptive_rate = np.where(
+        professional, PRESUMPTIVE_44ADA_RATE,
+        np.where(digital, PRESUMPTIVE_44AD_DIGITAL_RATE, PRESUMPTIVE_44AD_RATE)
+    )
+    presumptive_limit = np.where(
+        professional,
+        np.where(digital, PRESUMPTIVE_44ADA_DIGITAL_LIMIT, PRESUMPTIVE_44ADA_LIMIT),
+        np.where(digital, PRESUMPTIVE_44AD_DIGITAL_LIMIT, PRESUMPTIVE_44AD_LIMIT)
+    )
+    presumptive_eligible = gross <= presumptive_limit
+    presumptive_income = np.round(gross * presumptive_rate, 2)
+    actual_income = np.maximum(gross - np.asarray(business_expenses, dtype=np.float64), 0.0)
+
+    # Presumptive is used whenever it's available and not above actual profit; declaring
+    # less than the presumptive rate means keeping books and filing ITR-3
+    use_presumptive = presumptive_eligible & (presumptive_income <= actual_income)
+    business_income = np.where(use_presumptive, presumptive_income, actual_income)
+
+    # Deductions only apply under the old regime
+    total_deductions = np.zeros_like(gross)
+    for section, limit in DEDUCTION_LIMITS.items():
+        total_deductions += np.minimum(np.asarray(deductions.get(section, 0.0), dtype=np.float64), limit)
+
+    new_tax = regime_tax(business_income, "new", fy)
+    old_taxable = np.maximum(business_income - total_deductions, 0.0)
+    old_tax = regime_tax(old_taxable, "old", fy)
+    use_new = new_tax <= old_tax
+
+    platform = np.asarray(platform_receipts, dtype=np.float64)
+    tds = np.round(np.where(platform > TDS_194O_THRESHOLD, platform * TDS_194O_RATE, 0.0), 2)
+    advance = np.asarray(advance_tax_paid, dtype=np.float64)
+    liability = np.where(use_new, new_tax, old_tax)
+
+    # Section 44AB: declaring below the presumptive rate with income above the basic
+    # exemption, or being over the presumptive turnover limit, requires a tax audit
+    basic_exemption = np.where(use_new, year_rules(NEW_REGIME_SLABS, fy)[1][0], year_rules(OLD_REGIME_SLABS, fy)[1][0])
+    audit_required = ~use_presumptive & (business_income > basic_exemption)
+
+    return {
+        "gross_receipts": gross,
+        "business_income": business_income,
+        "presumptive_income": presumptive_income,
+        "presumptive_tax": np.where(
+            use_new,
+            regime_tax(presumptive_income, "new", fy),
+            regime_tax(np.maximum(presumptive_income - total_deductions, 0.0), "old", fy)
+        ),
+        "use_presumptive": use_presumptive,
+        "is_professional": professional,
+        "deductions": np.where(use_new, 0.0, total_deductions),
+        "unused_80c": DEDUCTION_LIMITS["80c"] - np.minimum(np.asarray(deductions.get("80c", 0.0)), DEDUCTION_LIMITS["80c"]),
+        "taxable_income": np.where(use_new, business_income, old_taxable),
+        "new_regime_tax": new_tax,
+        "old_regime_tax": old_tax,
+        "use_new_regime": use_new,
+        "total_tax_liability": liability,
+        "tds_deducted": tds,
+        "advance_tax_paid": advance,
+        "tax_due": np.maximum(liability - tds - advance, 0.0),
+        "audit_required": audit_required,
+    }
+
+
+def _tax_suggestions(result: Dict[str, np.ndarray], i: int, fy: str) -> List[str]:
+    suggestions = []
+    saving = abs(float(result["new_regime_tax"][i] - result["old_regime_tax"][i]))
+    regime = "new" if result["use_new_regime"][i] else "old"
+
+    if result["use_presumptive"][i]:
+        section = "44ADA" if result["is_professional"][i] else "44AD"
+        suggestions.append(f"Declare income under presumptive taxation (Section {section}) and file ITR-4")
+    else:
+        suggestions.append("Maintain books of accounts for actual-profit filing (ITR-3)")
+
+    if saving >= 1:
+        suggestions.append(f"The {regime} tax regime saves ₹{saving:,.0f} this year")
+    rebate_limit = year_rules(REBATE_87A, fy)["new"][0]
+    if regime == "new" and result["taxable_income"][i] <= rebate_limit:
+        suggestions.append(f"Income up to ₹{rebate_limit / 100000:g} lakh is tax-free under the new regime "
+                           "with the Section 87A rebate")
+    if regime == "old" and result["unused_80c"][i] > 0:
+        suggestions.append(f"Invest up to ₹{float(result['unused_80c'][i]):,.0f} more under Section 80C (PPF, ELSS, LIC)")
+    if result["tax_due"][i] >= ADVANCE_TAX_THRESHOLD:
+        suggestions.append("Pay advance tax by March 15th to avoid interest under Sections 234B/234C")
+    if result["audit_required"][i]:
+        suggestions.append("A tax audit (Section 44AB) is required - engage a CA before the October 31st deadline")
+    if result["gross_receipts"][i] > GST_THRESHOLD:
+        suggestions.append("Turnover is above ₹20 lakh - GST registration is required")
+    suggestions.append("Keep platform payout statements and check TDS credits in Form 26AS")
+    return suggestions
+
+
+def tax_record(result: Dict[str, np.ndarray], i: int, as_of: Optional[date] = None) -> Dict[str, Any]:
+    """Format user i's results as a tax_record object"""
+    fy = financial_year(as_of)
+    r = lambda value: round(float(value), 2)  # noqa: E731
+    itr4 = bool(result["use_presumptive"][i]) and result["business_income"][i] <= ITR4_INCOME_LIMIT
+    filing_year = fy["end"].year
+
+    return {
+        "financial_year": fy["financial_year"],
+        "assessment_year": fy["assessment_year"],
+        "total_income": r(result["gross_receipts"][i]),
+        "business_income": r(result["business_income"][i]),
+        "deductions": r(result["deductions"][i]),
+        "taxable_income": r(result["taxable_income"][i]),
+        "total_tax_liability": r(result["total_tax_liability"][i]),
+        "advance_tax_paid": r(result["advance_tax_paid"][i]),
+        "tax_due": r(result["tax_due"][i]),
+        "tax_regime": "new" if result["use_new_regime"][i] else "old",
+        "presumptive_income": r(result["presumptive_income"][i]),
+        "presumptive_tax": r(result["presumptive_tax"][i]),
+        "tds_deducted": r(result["tds_deducted"][i]),
+        "tax_suggestions": _tax_suggestions(result, i, fy["financial_year"]),
+        "compliance_status": "compliant" if result["tax_due"][i] < ADVANCE_TAX_THRESHOLD else "attention_needed",
+        "filing_due_date": f"{filing_year}-10-31" if result["audit_required"][i] else f"{filing_year}-07-31",
+        "itr_type": "ITR-4" if itr4 else "ITR-3",
+    }
+
+
+def summarise_transactions(
+    rows: List[Dict[str, Any]],
+    occupation: Optional[str] = None,
+    as_of: Optional[date] = None,
+) -> Dict[str, float]:
+    """
+    Reduce one user's financial-year transactions to compute_tax inputs
+
+    Income is projected to a full year from the days elapsed so far, so the
+    estimate is meaningful early in the year.
+
+    Args:
+        rows: Transactions with amount, transaction_type, category, source,
+            payment_method and transaction_date
+        occupation: users.occupation, used to pick 44ADA vs 44AD
+        as_of: Calculation date (defaults to today)
+
+    Returns:
+        Scalar inputs for compute_tax
+    """
+    fy = financial_year(as_of)
+    as_of = as_of or datetime.now().date()
+    elapsed = max((min(as_of, fy["end"]) - fy["start"]).days + 1, 30)
+    annualise = min(365.0 / elapsed, 12.0)
+
+    totals = {
+        "gross_receipts": 0.0, "digital_receipts": 0.0, "platform_receipts": 0.0,
+        "business_expenses": 0.0, "advance_tax_paid": 0.0, "80c": 0.0, "80d": 0.0,
+    }
+    for row in rows:
+        amount = float(row.get("amount") or 0)
+        category = (row.get("category") or "").strip().lower()
+        if row.get("transaction_type") == "income":
+            totals["gross_receipts"] += amount
+            if (row.get("payment_method") or "").strip().lower() != "cash":
+                totals["digital_receipts"] += amount
+            if (row.get("source") or "").strip().lower() in ECOMMERCE_PLATFORMS:
+                totals["platform_receipts"] += amount
+        elif category in BUSINESS_EXPENSE_CATEGORIES:
+            totals["business_expenses"] += amount
+        elif category in ADVANCE_TAX_CATEGORIES:
+            totals["advance_tax_paid"] += amount
+        else:
+            for section, categories in DEDUCTION_CATEGORIES.items():
+                if category in categories:
+                    totals[section] += amount
+
+    gross = totals["gross_receipts"]
+    occupation = (occupation or "").lower()
+    return {
+        "gross_receipts": gross * annualise,
+        "business_expenses": totals["business_expenses"] * annualise,
+        "digital_share": totals["digital_receipts"] / gross if gross else 0.0,
+        "is_professional": any(keyword in occupation for keyword in PROFESSIONAL_OCCUPATIONS),
+        "80c": totals["80c"],
+        "80d": totals["80d"],
+        "platform_receipts": totals["platform_receipts"] * annualise,
+        "advance_tax_paid": totals["advance_tax_paid"],
+    }
+
+
+def compute_tax_records(summaries: List[Dict[str, float]], as_of: Optional[date] = None) -> List[Dict[str, Any]]:
+    """
+    Compute tax_record objects for many users in one vectorised call
+
+    Args:
+        summaries: One summarise_transactions result per user
+        as_of: Calculation date (defaults to today)
+
+    Returns:
+        tax_record dicts in the same order as summaries
+    """
+    if not summaries:
+        return []
+    column = lambda key: np.array([s[key] for s in summaries])  # noqa: E731
+    result = compute_tax(
+        gross_receipts=column("gross_receipts"),
+        business_expenses=column("business_expenses"),
+        digital_share=column("digital_share"),
+        is_professional=column("is_professional"),
+        deductions={"80c": column("80c"), "80d": column("80d")},
+        platform_receipts=column("platform_receipts"),
+        advance_tax_paid=column("advance_tax_paid"),
+        fy=financial_year(as_of)["financial_year"],
+    )
+    return [tax_record(result, i, as_of) for i in range(len(summaries))]
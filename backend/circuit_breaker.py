@@ -0,0 +1,184 @@
+"""
+Circuit Breakers for upstream services
+One breaker per service (Supabase, each Azure OpenAI deployment), shared by
+every agent in the process
+
+A breaker watches the outcomes of recent calls. Once enough calls in the
+window have failed it opens, and callers get CircuitOpenError immediately
+instead of waiting out a timeout. After a cool-down it lets a few probe
+calls through (half-open): a successful probe closes it, a failed one opens
+it again.
+"""
+
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+# Trip when at least MIN_CALLS calls in the last WINDOW_SECONDS have this failure rate
+FAILURE_RATE = _env_float("CIRCUIT_FAILURE_RATE", 0.5)
+MIN_CALLS = int(_env_float("CIRCUIT_MIN_CALLS", 10))
+WINDOW_SECONDS = _env_float("CIRCUIT_WINDOW_SECONDS", 60.0)
+
+# Seconds to stay open before probing, and concurrent probes allowed while half-open
+OPEN_SECONDS = _env_float("CIRCUIT_OPEN_SECONDS", 30.0)
+HALF_OPEN_PROBES = int(_env_float("CIRCUIT_HALF_OPEN_PROBES", 1))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit is open"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Circuit '{name}' is open; retry in {retry_in:.1f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Error-rate circuit breaker with half-open probing"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate: float = FAILURE_RATE,
+        min_calls: int = MIN_CALLS,
+        window_seconds: float = WINDOW_SECONDS,
+        open_seconds: float = OPEN_SECONDS,
+        half_open_probes: int = HALF_OPEN_PROBES,
+    ):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        # (timestamp, succeeded) for calls in the window
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._failures = 0
+        self.trips = 0
+        self.rejected = 0
+
+    def _prune(self, now: float) -> None:
+        cutoff = now - self.window_seconds
+        while self._outcomes and self._outcomes[0][0] < cutoff:
+            _, ok = self._outcomes.popleft()
+            if not ok:
+                self._failures -= 1
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self.opened_at = now
+        self.probes_in_flight = 0
+        self.trips += 1
+        print(f"[Circuit Breaker] {self.name} opened ({self._failures}/{len(self._outcomes)} calls failed)")
+
+    def retry_in(self, now: Optional[float] = None) -> float:
+        """Seconds until an open circuit starts probing (0 if not open)"""
+        if self.state != OPEN:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.opened_at + self.open_seconds - now)
+
+    def is_open(self) -> bool:
+        """True while calls would be rejected without probing"""
+        return self.state == OPEN and self.retry_in() > 0
+
+    def check(self) -> None:
+        """Fail fast if open, without taking a half-open probe slot (e.g. before queueing for quota)"""
+        if self.is_open():
+            self.rejected += 1
+            raise CircuitOpenError(self.name, self.retry_in())
+
+    def allow(self) -> None:
+        """
+        Admit one call, or fail fast
+
+        Raises:
+            CircuitOpenError: While open, or half-open with all probe slots taken
+        """
+        now = time.monotonic()
+        if self.state == OPEN:
+            wait = self.retry_in(now)
+            if wait > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, wait)
+            self.state = HALF_OPEN
+            self.probes_in_flight = 0
+            print(f"[Circuit Breaker] {self.name} half-open, probing")
+        if self.state == HALF_OPEN:
+            if self.probes_in_flight >= self.half_open_probes:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, 0.0)
+            self.probes_in_flight += 1
+
+    def release(self) -> None:
+        """Give back an admitted call's probe slot without an outcome (e.g. the call was cancelled)"""
+        if self.state == HALF_OPEN and self.probes_in_flight > 0:
+            self.probes_in_flight -= 1
+
+    def record_success(self) -> None:
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            self.state = CLOSED
+            self.probes_in_flight = 0
+            self._outcomes.clear()
+            self._failures = 0
+            print(f"[Circuit Breaker] {self.name} closed")
+            return
+        self._outcomes.append((now, True))
+        self._prune(now)
+
+    def record_failure(self) -> None:
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            self._open(now)
+            return
+        if self.state == OPEN:
+            return
+        self._outcomes.append((now, False))
+        self._failures += 1
+        self._prune(now)
+        calls = len(self._outcomes)
+        if calls >= self.min_calls and self._failures / calls >= self.failure_rate:
+            self._open(now)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        self._prune(now)
+        calls = len(self._outcomes)
+        return {
+            "state": OPEN if self.state == OPEN and self.retry_in(now) > 0 else
+                     HALF_OPEN if self.state != CLOSED else CLOSED,
+            "calls_in_window": calls,
+            "failure_rate": round(self._failures / calls, 3) if calls else 0.0,
+            "retry_in_seconds": round(self.retry_in(now), 1),
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Get (or lazily create) the process-wide breaker for a service"""
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name)
+    return _breakers[name]
+
+
+def circuit_breaker_states() -> Dict[str, Dict[str, Any]]:
+    """State of every breaker created so far (for /api/health)"""
+    return {name: breaker.stats() for name, breaker in _breakers.items()}
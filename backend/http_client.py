@@ -0,0 +1,84 @@
+"""
+Shared async HTTP clients
+One keep-alive connection pool per upstream service (Azure OpenAI, Supabase),
+reused by every agent so calls never block the FastAPI event loop
+"""
+
+import os
+from typing import Dict, Optional
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (httpx needs it for HTTP/2)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def get_http_client(
+    name: str,
+    timeout: Optional[float] = None,
+    connect_timeout: Optional[float] = None,
+    max_connections: Optional[int] = None,
+) -> httpx.AsyncClient:
+    """
+    Get (or lazily create) the pooled async client for a service
+
+    Settings can be tuned per service with <NAME>_HTTP_TIMEOUT,
+    <NAME>_HTTP_CONNECT_TIMEOUT, <NAME>_HTTP_MAX_CONNECTIONS and
+    <NAME>_HTTP2=false, e.g. AZURE_OPENAI_HTTP_TIMEOUT=180.
+
+    Args:
+        name: Service name, used as the pool key and env var prefix
+        timeout: Default read/write timeout in seconds
+        connect_timeout: Default connect timeout in seconds
+        max_connections: Default size of the connection pool
+
+    Returns:
+        Shared httpx.AsyncClient for the service
+    """
+    client = _clients.get(name)
+    if client is not None and not client.is_closed:
+        return client
+
+    prefix = name.upper()
+    read_timeout = _env_float(f"{prefix}_HTTP_TIMEOUT", timeout or 60.0)
+    pool_size = _env_int(f"{prefix}_HTTP_MAX_CONNECTIONS", max_connections or 20)
+    use_http2 = HTTP2_AVAILABLE and os.getenv(f"{prefix}_HTTP2", "true").lower() != "false"
+
+    client = httpx.AsyncClient(
+        http2=use_http2,
+        timeout=httpx.Timeout(
+            read_timeout,
+            connect=_env_float(f"{prefix}_HTTP_CONNECT_TIMEOUT", connect_timeout or 10.0),
+        ),
+        limits=httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=_env_float(f"{prefix}_HTTP_KEEPALIVE", 120.0),
+        ),
+    )
+    _clients[name] = client
+    print(f"[HTTP] Created {name} pool (http2={use_http2}, max_connections={pool_size}, timeout={read_timeout}s)")
+    return client
+
+
+async def close_http_clients():
+    """Close every pooled client (call on application shutdown)"""
+    for client in _clients.values():
+        await client.aclose()
+    _clients.clear()
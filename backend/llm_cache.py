@@ -0,0 +1,260 @@
+"""
+LLM Response Cache
+Content-addressed cache for model responses, shared by every agent in the process
+
+A response is stored under the SHA-256 of (deployment, system prompt, task,
+input-data fingerprint), so an unchanged prompt over unchanged data is served
+without a model call. Two tiers: an in-memory LRU in front of a SQLite file
+that survives restarts. Both tiers expire entries after a TTL and evict the
+least recently used entries once over their size budget.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+
+# Defaults, overridable with LLM_CACHE_* environment variables
+DEFAULT_TTL_SECONDS = 24 * 3600
+DEFAULT_MEMORY_MB = 32
+DEFAULT_DISK_MB = 256
+DEFAULT_PATH = Path(__file__).parent / ".cache" / "llm_responses.sqlite3"
+
+# Expired disk rows are purged on every Nth write
+PURGE_EVERY_WRITES = 100
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def fingerprint(data: Any) -> str:
+    """Stable hash of JSON-serialisable input data (key order does not matter)"""
+    encoded = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def cache_key(deployment: str, system_prompt: str, task: str, data_fingerprint: Optional[str] = None) -> str:
+    """Content address of one model call"""
+    return fingerprint([deployment, system_prompt, task, data_fingerprint])
+
+
+class LLMResponseCache:
+    """In-memory LRU tier over a SQLite tier, with TTL, size limits and hit/miss counters"""
+
+    def __init__(
+        self,
+        path: Optional[Path] = DEFAULT_PATH,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        memory_bytes: int = DEFAULT_MEMORY_MB * 1024 * 1024,
+        disk_bytes: int = DEFAULT_DISK_MB * 1024 * 1024,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+
+        # key -> (stored_at, value); ordered oldest-used first
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._memory_size = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._disk_size = 0
+        self._writes = 0
+        if path is not None:
+            self._open(Path(path))
+
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+    def _open(self, path: Path) -> None:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                " stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed_at ON responses(accessed_at)")
+            db.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - self.ttl_seconds,))
+            self._disk_size = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            self._db = db
+        except sqlite3.Error as e:
+            print(f"[LLM Cache] Disk tier disabled ({path}): {e}")
+            self._db = None
+
+    # ------------------------------------------------------------------
+    # Memory tier
+    # ------------------------------------------------------------------
+
+    def _memory_get(self, key: str, now: float) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if now - stored_at > self.ttl_seconds:
+            self._memory_drop(key)
+            self.counters["expired"] += 1
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_put(self, key: str, value: str, stored_at: float) -> None:
+        if key in self._memory:
+            self._memory_drop(key)
+        size = len(value)
+        if size > self.memory_bytes:
+            return
+        self._memory[key] = (stored_at, value)
+        self._memory_size += size
+        while self._memory_size > self.memory_bytes:
+            self._memory_drop(next(iter(self._memory)))
+            self.counters["evictions"] += 1
+
+    def _memory_drop(self, key: str) -> None:
+        _, value = self._memory.pop(key)
+        self._memory_size -= len(value)
+
+    # ------------------------------------------------------------------
+    # Disk tier (called from a worker thread)
+    # ------------------------------------------------------------------
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[float, str]]:
+        with self._db_lock:
+            row = self._db.execute("SELECT stored_at, value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[0] > self.ttl_seconds:
+                self._disk_delete(key)
+                self.counters["expired"] += 1
+                return None
+            self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            return row[0], row[1]
+
+    def _disk_put(self, key: str, value: str, now: float) -> None:
+        size = len(value)
+        if size > self.disk_bytes:
+            return
+        with self._db_lock:
+            self._disk_delete(key)
+            self._db.execute(
+                "INSERT INTO responses (key, value, size, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._disk_size += size
+
+            self._writes += 1
+            if self._writes % PURGE_EVERY_WRITES == 0:
+                self._disk_purge_expired(now)
+
+            while self._disk_size > self.disk_bytes:
+                oldest = self._db.execute(
+                    "SELECT key FROM responses ORDER BY accessed_at LIMIT 1"
+                ).fetchone()
+                if oldest is None:
+                    break
+                self._disk_delete(oldest[0])
+                self.counters["evictions"] += 1
+
+    def _disk_delete(self, key: str) -> None:
+        row = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._disk_size -= row[0]
+
+    def _disk_purge_expired(self, now: float) -> None:
+        cutoff = now - self.ttl_seconds
+        freed, count = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM responses WHERE stored_at < ?", (cutoff,)
+        ).fetchone()
+        if count:
+            self._db.execute("DELETE FROM responses WHERE stored_at < ?", (cutoff,))
+            self._disk_size -= freed
+            self.counters["expired"] += count
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    async def get(self, key: str) -> Optional[str]:
+        """Cached response for a key (memory first, then disk), or None"""
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is not None:
+            self.counters["memory_hits"] += 1
+            return value
+
+        if self._db is not None:
+            try:
+                entry = await asyncio.to_thread(self._disk_get, key, now)
+            except sqlite3.Error as e:
+                print(f"[LLM Cache] Disk read failed: {e}")
+                entry = None
+            if entry is not None:
+                stored_at, value = entry
+                self._memory_put(key, value, stored_at)
+                self.counters["disk_hits"] += 1
+                return value
+
+        self.counters["misses"] += 1
+        return None
+
+    async def put(self, key: str, value: str) -> None:
+        """Store a response in both tiers"""
+        now = time.time()
+        self._memory_put(key, value, now)
+        self.counters["stores"] += 1
+        if self._db is not None:
+            try:
+                await asyncio.to_thread(self._disk_put, key, value, now)
+            except sqlite3.Error as e:
+                print(f"[LLM Cache] Disk write failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and tier sizes"""
+        lookups = self.counters["memory_hits"] + self.counters["disk_hits"] + self.counters["misses"]
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        return {
+            **self.counters,
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_size,
+            "disk_enabled": self._db is not None,
+            "disk_bytes": self._disk_size if self._db is not None else 0,
+        }
+
+
+_cache: Optional[LLMResponseCache] = None
+
+
+def llm_cache_enabled() -> bool:
+    return os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """
+    Get the process-wide response cache
+
+    Configured by LLM_CACHE_TTL_SECONDS, LLM_CACHE_MEMORY_MB, LLM_CACHE_DISK_MB
+    and LLM_CACHE_PATH (set LLM_CACHE_PATH=none for a memory-only cache).
+    """
+    global _cache
+    if _cache is None:
+        path = os.getenv("LLM_CACHE_PATH")
+        _cache = LLMResponseCache(
+            path=None if path and path.lower() == "none" else Path(path) if path else DEFAULT_PATH,
+            ttl_seconds=_env_float("LLM_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS),
+            memory_bytes=int(_env_float("LLM_CACHE_MEMORY_MB", DEFAULT_MEMORY_MB) * 1024 * 1024),
+            disk_bytes=int(_env_float("LLM_CACHE_DISK_MB", DEFAULT_DISK_MB) * 1024 * 1024),
+        )
+    return _cache
@@ -0,0 +1,200 @@
+"""
+Retry Policy for Model Calls
+Jittered exponential backoff that honours the API's own wait hints
+
+A throttled or failed call is retried after the wait the API asked for
+(Retry-After, or the x-ratelimit-reset-* of an exhausted quota), otherwise
+after a full-jitter exponential backoff. Each call has a deadline covering
+all of its attempts, and every call in one analysis run draws its waiting
+time from a shared budget, so a degraded API can't stretch a run without
+bound.
+"""
+
+import asyncio
+import contextvars
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+# Attempts per call (first try included), backoff base and cap in seconds
+MAX_ATTEMPTS = int(_env_float("LLM_RETRY_MAX_ATTEMPTS", 5))
+BASE_DELAY_SECONDS = _env_float("LLM_RETRY_BASE_DELAY", 1.0)
+MAX_DELAY_SECONDS = _env_float("LLM_RETRY_MAX_DELAY", 30.0)
+
+# Wall-clock limit for one call including its retries, and total retry waiting per analysis run
+CALL_DEADLINE_SECONDS = _env_float("LLM_CALL_DEADLINE_SECONDS", 180.0)
+RUN_BUDGET_SECONDS = _env_float("LLM_RUN_RETRY_BUDGET_SECONDS", 300.0)
+
+# Statuses that mean "can't serve right now" rather than "bad request"
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class ModelAPIError(Exception):
+    """Raised by a model client when the API call fails"""
+
+    def __init__(self, status_code: Optional[int], message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(f"Model API error {status_code}: {message}" if status_code else f"Model API error: {message}")
+        self.status_code = status_code
+        self.message = message
+        self.headers = {k.lower(): v for k, v in (headers or {}).items()}
+
+    @property
+    def retryable(self) -> bool:
+        """Throttling, server errors and connection failures (no status) are worth retrying (here or elsewhere)"""
+        return self.status_code is None or self.status_code in RETRYABLE_STATUSES
+
+
+def retry_after_seconds(headers: Dict[str, str]) -> Optional[float]:
+    """Wait the API asked for, from retry-after-ms / retry-after (seconds), if any"""
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value:
+            try:
+                return max(0.0, float(value) * scale)
+            except ValueError:
+                continue
+    return None
+
+
+# "6m0s", "1.5s", "20ms" as sent in x-ratelimit-reset-*
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_SCALE = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+def parse_duration(value: str) -> Optional[float]:
+    """Seconds in an x-ratelimit-reset value ("6m0s", "20ms", or a bare number of seconds)"""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_SCALE[unit] for amount, unit in parts)
+
+
+def server_wait_hint(headers: Dict[str, str]) -> Optional[float]:
+    """
+    Seconds the API asked us to wait, if it said
+
+    Retry-After wins; otherwise the reset time of whichever rate-limit
+    dimension (requests or tokens) reports nothing remaining.
+    """
+    wait = retry_after_seconds(headers)
+    if wait is not None:
+        return wait
+    hints = []
+    for dimension in ("requests", "tokens"):
+        remaining = headers.get(f"x-ratelimit-remaining-{dimension}")
+        reset = headers.get(f"x-ratelimit-reset-{dimension}")
+        if reset and remaining is not None and remaining.strip() in ("0", "0.0"):
+            seconds = parse_duration(reset)
+            if seconds is not None:
+                hints.append(seconds)
+    return max(hints) if hints else None
+
+
+class RetryBudget:
+    """Seconds of retry waiting left for one analysis run, shared by all of its calls"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.spent = 0.0
+        self.retries = 0
+
+    def remaining(self) -> float:
+        return max(0.0, self.seconds - self.spent)
+
+    def take(self, wait: float) -> bool:
+        """Reserve `wait` seconds; False if the budget can't cover it"""
+        if wait > self.remaining():
+            return False
+        self.spent += wait
+        self.retries += 1
+        return True
+
+
+_run_budget: contextvars.ContextVar[Optional[RetryBudget]] = contextvars.ContextVar("llm_retry_budget", default=None)
+
+
+@contextmanager
+def retry_budget(seconds: float = RUN_BUDGET_SECONDS) -> Iterator[RetryBudget]:
+    """
+    Share one retry budget among every model call made inside the block
+
+    Tasks created inside the block inherit the budget (asyncio copies the
+    context), so wrapping an analysis run covers all of its agents.
+    """
+    budget = RetryBudget(seconds)
+    token = _run_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _run_budget.reset(token)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given retry (1 = first retry)"""
+    return random.uniform(0, min(MAX_DELAY_SECONDS, BASE_DELAY_SECONDS * 2 ** (attempt - 1)))
+
+
+async def call_with_retry(
+    call: Callable[[], Awaitable[Any]],
+    label: str,
+    max_attempts: int = MAX_ATTEMPTS,
+    deadline_seconds: float = CALL_DEADLINE_SECONDS,
+) -> Any:
+    """
+    Run a model call, retrying throttling, server errors, connection failures and timeouts
+
+    Args:
+        call: Zero-argument coroutine factory making one attempt
+        label: Name used in log lines (deployment or router)
+        max_attempts: Attempts including the first
+        deadline_seconds: Limit for all attempts and waits together
+
+    Returns:
+        The call's result
+
+    Raises:
+        ModelAPIError: Non-retryable errors immediately; otherwise the last
+            error once attempts, the deadline or the run budget run out
+    """
+    deadline = time.monotonic() + deadline_seconds
+    budget = _run_budget.get()
+    attempt = 0
+
+    while True:
+        attempt += 1
+        remaining = deadline - time.monotonic()
+        try:
+            return await asyncio.wait_for(call(), timeout=max(remaining, 0.001))
+        except asyncio.TimeoutError:
+            error = ModelAPIError(None, f"{label}: no response within the {deadline_seconds:g}s call deadline")
+        except ModelAPIError as e:
+            error = e
+        if not error.retryable or attempt >= max_attempts:
+            raise error
+
+        hint = server_wait_hint(error.headers)
+        # Server hint plus a little jitter so throttled callers don't return in lockstep
+        wait = hint + random.uniform(0, BASE_DELAY_SECONDS) if hint is not None else backoff_delay(attempt)
+        if time.monotonic() + wait >= deadline:
+            raise ModelAPIError(error.status_code, f"{error.message} (retry wait {wait:.1f}s exceeds the call deadline)",
+                                error.headers)
+        if budget is not None and not budget.take(wait):
+            raise ModelAPIError(error.status_code, f"{error.message} (run retry budget exhausted)", error.headers)
+
+        print(f"[LLM Retry] {label}: {error.status_code or 'no response'}, "
+              f"retry {attempt}/{max_attempts - 1} in {wait:.1f}s")
+        await asyncio.sleep(wait)
@@ -0,0 +1,156 @@
+"""
+LLM Deployment Router
+Spreads model calls over several Azure OpenAI deployments, each with its own quota
+
+Every create() goes to the least-loaded healthy deployment: fewest calls in
+flight relative to its requests-per-minute quota, then lowest recent latency.
+A deployment answering 429 or 5xx (or unreachable) is benched until its
+Retry-After / rate-limit reset / cool-down has passed and the call fails over to the next one,
+so adding a deployment adds its quota to the pool without touching any agent.
+"""
+
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from circuit_breaker import CircuitOpenError
+from llm_retry import ModelAPIError, call_with_retry, server_wait_hint
+
+
+# Seconds a deployment is benched after a 5xx / connection error, or a 429 without a wait hint
+DEFAULT_COOLDOWN_SECONDS = 30.0
+
+# Smoothing for the per-deployment latency average
+LATENCY_ALPHA = 0.2
+
+
+class DeploymentState:
+    """One routed deployment: its client plus load and health bookkeeping"""
+
+    def __init__(self, client: Any, requests_per_minute: int):
+        self.client = client
+        self.name: str = getattr(client, "name", client.deployment)
+        self.requests_per_minute = max(1, requests_per_minute)
+        self.in_flight = 0
+        self.latency: Optional[float] = None
+        self.benched_until = 0.0
+        self.calls = 0
+        self.failures = 0
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.benched_until
+
+    def load(self) -> tuple:
+        """Sort key: in-flight share of quota, then recent latency (unknown latency goes first)"""
+        return (self.in_flight / self.requests_per_minute, self.latency or 0.0)
+
+    def record_latency(self, seconds: float) -> None:
+        self.latency = seconds if self.latency is None else (1 - LATENCY_ALPHA) * self.latency + LATENCY_ALPHA * seconds
+
+    def bench(self, error: ModelAPIError) -> float:
+        wait = server_wait_hint(error.headers)
+        wait = DEFAULT_COOLDOWN_SECONDS if wait is None else wait
+        self.benched_until = max(self.benched_until, time.monotonic() + wait)
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "deployment": self.name,
+            "in_flight": self.in_flight,
+            "latency_seconds": round(self.latency, 3) if self.latency is not None else None,
+            "healthy": self.healthy(time.monotonic()),
+            "calls": self.calls,
+            "failures": self.failures,
+        }
+
+
+class LLMRouter:
+    """
+    Model client that dispatches each call to one of several deployments
+
+    Has the same create() contract as AzureOpenAIClient (returns None when
+    the call can't be served), so it drops in wherever that client is used.
+    Each client must expose complete(messages, **kwargs), raising
+    ModelAPIError on failure (and complete_stream(messages, on_text, **kwargs)
+    for create_stream()).
+    """
+
+    def __init__(self, deployments: List[DeploymentState]):
+        if not deployments:
+            raise ValueError("LLMRouter needs at least one deployment")
+        self.deployments = deployments
+        # Stable identity for the response cache, whichever deployment answers
+        self.deployment = "+".join(sorted(d.name for d in deployments))
+        self.model_info = deployments[0].client.model_info
+
+    def _candidates(self) -> List[DeploymentState]:
+        """Healthy deployments by load; if none is healthy, the one that recovers first"""
+        now = time.monotonic()
+        healthy = sorted((d for d in self.deployments if d.healthy(now)), key=DeploymentState.load)
+        if healthy:
+            return healthy
+        return sorted(self.deployments, key=lambda d: d.benched_until)[:1]
+
+    async def complete(self, messages, **kwargs):
+        """
+        Run one completion, failing over between deployments on throttling or server errors
+
+        Raises:
+            ModelAPIError: The last error if no deployment could serve the call
+            CircuitOpenError: If every deployment's circuit is open
+        """
+        return await self._dispatch(lambda client: client.complete(messages, **kwargs))
+
+    async def complete_stream(self, messages, on_text: Callable[[str], None], **kwargs):
+        """Streamed completion with the same failover as complete() (until content has started arriving)"""
+        return await self._dispatch(lambda client: client.complete_stream(messages, on_text, **kwargs))
+
+    async def _dispatch(self, call: Callable[[Any], Awaitable[Any]]):
+        tried = set()
+        last_error: Optional[Exception] = None
+
+        while True:
+            candidates = [d for d in self._candidates() if d.name not in tried]
+            if not candidates:
+                raise last_error or ModelAPIError(None, "no deployment available")
+            deployment = candidates[0]
+            tried.add(deployment.name)
+
+            deployment.in_flight += 1
+            deployment.calls += 1
+            started = time.monotonic()
+            try:
+                result = await call(deployment.client)
+                deployment.record_latency(time.monotonic() - started)
+                return result
+            except CircuitOpenError as e:
+                deployment.benched_until = max(deployment.benched_until, time.monotonic() + e.retry_in)
+                last_error = e
+            except ModelAPIError as e:
+                deployment.failures += 1
+                if not e.retryable:
+                    raise
+                wait = deployment.bench(e)
+                print(f"[LLM Router] {deployment.name} returned {e.status_code or 'no response'}, "
+                      f"benched {wait:.0f}s; failing over")
+                last_error = e
+            finally:
+                deployment.in_flight -= 1
+
+    async def create(self, messages, **kwargs):
+        """Create chat completion on the least-loaded healthy deployment, retrying when all are busy (None on failure)"""
+        try:
+            return await call_with_retry(lambda: self.complete(messages, **kwargs), "router")
+        except Exception as e:
+            print(f"[LLM Router] Error: {str(e)}")
+            return None
+
+    async def create_stream(self, messages, on_text: Callable[[str], None], **kwargs):
+        """Streamed create(): on_text gets each piece of content as it arrives (None on failure)"""
+        try:
+            return await call_with_retry(lambda: self.complete_stream(messages, on_text, **kwargs), "router")
+        except Exception as e:
+            print(f"[LLM Router] Streaming error: {str(e)}")
+            return None
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [d.stats() for d in self.deployments]
@@ -0,0 +1,135 @@
+"""
+Rate Limiter for Azure OpenAI deployments
+Token buckets for requests-per-minute and tokens-per-minute, one pair per
+deployment, shared by every agent in the process
+"""
+
+import asyncio
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+
+# Defaults used when no RPM/TPM is configured for a deployment
+DEFAULT_REQUESTS_PER_MINUTE = 30
+DEFAULT_TOKENS_PER_MINUTE = 60000
+
+# Rough chars-per-token ratio for estimating prompt size before the call
+CHARS_PER_TOKEN = 4
+
+
+class TokenBucket:
+    """Classic token bucket: holds up to `capacity` tokens, refilled continuously"""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if available now)"""
+        self._refill()
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+    def refund(self, amount: float):
+        """Give back (or, with a negative amount, take) tokens after the fact"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class DeploymentRateLimiter:
+    """Requests-per-minute and tokens-per-minute limits for one deployment"""
+
+    def __init__(self, deployment: str, requests_per_minute: int, tokens_per_minute: int):
+        self.deployment = deployment
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.request_bucket = TokenBucket(requests_per_minute, requests_per_minute / 60.0)
+        self.token_bucket = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self, tokens: int) -> int:
+        """
+        Wait until one request and `tokens` tokens fit in the quota, then take them
+
+        Callers are served in arrival order, so one large request cannot be
+        starved by a stream of small ones.
+
+        Args:
+            tokens: Estimated tokens for the call (prompt + max completion)
+
+        Returns:
+            Number of tokens actually reserved (capped at the bucket size)
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        # A single call larger than the whole minute budget would never fit
+        tokens = min(tokens, self.tokens_per_minute)
+
+        async with self._lock:
+            while True:
+                wait = max(self.request_bucket.wait_time(1), self.token_bucket.wait_time(tokens))
+                if wait <= 0:
+                    break
+                print(f"[Rate Limiter] {self.deployment}: waiting {wait:.1f}s for quota")
+                await asyncio.sleep(wait)
+
+            self.request_bucket.consume(1)
+            self.token_bucket.consume(tokens)
+
+        return tokens
+
+    def record_usage(self, reserved_tokens: int, actual_tokens: Optional[int]):
+        """Correct the token bucket once the response reports real usage"""
+        if actual_tokens is None:
+            return
+        self.token_bucket.refund(reserved_tokens - actual_tokens)
+
+
+_limiters: Dict[str, DeploymentRateLimiter] = {}
+
+
+def env_suffix(deployment: str) -> str:
+    return re.sub(r"[^A-Z0-9]", "_", deployment.upper())
+
+
+def _limit_from_env(name: str, deployment: str, default: int) -> int:
+    value = os.getenv(f"{name}_{env_suffix(deployment)}") or os.getenv(name)
+    return int(value) if value else default
+
+
+def get_rate_limiter(deployment: str) -> DeploymentRateLimiter:
+    """
+    Get the process-wide rate limiter for a deployment
+
+    Limits come from AZURE_OPENAI_RPM_<DEPLOYMENT> / AZURE_OPENAI_TPM_<DEPLOYMENT>
+    (deployment name upper-cased, non-alphanumerics replaced with '_'),
+    falling back to AZURE_OPENAI_RPM / AZURE_OPENAI_TPM and then the defaults.
+    """
+    if deployment not in _limiters:
+        _limiters[deployment] = DeploymentRateLimiter(
+            deployment,
+            requests_per_minute=_limit_from_env("AZURE_OPENAI_RPM", deployment, DEFAULT_REQUESTS_PER_MINUTE),
+            tokens_per_minute=_limit_from_env("AZURE_OPENAI_TPM", deployment, DEFAULT_TOKENS_PER_MINUTE),
+        )
+    return _limiters[deployment]
+
+
+def estimate_tokens(messages: List[Dict[str, Any]], max_tokens: int) -> int:
+    """Estimate quota cost of a call the same way Azure does: prompt size + max_tokens"""
+    prompt_chars = sum(len(str(msg.get("content", ""))) for msg in messages)
+    return prompt_chars // CHARS_PER_TOKEN + max_tokens
@@ -0,0 +1,159 @@
+"""
+Incremental JSON array streaming
+Pulls completed array elements out of a JSON document while it is still arriving
+
+The model writes its JSON output token by token. JSONArrayStream scans each
+chunk as it comes in and, for every watched array (e.g. goals_plan.goals),
+returns each element as soon as its closing bracket arrives - together with
+the scalar fields already seen in the enclosing objects, so the element can
+be turned into rows the same way as the full document. Text before the
+first '{' / '[' (such as a ```json fence) and after the document is ignored.
+"""
+
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+Path = Tuple[str, ...]
+
+WHITESPACE = " \t\r\n"
+STRUCTURAL = "{}[],:\""
+
+# Marker for a token that isn't valid JSON (dropped rather than emitted)
+_INVALID = object()
+
+
+class _Frame:
+    """One open object or array"""
+
+    __slots__ = ("kind", "path", "start", "expect_key", "key", "scalars")
+
+    def __init__(self, kind: str, path: Path, start: int):
+        self.kind = kind              # "object" or "array"
+        self.path = path              # keys from the root to this container
+        self.start = start            # offset of its opening bracket
+        self.expect_key = kind == "object"
+        self.key: Optional[str] = None
+        self.scalars: Dict[str, Any] = {}
+
+
+class JSONArrayStream:
+    """
+    Incremental scanner emitting the elements of watched arrays
+
+    Args:
+        paths: Key paths of the arrays to watch, e.g. [("goals_plan", "goals")];
+            () watches a top-level array
+    """
+
+    def __init__(self, paths: Iterable[Path]):
+        self.paths = {tuple(p) for p in paths}
+        self.buffer = ""
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._done = False
+        self._in_string = False
+        self._escape = False
+        self._token_start: Optional[int] = None   # start of the current string / bare scalar
+        self._is_bare = False
+
+    def feed(self, chunk: str) -> List[Tuple[Path, Any]]:
+        """
+        Scan another chunk of the document
+
+        Returns:
+            (path, document) per element completed in this chunk, where
+            document is the minimal JSON value holding just that element and
+            the scalar fields seen so far along its path
+        """
+        self.buffer += chunk
+        events: List[Tuple[Path, Any]] = []
+        text = self.buffer
+        i = self._pos
+        while i < len(text) and not self._done:
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._complete(self._token_start, i + 1, events)
+                i += 1
+                continue
+
+            if self._is_bare:
+                if c not in WHITESPACE and c not in STRUCTURAL:
+                    i += 1
+                    continue
+                # Scalar ended at the previous character; the current one is handled below
+                self._is_bare = False
+                self._complete(self._token_start, i, events)
+
+            if not self._stack:
+                # Before the document (e.g. a code fence) only an opening bracket matters
+                if c in "{[":
+                    self._stack.append(_Frame("object" if c == "{" else "array", (), i))
+                i += 1
+                continue
+
+            frame = self._stack[-1]
+            if c == '"':
+                self._in_string = True
+                self._token_start = i
+            elif c in "{[":
+                key = frame.key if frame.kind == "object" else "*"
+                self._stack.append(_Frame("object" if c == "{" else "array", frame.path + (key,), i))
+            elif c in "}]":
+                closed = self._stack.pop()
+                if not self._stack:
+                    self._done = True
+                else:
+                    self._complete(closed.start, i + 1, events, container=True)
+            elif c == ":":
+                frame.expect_key = False
+            elif c == ",":
+                if frame.kind == "object":
+                    frame.expect_key = True
+                    frame.key = None
+            elif c not in WHITESPACE:
+                self._is_bare = True
+                self._token_start = i
+            i += 1
+
+        self._pos = i
+        return events
+
+    def _complete(self, start: int, end: int, events: List[Tuple[Path, Any]], container: bool = False) -> None:
+        """A string, bare scalar or container spanning buffer[start:end] has finished"""
+        frame = self._stack[-1]
+        if frame.kind == "object":
+            if container:
+                return
+            value = self._load(start, end)
+            if frame.expect_key:
+                frame.key = value if isinstance(value, str) else None
+            elif frame.key is not None and value is not _INVALID:
+                frame.scalars[frame.key] = value
+            return
+
+        if frame.path in self.paths:
+            value = self._load(start, end)
+            if value is not _INVALID:
+                events.append((frame.path, self._document(frame.path, value)))
+
+    def _load(self, start: int, end: int) -> Any:
+        try:
+            return json.loads(self.buffer[start:end])
+        except json.JSONDecodeError:
+            return _INVALID
+
+    def _document(self, path: Path, element: Any) -> Any:
+        """Minimal document for one element: {<key>: {...scalars, <key>: [element]}}"""
+        value: Any = [element]
+        objects = {f.path: f for f in self._stack if f.kind == "object"}
+        for depth in range(len(path) - 1, -1, -1):
+            parent = objects.get(path[:depth])
+            value = {**(parent.scalars if parent else {}), path[depth]: value}
+        return value
+
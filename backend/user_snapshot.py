@@ -0,0 +1,244 @@
+"""
+Per-run User Snapshot
+Reads a user's input rows once per analysis run and serves every agent from memory
+
+The snapshot loads each input table with one parallel, column-projected
+request and keeps the rows in an immutable object. Agents read it through the
+same select() call they would make on the PostgREST client, so a run costs
+O(tables) reads instead of O(agents x tables). Queries the snapshot cannot
+answer (another table, an older date range, extra columns, ordering or
+paging) fall through to the database, as do agent output tables such as
+transaction_anomalies, so dependent agents still see what ran before them.
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from postgrest_client import PostgrestClient, build_filters, get_postgrest_client
+
+
+# Longest transaction history any agent reads (goal/budget engines: 91 days + 1)
+HISTORY_DAYS = 92
+
+# Rows per PostgREST page when loading
+PAGE_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class SnapshotTable:
+    """What was loaded for one table: projected columns and the filters that scoped it"""
+
+    columns: str
+    filters: Mapping[str, str] = field(default_factory=dict)
+
+
+# Input tables, with the union of the columns the agents read from each.
+# {start} in a filter is replaced with the history start date at load time.
+SNAPSHOT_TABLES: Dict[str, SnapshotTable] = {
+    "transactions": SnapshotTable(
+        "user_id,amount,transaction_type,category,source,payment_method,merchant_name,description,"
+        "transaction_date,is_recurring,recurring_frequency",
+        {"transaction_date": "gte.{start}"},
+    ),
+    "users": SnapshotTable("user_id,date_of_birth,state,occupation,user_type"),
+    "user_profiles": SnapshotTable(
+        "user_id,monthly_income_min,monthly_income_max,monthly_expenses_avg,current_emergency_fund,"
+        "debt_obligations,risk_tolerance"
+    ),
+    "bills": SnapshotTable(
+        "id,user_id,bill_name,amount,due_date,frequency,priority,late_fee,grace_period_days,status,last_paid_date",
+        {"status": "in.(pending,overdue,scheduled)"},
+    ),
+    "bank_accounts": SnapshotTable("user_id,current_balance,is_active", {"is_active": "is.true"}),
+    "financial_goals": SnapshotTable("*", {"status": "neq.completed"}),
+}
+
+# Operators the snapshot can evaluate locally
+RANGE_OPERATORS = {
+    "gt": lambda a, b: a > b,
+    "gte": lambda a, b: a >= b,
+    "lt": lambda a, b: a < b,
+    "lte": lambda a, b: a <= b,
+}
+
+
+def history_start(today: Optional[date] = None) -> date:
+    """Earliest transaction date in a snapshot: the financial-year start or HISTORY_DAYS back"""
+    today = today or datetime.now().date()
+    # Indian financial year starts on 1 April
+    fy_start = date(today.year if today.month >= 4 else today.year - 1, 4, 1)
+    return min(fy_start, today - timedelta(days=HISTORY_DAYS))
+
+
+def _text(value: Any) -> str:
+    """Value as PostgREST would spell it in a filter"""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _compare(op: str, value: Any, arg: str) -> bool:
+    if value is None:
+        return False
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            return RANGE_OPERATORS[op](float(value), float(arg))
+        except ValueError:
+            pass
+    return RANGE_OPERATORS[op](_text(value), arg)
+
+
+def _matcher(condition: str):
+    """Row predicate for one PostgREST filter value, or None if it can't be evaluated locally"""
+    op, _, arg = condition.partition(".")
+    if op == "eq":
+        return lambda v: v is not None and _text(v) == arg
+    if op == "neq":
+        return lambda v: v is not None and _text(v) != arg
+    if op in RANGE_OPERATORS:
+        return lambda v: _compare(op, v, arg)
+    if op == "in" and arg.startswith("(") and arg.endswith(")"):
+        allowed = {item.strip().strip('"') for item in arg[1:-1].split(",")}
+        return lambda v: v is not None and _text(v) in allowed
+    if op == "is" and arg in ("true", "false", "null"):
+        return lambda v: _text(v) == arg
+    return None
+
+
+def _covers(loaded: Mapping[str, str], requested: Dict[str, str]) -> bool:
+    """Whether rows loaded with `loaded` filters include every row matching `requested`"""
+    for column, condition in loaded.items():
+        wanted = requested.get(column)
+        if wanted == condition:
+            continue
+        # A range on the same side that starts no earlier than the loaded one is covered
+        op, _, arg = condition.partition(".")
+        wanted_op, _, wanted_arg = (wanted or "").partition(".")
+        if op in ("gt", "gte") and wanted_op in ("gt", "gte", "eq") and wanted_arg >= arg:
+            continue
+        return False
+    return True
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """
+    Immutable view of one user's input rows for a single analysis run
+
+    Exposes the read side of PostgrestClient (select / select_all), so an
+    agent can take `snapshot or get_postgrest_client()` as its source.
+    """
+
+    user_id: str
+    loaded_at: str
+    tables: Mapping[str, Tuple[Dict[str, Any], ...]]
+    specs: Mapping[str, SnapshotTable]
+    client: PostgrestClient = field(repr=False, compare=False)
+
+    def _answer(
+        self,
+        table: str,
+        filters: Optional[Dict[str, Any]],
+        columns: str,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Rows from memory, or None when the query has to go to the database"""
+        spec = self.specs.get(table)
+        if spec is None:
+            return None
+        params = build_filters(filters)
+        if params.get("user_id") != f"eq.{self.user_id}" or not _covers(spec.filters, params):
+            return None
+
+        wanted = None if columns.strip() == "*" else [c.strip() for c in columns.split(",") if c.strip()]
+        if spec.columns != "*" and (wanted is None or not set(wanted) <= set(spec.columns.split(","))):
+            return None
+
+        matchers = []
+        for column, condition in params.items():
+            matcher = _matcher(condition)
+            if matcher is None:
+                return None
+            matchers.append((column, matcher))
+
+        rows = [row for row in self.tables[table] if all(m(row.get(column)) for column, m in matchers)]
+        # Copies, so one agent can't change what the next one reads
+        if wanted is None:
+            return [dict(row) for row in rows]
+        return [{c: row.get(c) for c in wanted} for row in rows]
+
+    async def select(
+        self,
+        table: str,
+        filters: Optional[Dict[str, Any]] = None,
+        columns: str = "*",
+        order: Optional[str] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Same contract as PostgrestClient.select; served from memory when the snapshot covers the query"""
+        if order is None and limit is None and offset is None:
+            rows = self._answer(table, filters, columns)
+            if rows is not None:
+                return rows
+        return await self.client.select(table, filters, columns=columns, order=order, limit=limit, offset=offset)
+
+    async def select_all(
+        self,
+        table: str,
+        filters: Optional[Dict[str, Any]] = None,
+        columns: str = "*",
+        order: Optional[str] = None,
+        page_size: int = PAGE_SIZE,
+    ) -> List[Dict[str, Any]]:
+        """Same contract as PostgrestClient.select_all"""
+        if order is None:
+            rows = self._answer(table, filters, columns)
+            if rows is not None:
+                return rows
+        return await self.client.select_all(table, filters, columns=columns, order=order, page_size=page_size)
+
+    def row_counts(self) -> Dict[str, int]:
+        return {table: len(rows) for table, rows in self.tables.items()}
+
+
+async def load_user_snapshot(
+    user_id: str,
+    client: Optional[PostgrestClient] = None,
+    tables: Optional[Dict[str, SnapshotTable]] = None,
+) -> UserSnapshot:
+    """
+    Read every input table for a user in parallel
+
+    Args:
+        user_id: UUID of the user
+        client: PostgREST client (defaults to the process-wide one)
+        tables: Table specs to load (defaults to SNAPSHOT_TABLES)
+
+    Returns:
+        UserSnapshot holding the rows
+    """
+    client = client or get_postgrest_client()
+    start = history_start().isoformat()
+    specs = {
+        table: SnapshotTable(spec.columns, {k: v.format(start=start) for k, v in spec.filters.items()})
+        for table, spec in (tables or SNAPSHOT_TABLES).items()
+    }
+    results = await asyncio.gather(*(
+        client.select_all(
+            table, {"user_id": user_id, **spec.filters}, columns=spec.columns,
+            order="transaction_date,transaction_id" if table == "transactions" else None, page_size=PAGE_SIZE,
+        )
+        for table, spec in specs.items()
+    ))
+    return UserSnapshot(
+        user_id=user_id,
+        loaded_at=datetime.now().isoformat(),
+        tables=MappingProxyType({table: tuple(rows) for table, rows in zip(specs, results)}),
+        specs=MappingProxyType(specs),
+        client=client,
+    )
@@ -173,6 +173,7 @@ export interface FinancialGoal {
   explanation?: Record<string, any>;
   milestones?: any[];
   action_steps?: string[];
+  projection?: Record<string, any>;
   created_at: string;
 }
 
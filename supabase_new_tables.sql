@@ -122,10 +122,15 @@ CREATE TABLE IF NOT EXISTS financial_goals (
   action_steps JSONB DEFAULT '[]',
   potential_obstacles JSONB DEFAULT '[]',
   contingency_plan TEXT,
+  projection JSONB DEFAULT '{}',
   created_at TIMESTAMPTZ DEFAULT NOW(),
   updated_at TIMESTAMPTZ DEFAULT NOW()
 );
 
+-- Simulator output (contribution, completion dates, probabilities); target_date
+-- and monthly_target stay the user's own inputs
+ALTER TABLE financial_goals ADD COLUMN IF NOT EXISTS projection JSONB DEFAULT '{}';
+
 -- Index for faster queries
 CREATE INDEX IF NOT EXISTS idx_financial_goals_user_id ON financial_goals(user_id);
 CREATE INDEX IF NOT EXISTS idx_financial_goals_status ON financial_goals(status);
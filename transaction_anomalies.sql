@@ -0,0 +1,76 @@
+-- ============================================================================
+-- TRANSACTION ANOMALY TABLES
+-- Run this in Supabase SQL Editor before running the anomaly detector
+--
+-- transaction_anomaly_state holds the running statistics kept by
+-- backend/agents/anomaly_engine.py, one row per (user, transaction type,
+-- category; '*' = all categories). transaction_anomalies holds the flagged
+-- transactions, summarised into risk_assessments.transaction_anomalies.
+-- ============================================================================
+
+-- ============================================================================
+-- 1. TRANSACTION_ANOMALY_STATE
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS transaction_anomaly_state (
+  user_id UUID REFERENCES users(user_id) ON DELETE CASCADE,
+  transaction_type TEXT NOT NULL CHECK (transaction_type IN ('income', 'expense')),
+  category TEXT NOT NULL,
+  n INTEGER NOT NULL DEFAULT 0,
+  mean DOUBLE PRECISION DEFAULT 0,
+  m2 DOUBLE PRECISION DEFAULT 0,
+  ewma DOUBLE PRECISION DEFAULT 0,
+  ewm_var DOUBLE PRECISION DEFAULT 0,
+  median DOUBLE PRECISION DEFAULT 0,
+  mad DOUBLE PRECISION DEFAULT 0,
+  warmup JSONB DEFAULT '[]'::jsonb,
+  last_created_at TIMESTAMPTZ,
+  updated_at TIMESTAMPTZ DEFAULT NOW(),
+  PRIMARY KEY (user_id, transaction_type, category)
+);
+
+-- ============================================================================
+-- 2. TRANSACTION_ANOMALIES
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS transaction_anomalies (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  user_id UUID REFERENCES users(user_id) ON DELETE CASCADE,
+  transaction_id UUID NOT NULL,
+  transaction_date DATE,
+  category TEXT,
+  amount DECIMAL(12,2),
+  expected_amount DECIMAL(12,2),
+  anomaly_type TEXT NOT NULL,
+  anomaly_score DECIMAL(6,2),
+  severity TEXT DEFAULT 'medium' CHECK (severity IN ('medium', 'high')),
+  details JSONB DEFAULT '{}'::jsonb,
+  created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_transaction_anomalies_natural_key ON transaction_anomalies(transaction_id);
+CREATE INDEX IF NOT EXISTS idx_transaction_anomalies_user_date ON transaction_anomalies(user_id, transaction_date);
+
+-- Incremental scoring reads transactions created after the last one scored
+CREATE INDEX IF NOT EXISTS idx_transactions_created_at ON transactions(created_at);
+
+ALTER TABLE transaction_anomaly_state ENABLE ROW LEVEL SECURITY;
+ALTER TABLE transaction_anomalies ENABLE ROW LEVEL SECURITY;
+
+-- Users can only read their own rows. The backend reads and writes these tables
+-- with the service role key (SUPABASE_SERVICE_ROLE_KEY), which bypasses row
+-- level security, so no write policies are granted to anon or signed-in users.
+DROP POLICY IF EXISTS "Users can view own transaction_anomaly_state" ON transaction_anomaly_state;
+DROP POLICY IF EXISTS "Users can insert own transaction_anomaly_state" ON transaction_anomaly_state;
+DROP POLICY IF EXISTS "Users can update own transaction_anomaly_state" ON transaction_anomaly_state;
+DROP POLICY IF EXISTS "Users can delete own transaction_anomaly_state" ON transaction_anomaly_state;
+DROP POLICY IF EXISTS "Users can view own transaction_anomalies" ON transaction_anomalies;
+DROP POLICY IF EXISTS "Users can insert own transaction_anomalies" ON transaction_anomalies;
+DROP POLICY IF EXISTS "Users can update own transaction_anomalies" ON transaction_anomalies;
+DROP POLICY IF EXISTS "Users can delete own transaction_anomalies" ON transaction_anomalies;
+
+CREATE POLICY "Users can view own transaction_anomaly_state" ON transaction_anomaly_state FOR SELECT USING (auth.uid()::text = user_id::text);
+CREATE POLICY "Users can view own transaction_anomalies" ON transaction_anomalies FOR SELECT USING (auth.uid()::text = user_id::text);
+
+-- ============================================================================
+-- SUCCESS MESSAGE
+-- ============================================================================
+SELECT 'Transaction anomaly tables created successfully!' as status;
@@ -0,0 +1,27 @@
+-- ============================================================================
+-- USER SCHEME MATCHING COLUMNS
+-- Run this in Supabase SQL Editor before running the Knowledge Integration Agent
+--
+-- Adds the match details written by backend/agents/scheme_engine.py and the
+-- (user_id, scheme_id) unique key used to upsert matches.
+-- ============================================================================
+
+ALTER TABLE user_schemes ADD COLUMN IF NOT EXISTS eligibility_matched BOOLEAN DEFAULT true;
+ALTER TABLE user_schemes ADD COLUMN IF NOT EXISTS match_confidence NUMERIC(3,2);
+ALTER TABLE user_schemes ADD COLUMN IF NOT EXISTS missing_requirements JSONB DEFAULT '[]'::jsonb;
+ALTER TABLE user_schemes ADD COLUMN IF NOT EXISTS matched_at TIMESTAMP;
+
+-- New matches start as 'eligible'; upserts never overwrite an existing status
+ALTER TABLE user_schemes ALTER COLUMN application_status SET DEFAULT 'eligible';
+
+DELETE FROM user_schemes a USING user_schemes b
+WHERE a.user_id = b.user_id
+  AND a.scheme_id = b.scheme_id
+  AND (a.created_at, a.ctid) < (b.created_at, b.ctid);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_user_schemes_natural_key ON user_schemes(user_id, scheme_id);
+
+-- ============================================================================
+-- SUCCESS MESSAGE
+-- ============================================================================
+SELECT 'User scheme matching columns created successfully!' as status;